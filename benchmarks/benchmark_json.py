@@ -0,0 +1,66 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import tempfile
+import timeit
+
+from malcolm.core import Process, call_with_params, Get
+from malcolm.core.jsonbackend import StdlibJSONBackend, OrjsonBackend
+from malcolm.core.serializable import serialize_hook, json_backend
+from malcolm.modules.demo.blocks import ticker_block
+
+
+# Benchmark of each available JSON backend encoding and decoding the
+# serialized Blocks that Controller._handle_get returns for a Get of the
+# whole Block, as sent to a client that has just connected
+
+
+def get_block_dumps():
+    process = Process("proc")
+    call_with_params(
+        ticker_block, process, mri="TICKER", configDir=tempfile.mkdtemp())
+    process.start()
+    dumps = []
+    try:
+        for mri in process.mri_list:
+            controller = process.get_controller(mri)
+            with controller._lock:
+                responses = controller._handle_get(Get(path=[mri]))
+            for _, response in responses:
+                dumps.append(response.value)
+    finally:
+        process.stop(timeout=1)
+    return dumps
+
+
+def available_backends():
+    backends = [StdlibJSONBackend()]
+    try:
+        import orjson
+    except ImportError:
+        pass
+    else:
+        backends.append(OrjsonBackend(orjson))
+    return backends
+
+
+def main(number=200):
+    dumps = get_block_dumps()
+    print("%d Block dumps, %d encodes and decodes each, using %r by default"
+          % (len(dumps), number, json_backend.name))
+    for backend in available_backends():
+        texts = [backend.encode(d, serialize_hook) for d in dumps]
+        for d, text in zip(dumps, texts):
+            assert list(backend.decode(text)) == list(d)
+        encode = timeit.timeit(
+            lambda: [backend.encode(d, serialize_hook) for d in dumps],
+            number=number)
+        decode = timeit.timeit(
+            lambda: [backend.decode(t) for t in texts], number=number)
+        print("  %-8s encode: %8.1f us  decode: %8.1f us  bytes: %d" % (
+            backend.name, encode / number * 1e6, decode / number * 1e6,
+            sum(len(t) for t in texts)))
+
+
+if __name__ == "__main__":
+    main()
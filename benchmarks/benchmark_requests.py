@@ -0,0 +1,55 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import time
+
+from malcolm.core import Process, Controller, Get, Queue
+
+
+# Benchmark of Get round-trip latency and spawns per request, with requests
+# handled by each Controller's SerialExecutor compared with spawning a new
+# thread for every request
+
+
+def run(serial_requests, number):
+    process = Process("proc")
+    controller = Controller(process, "mri", [])
+    controller.serial_requests = serial_requests
+    process.add_controller("mri", controller)
+    process.start()
+    q = Queue()
+    try:
+        # One at a time for round-trip latency
+        start = time.time()
+        for i in range(number):
+            controller.handle_request(
+                Get(i, ["mri", "health", "value"], q.put))
+            q.get(timeout=1)
+        latency = (time.time() - start) / number
+        # Then a burst to see how many spawns they cost
+        spawn_count = process._spawn_count
+        start = time.time()
+        for i in range(number):
+            controller.handle_request(
+                Get(i, ["mri", "health", "value"], q.put))
+        for i in range(number):
+            q.get(timeout=1)
+        burst = (time.time() - start) / number
+        spawns = process._spawn_count - spawn_count
+    finally:
+        process.stop(timeout=1)
+    return latency, burst, spawns
+
+
+def main(number=500):
+    print("%d Gets, one at a time then in a burst" % number)
+    for serial_requests in (False, True):
+        latency, burst, spawns = run(serial_requests, number)
+        print("  serial_requests=%-5s latency: %6.1f us  burst: %6.1f us "
+              "each  spawns per burst request: %.2f" % (
+                  serial_requests, latency * 1e6, burst * 1e6,
+                  float(spawns) / number))
+
+
+if __name__ == "__main__":
+    main()
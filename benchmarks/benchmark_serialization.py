@@ -0,0 +1,75 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import timeit
+
+from malcolm.compat import OrderedDict
+from malcolm.core import BlockModel, Serializable, serialize_object
+from malcolm.core.serializable import check_camel_case
+from malcolm.modules.builtin.vmetas import StringMeta, NumberMeta, ChoiceMeta
+
+
+# Micro-benchmark of serializing a BlockModel with the per-class to_dict
+# functions made by Serializable.register_subclass(), compared with the
+# generic to_dict that checked camelCase and used try/except on every field
+
+
+def generic_serialize_object(o):
+    try:
+        return generic_to_dict(o)
+    except AttributeError:
+        if isinstance(o, dict):
+            d = OrderedDict()
+            for k, v in o.items():
+                d[k] = generic_serialize_object(v)
+            return d
+        elif isinstance(o, list):
+            return [generic_serialize_object(x) for x in o]
+        else:
+            return o
+
+
+def generic_to_dict(o):
+    if not isinstance(o, Serializable):
+        raise AttributeError("to_dict")
+    d = OrderedDict()
+    d["typeid"] = o.typeid
+    for endpoint in o.endpoints:
+        check_camel_case(endpoint)
+        d[endpoint] = generic_serialize_object(getattr(o, endpoint))
+    return d
+
+
+def make_block(n_attributes):
+    block = BlockModel()
+    for i in range(n_attributes):
+        if i % 3 == 0:
+            meta = StringMeta("String attribute %d" % i)
+            value = "value%d" % i
+        elif i % 3 == 1:
+            meta = NumberMeta("float64", "Number attribute %d" % i)
+            value = i * 1.5
+        else:
+            meta = ChoiceMeta("Choice attribute %d" % i, ["a", "b", "c"])
+            value = "b"
+        block.set_endpoint_data(
+            "attr%d" % i, meta.create_attribute_model(value))
+    return block
+
+
+def main(n_attributes=100, number=200):
+    block = make_block(n_attributes)
+    assert generic_serialize_object(block) == serialize_object(block)
+    generic = timeit.timeit(
+        lambda: generic_serialize_object(block), number=number)
+    compiled = timeit.timeit(
+        lambda: serialize_object(block), number=number)
+    print("BlockModel with %d attributes, %d serializations" % (
+        n_attributes, number))
+    print("  generic:  %.1f us each" % (generic / number * 1e6))
+    print("  compiled: %.1f us each" % (compiled / number * 1e6))
+    print("  speed-up: %.2fx" % (generic / compiled))
+
+
+if __name__ == "__main__":
+    main()
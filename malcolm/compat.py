@@ -42,7 +42,19 @@ def et_to_string(element):
     return xml
 
 
+def maybe_import_asyncio():
+    if os.environ.get("PYMALCOLM_USE_ASYNCIO", "NO")[0].upper() == "Y":
+        try:
+            import asyncio
+        except ImportError:
+            asyncio = None
+        return asyncio
+
+
 def maybe_import_cothread():
+    if maybe_import_asyncio():
+        # The asyncio event loop takes the place of cothread
+        return None
     if os.environ.get("PYMALCOLM_USE_COTHREAD", "YES")[0].upper() == "Y":
         try:
             import cothread
@@ -52,6 +64,9 @@ def maybe_import_cothread():
 
 
 def get_pool_num_threads():
+    # The total for all the spawn lanes. Not fewer with asyncio, as Queue.get
+    # and hooks still block real threads, but Process gives most of them to
+    # the hook lane
     if maybe_import_cothread():
         num_threads = 8
     else:
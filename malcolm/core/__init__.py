@@ -9,6 +9,7 @@ from .context import Context
 from .controller import Controller, ABORT_TIMEOUT
 from .errors import AbortedError, BadValueError, TimeoutError, ResponseError, \
     UnexpectedError, YamlError
+from .eventloop import EventLoop, get_event_loop
 from .future import Future
 from .hook import Hook
 from .importer import Importer
@@ -25,14 +26,22 @@ from .ntscalar import NTScalar
 from .ntscalararray import NTScalarArray
 from .nttable import NTTable
 from .ntunion import NTUnion
+from .outboundqueue import OutboundQueue
 from .part import Part
+from .patternsubscription import PatternSubscription, is_pattern
+from .predicate import GreaterOrEqual, OneOf
 from .process import Process
 from .queue import Queue
-from .request import Request, Subscribe, Unsubscribe, Get, Put, Post
-from .response import Response, Delta, Update, Return, Error
+from .request import Request, Subscribe, Unsubscribe, Get, Put, PutMany, \
+    Post
+from .response import Response, Delta, Update, Return, Error, \
+    EncodedPayload
 from .serializable import Serializable, deserialize_object, serialize_object, \
-    json_decode, json_encode, snake_to_camel, camel_to_title
+    json_decode, json_encode, snake_to_camel, camel_to_title, \
+    check_camel_case, binary_encode, binary_decode
 from .spawned import Spawned
+from .spawnlane import SpawnLane, CONTROL_LANE, HOOK_LANE, BACKGROUND_LANE, \
+    LOOP_LANE
 from .stringarray import StringArray
 from .table import Table
 from .timestamp import TimeStamp
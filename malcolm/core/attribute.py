@@ -1,4 +1,6 @@
-from .view import View
+from .attributemodel import AttributeModel
+from .model import Model
+from .view import View, add_subscribe_methods
 
 
 class Attribute(View):
@@ -13,7 +15,14 @@ class Attribute(View):
 
     @property
     def value(self):
-        return self._controller.make_view(self._context, self._data, "value")
+        value = self._data.value
+        if isinstance(value, (Model, dict, list)):
+            # Needs a View of its own, so let the controller make it
+            return self._controller.make_view(
+                self._context, self._data, "value")
+        else:
+            # A plain value doesn't need a View or the lock to read
+            return value
 
     def put_value(self, value, timeout=None):
         """Put a value to the Attribute and wait for completion"""
@@ -34,3 +43,6 @@ class Attribute(View):
 
     def __repr__(self):
         return "<%s value=%r>" % (self.__class__.__name__, self.value)
+
+
+add_subscribe_methods(Attribute, AttributeModel.endpoints)
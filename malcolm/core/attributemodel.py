@@ -58,13 +58,33 @@ class AttributeModel(Model):
         """Set value with pre-validated alarm and timeStamp"""
         with self.notifier.changes_squashed:
             # Assume they are of the right format
+            if self.notifier.table_deltas_wanted:
+                rows = self.changed_rows(getattr(self, "value", None), value)
+            else:
+                # No-one would be sent them, so don't compare the tables
+                rows = None
             self.value = value
-            self.notifier.add_squashed_change(self.path + ["value"], value)
+            self.notifier.add_squashed_change(
+                self.path + ["value"], value, rows)
             self.alarm = alarm
             self.notifier.add_squashed_change(self.path + ["alarm"], alarm)
             self.timeStamp = ts
             self.notifier.add_squashed_change(self.path + ["timeStamp"], ts)
 
+    def changed_rows(self, old_value, new_value):
+        """Work out which rows of a table value changed, so subscribers that
+        understand it can be sent just those
+
+        Args:
+            old_value (object): The current value
+            new_value (object): The value about to be set
+
+        Returns:
+            tuple: (start, stop, n, names) as returned by find_changed_rows(),
+                or None to notify the whole value
+        """
+        return None
+
     def set_alarm(self, alarm=None):
             """Set the Alarm"""
             if alarm is None:
@@ -1,5 +1,6 @@
+from malcolm.compat import OrderedDict
 from .methodmodel import MethodModel
-from .view import View, make_get_property
+from .view import View, get_view_class
 
 
 class Block(View):
@@ -8,22 +9,23 @@ class Block(View):
     def mri(self):
         return self._data.path[0]
 
-    def _prepare_endpoints(self, data):
+    @classmethod
+    def view_signature(cls, data):
+        # The _async methods depend on which endpoints are methods too
+        return tuple(
+            (endpoint, isinstance(data[endpoint], MethodModel))
+            for endpoint in data)
+
+    @classmethod
+    def add_endpoint_members(cls, subclass, data):
+        super(Block, cls).add_endpoint_members(subclass, data)
         for endpoint in data:
             if isinstance(data[endpoint], MethodModel):
                 # Add _async versions of method
-                self._make_async_method(endpoint)
-        return super(Block, self)._prepare_endpoints(data)
-
-    def _make_async_method(self, endpoint):
-        def post_async(*args, **kwargs):
-            child = getattr(self, endpoint)
-            return child.post_async(*args, **kwargs)
-
-        object.__setattr__(self, "%s_async" % endpoint, post_async)
+                setattr(subclass, "%s_async" % endpoint,
+                        make_async_method(endpoint))
 
     def put_attribute_values_async(self, params):
-        futures = []
         if type(params) is dict:
             # If we have a plain dictionary, then sort items
             items = sorted(params.items())
@@ -33,10 +35,22 @@ class Block(View):
         for attr, value in items:
             assert hasattr(self, attr), \
                 "Block does not have attribute %s" % attr
-            future = self._context.put_async(
-                self._data.path + [attr, "value"], value)
-            futures.append(future)
-        return futures
+        if not items:
+            return []
+        elif self._controller.put_many_supported:
+            # Put them all in a single request so the controller only has to
+            # handle it once. This gives a single future for all of them
+            future = self._context.put_many_async(
+                self._data.path, OrderedDict(items))
+            return [future]
+        else:
+            # One future per attribute
+            futures = []
+            for attr, value in items:
+                future = self._context.put_async(
+                    self._data.path + [attr, "value"], value)
+                futures.append(future)
+            return futures
 
     def put_attribute_values(self, params, timeout=None):
         futures = self.put_attribute_values_async(params)
@@ -56,14 +70,22 @@ class Block(View):
         self._context.wait_all_futures(futures, timeout)
 
 
-def make_block_view(controller, context, data):
-    class BlockSubclass(Block):
-        def __init__(self):
-            self._do_init(controller, context, data)
+def make_async_method(endpoint):
+    """Make an endpoint_async method for a Block class
 
-    for endpoint in data:
-        # make properties for the endpoints we know about
-        make_get_property(BlockSubclass, endpoint)
+    Args:
+        endpoint (str): The name of the Method it will post to
 
-    block = BlockSubclass()
+    Returns:
+        function: Taking (self, *args, **kwargs)
+    """
+    def post_async(self, *args, **kwargs):
+        child = getattr(self, endpoint)
+        return child.post_async(*args, **kwargs)
+
+    return post_async
+
+
+def make_block_view(controller, context, data):
+    block = get_view_class(Block, data)(controller, context, data)
     return block
\ No newline at end of file
@@ -4,7 +4,7 @@ from .attributemodel import AttributeModel
 from .blockmeta import BlockMeta
 from .methodmodel import MethodModel
 from .model import Model
-from .serializable import Serializable, deserialize_object
+from .serializable import Serializable, deserialize_object, check_camel_case
 
 
 @Serializable.register_subclass("malcolm:core/Block:1.0")
@@ -32,6 +32,7 @@ class BlockModel(Model):
                 # Stop the old endpoint notifying
                 self[name].set_notifier_path(Model.notifier, ())
             else:
+                check_camel_case(name)
                 self.endpoints.append(name)
             value.set_notifier_path(self.notifier, self.path + [name])
             setattr(self, name, value)
@@ -1,18 +1,24 @@
+import threading
 import weakref
 import time
 
 from malcolm.compat import maybe_import_cothread
 from .future import Future
 from .loggable import Loggable
-from .request import Put, Post, Subscribe, Unsubscribe
+from .predicate import make_predicate, check_predicate
+from .request import Put, PutMany, Post, Subscribe, Unsubscribe
 from .response import Update, Return, Error
 from .queue import Queue
-from .errors import TimeoutError, AbortedError, ResponseError, BadValueError
+from .errors import TimeoutError, AbortedError, ResponseError, \
+    WrongThreadError
 
 
 class When(object):
-    def __init__(self, condition_satisfied):
+    def __init__(self, condition_satisfied, server_side=False):
         self.condition_satisfied = condition_satisfied
+        # If True then the subscription has a predicate, so the controller
+        # will end it for us after sending the value we are waiting for
+        self.server_side = server_side
         self.future = None
         self.context = None
 
@@ -20,20 +26,26 @@ class When(object):
         self.future = future
         self.context = context
 
+    def _finish(self):
+        if self.server_side:
+            # Just wait for the Return that ends it
+            self.context.expect_return(self.future)
+        else:
+            self.context.unsubscribe(self.future)
+        self.future = None
+
     def check_condition(self, value):
         if self.future:
             try:
                 satisfied = self.condition_satisfied(value)
             except Exception:
                 # Bad value, so unsubscribe
-                self.context.unsubscribe(self.future)
-                self.future = None
+                self._finish()
                 raise
             else:
                 if satisfied:
                     # All done, so unsubscribe
-                    self.context.unsubscribe(self.future)
-                    self.future = None
+                    self._finish()
 
 
 class Context(Loggable):
@@ -54,6 +66,9 @@ class Context(Loggable):
         self._subscriptions = {}  # dict {int id: (func, args)}
         self._requests = {}  # dict {Future: Request}
         self._pending_unsubscribes = {}  # dict {Future: Subscribe}
+        # Protects _futures and _requests, as _handle_response changes them
+        # from the threads of the controllers we send to
+        self._lock = threading.Lock()
         # If not None, wait for this before listening to STOPs
         self._sentinel_stop = None
         self._cothread = maybe_import_cothread()
@@ -98,8 +113,9 @@ class Context(Loggable):
 
     def _dispatch_request(self, request):
         future = Future(weakref.proxy(self))
-        self._futures[request.id] = future
-        self._requests[future] = request
+        with self._lock:
+            self._futures[request.id] = future
+            self._requests[future] = request
         controller = self.get_controller(request.path[0])
         if self._notify_dispatch_request:
             self._notify_dispatch_request(request)
@@ -142,7 +158,39 @@ class Context(Loggable):
         Returns:
              Future: A single Future which will resolve to the result
         """
-        request = Put(self._get_next_id(), path, value, self._q.put)
+        request = Put(
+            self._get_next_id(), path, value, self._handle_response)
+        future = self._dispatch_request(request)
+        return future
+
+    def put_many(self, path, values, timeout=None):
+        """Puts values to several attributes of a Block and returns when they
+        have all completed
+
+        Args:
+            path (list): The path of the Block, just [mri]
+            values (dict): {attr_name: value} to put to each attribute
+            timeout (float): time in seconds to wait for responses, wait forever
+                if None
+        """
+        future = self.put_many_async(path, values)
+        self.wait_all_futures(future, timeout=timeout)
+
+    def put_many_async(self, path, values):
+        """Puts values to several attributes of a Block in a single request
+        and returns immediately
+
+        Args:
+            path (list): The path of the Block, just [mri]
+            values (dict): {attr_name: value} to put to each attribute
+
+        Returns:
+             Future: A single Future which will resolve to
+                {attr_name: {"value": result}}, or raise a ResponseError
+                saying which attributes failed
+        """
+        request = PutMany(
+            self._get_next_id(), path, values, self._handle_response)
         future = self._dispatch_request(request)
         return future
 
@@ -172,18 +220,29 @@ class Context(Loggable):
         Returns:
              Future: as single Future that will resolve to the result
         """
-        request = Post(self._get_next_id(), path, params, self._q.put)
+        request = Post(
+            self._get_next_id(), path, params, self._handle_response)
         future = self._dispatch_request(request)
         return future
 
-    def subscribe(self, path, callback, *args):
+    def subscribe(self, path, callback, *args, **kwargs):
         """Subscribe to changes in a given attribute and call
         ``callback(future, value, *args)`` when it changes
 
+        Args:
+            path (list): The path to subscribe to
+            callback (callable): Function to call with each value
+            *args: Extra arguments to pass to callback
+            predicate (dict): If given as a keyword argument, only values
+                that pass it will be sent, and the subscription will end
+                after the first. See Subscribe
+
         Returns:
             Future: A single Future which will resolve to the result
         """
-        request = Subscribe(self._get_next_id(), path, False, self._q.put)
+        request = Subscribe(self._get_next_id(), path, False, self._q.put,
+                            predicate=kwargs.pop("predicate", None))
+        assert not kwargs, "Unexpected keyword args %s" % list(kwargs)
         # If self is in args, then make weak version of it
         saved_args = []
         for arg in args:
@@ -204,7 +263,8 @@ class Context(Loggable):
         assert future not in self._pending_unsubscribes, \
             "%r has already been unsubscribed from" % \
             self._pending_unsubscribes[future]
-        subscribe = self._requests[future]
+        with self._lock:
+            subscribe = self._requests[future]
         self._pending_unsubscribes[future] = subscribe
         # Clear out the subscription
         self._subscriptions.pop(subscribe.id)
@@ -212,11 +272,25 @@ class Context(Loggable):
         controller = self.get_controller(subscribe.path[0])
         controller.handle_request(request)
 
+    def expect_return(self, future):
+        """Mark a subscription as ending without an unsubscribe, because the
+        controller will end it after its predicate is satisfied
+
+        Args:
+            future (Future): The future of the original subscription
+        """
+        with self._lock:
+            subscribe = self._requests[future]
+        self._pending_unsubscribes[future] = subscribe
+        # Clear out the subscription
+        self._subscriptions.pop(subscribe.id)
+
     def unsubscribe_all(self):
         """Send an unsubscribe for all active subscriptions"""
-        futures = [f for f, r in self._requests.items()
-                   if isinstance(r, Subscribe)
-                   and f not in self._pending_unsubscribes]
+        with self._lock:
+            futures = [f for f, r in self._requests.items()
+                       if isinstance(r, Subscribe)
+                       and f not in self._pending_unsubscribes]
         if futures:
             for future in futures:
                 self.unsubscribe(future)
@@ -243,28 +317,29 @@ class Context(Loggable):
 
         Args:
             path (list): The path to wait to
-            good_value: If it is a callable then expect it to return
-                True if we are satisfied and raise on error. If it is not
-                callable then compare each value against this one and return
-                if it matches.
+            good_value: If it is a GreaterOrEqual or OneOf, or is not
+                callable then the controller will check each value against
+                it, and only send the one that matches. If it is any other
+                callable then expect it to return True if we are satisfied and
+                raise on error, and check each value here
             bad_values (list): values to raise an error on
 
         Returns:
             Future: a single Future that will resolve when the path matches
             good_value or bad_values
         """
-        if callable(good_value):
+        predicate = make_predicate(good_value, bad_values)
+        if predicate is None:
             def condition_satisfied(value):
                 return good_value(value)
         else:
+            # The controller only sends the value that ends the wait, but we
+            # still need to check whether it was a bad one
             def condition_satisfied(value):
-                if bad_values and value in bad_values:
-                    raise BadValueError(
-                        "Waiting for %r, got %r" % (good_value, value))
-                return value == good_value
+                return check_predicate(predicate, value)
 
-        when = When(condition_satisfied)
-        future = self.subscribe(path, when.check_condition)
+        when = When(condition_satisfied, server_side=predicate is not None)
+        future = self.subscribe(path, when.check_condition, predicate=predicate)
         when.set_future_context(future, weakref.proxy(self))
         return future
 
@@ -301,6 +376,98 @@ class Context(Loggable):
 
         while filtered_futures:
             self._service_futures(filtered_futures, until)
+            # Futures can also be resolved by other threads or by callbacks
+            for f in list(filtered_futures):
+                if f.done():
+                    filtered_futures.remove(f)
+                    if f.exception() is not None:
+                        raise f.exception()
+
+    def gather_async(self, futures):
+        """Combine futures into one that resolves when they all have
+
+        Args:
+            futures (list): The futures to combine, which can come from any
+                Context
+
+        Returns:
+            Future: A single Future that will resolve to a list of their
+            results in the same order, or raise the first exception that any
+            of them raises
+        """
+        futures = list(futures)
+        gathered = Future(weakref.proxy(self))
+        if not futures:
+            gathered.set_result([])
+            return gathered
+        lock = threading.Lock()
+        # [number of futures not done yet]
+        remaining = [len(futures)]
+        q = self._q
+
+        def on_done(future):
+            with lock:
+                if remaining[0] == 0:
+                    # Already resolved by an earlier exception
+                    return
+                if future.exception() is None:
+                    remaining[0] -= 1
+                    if remaining[0]:
+                        return
+                else:
+                    remaining[0] = 0
+            if future.exception() is None:
+                gathered.set_result([f.result() for f in futures])
+            else:
+                gathered.set_exception(future.exception())
+            # Wake up anyone waiting for it
+            q.put(gathered)
+
+        for f in futures:
+            f.add_done_callback(on_done)
+        return gathered
+
+    def gather(self, futures, timeout=None):
+        """Wait for all futures to complete and return their results
+
+        Args:
+            futures (list): The futures to wait for
+            timeout (float): time in seconds to wait for responses, wait
+                forever if None
+
+        Returns:
+            list: The results of the futures in the same order
+        """
+        future = self.gather_async(futures)
+        self.wait_all_futures(future, timeout)
+        return future.result()
+
+    def as_completed(self, futures, timeout=None):
+        """Iterate over futures in the order they complete, servicing the
+        queue while none of them are done. A future that raised is yielded
+        like any other, so check its exception()
+
+        Args:
+            futures (list): The futures to wait for
+            timeout (float): time in seconds to wait for all of them, wait
+                forever if None
+
+        Yields:
+            Future: Each future as it completes
+        """
+        if timeout is None:
+            until = None
+        else:
+            until = time.time() + timeout
+        pending = list(futures)
+        while pending:
+            done = [f for f in pending if f.done()]
+            if done:
+                for f in done:
+                    pending.remove(f)
+                    yield f
+            else:
+                self._service_futures(set(), until)
 
     def sleep(self, seconds):
         """Services all futures while waiting
@@ -338,27 +505,74 @@ class Context(Loggable):
             if response.id in self._subscriptions:
                 (func, args) = self._subscriptions[response.id]
                 func(response.value, *args)
+        elif isinstance(response, Future):
+            # Resolved in another thread, just woken up to notice
+            pass
         elif isinstance(response, Return):
-            future = self._futures.pop(response.id)
-            request = self._requests.pop(future)
+            with self._lock:
+                future = self._futures.pop(response.id)
+                request = self._requests.pop(future)
             self._pending_unsubscribes.pop(future, None)
-            result = response.value
-            # Deserialize if this was a method
-            if isinstance(request, Post) and result is not None:
-                controller = self.get_controller(request.path[0])
-                result = controller.validate_result(request.path[1], result)
-            future.set_result(result)
+            self._set_future_from_response(future, request, response)
             try:
                 futures.remove(future)
             except KeyError:
                 pass
+            else:
+                # A PutMany can Return with some of its puts failed
+                if future.exception() is not None:
+                    raise future.exception()
         elif isinstance(response, Error):
-            future = self._futures.pop(response.id)
-            del self._requests[future]
-            future.set_exception(ResponseError(response.message))
+            with self._lock:
+                future = self._futures.pop(response.id)
+                request = self._requests.pop(future)
+            self._set_future_from_response(future, request, response)
             try:
                 futures.remove(future)
             except KeyError:
                 pass
             else:
                 raise future.exception()
+
+    def _set_future_from_response(self, future, request, response):
+        if isinstance(response, Error):
+            future.set_exception(ResponseError(response.message))
+            return
+        result = response.value
+        # Deserialize if this was a method
+        if isinstance(request, Post) and result is not None:
+            controller = self.get_controller(request.path[0])
+            result = controller.validate_result(request.path[1], result)
+        elif isinstance(request, PutMany) and result:
+            # Fail if any of the puts did, saying which
+            errors = ["%s: %s" % (name, r["error"])
+                      for name, r in result.items() if "error" in r]
+            if errors:
+                future.set_exception(ResponseError("; ".join(errors)))
+                return
+        future.set_result(result)
+
+    def _handle_response(self, response):
+        """Resolve the future of a Put, PutMany or Post in whichever thread
+        its Return or Error arrives in, so it doesn't need anyone to be
+        waiting on our queue, then wake up anyone who is"""
+        with self._lock:
+            future = self._futures.pop(response.id, None)
+            if future is None:
+                # Already resolved
+                return
+            request = self._requests.pop(future)
+        try:
+            self._set_future_from_response(future, request, response)
+        except WrongThreadError:
+            # A cothread Controller can only validate the result of a Post in
+            # the cothread thread, so leave it for _service_futures
+            with self._lock:
+                self._futures[response.id] = future
+                self._requests[future] = request
+            self._q.put(response)
+        except Exception as e:
+            future.set_exception(e)
+            self._q.put(future)
+        else:
+            self._q.put(future)
@@ -19,10 +19,12 @@ from .method import Method
 from .methodmodel import MethodModel, get_method_decorated
 from .model import Model
 from .notifier import Notifier
-from .request import Get, Subscribe, Unsubscribe, Put, Post
+from .request import Get, Subscribe, Unsubscribe, Put, PutMany, Post
 from .queue import Queue
 from .rlock import RLock
+from .serialexecutor import SerialExecutor
 from .serializable import serialize_object, deserialize_object, camel_to_title
+from .spawnlane import CONTROL_LANE
 from .view import make_view
 
 
@@ -31,6 +33,15 @@ ABORT_TIMEOUT = 5.0
 
 class Controller(Loggable):
     use_cothread = True
+    # If True, handle Gets, Subscribes and Unsubscribes in order from a single
+    # worker in batches, rather than spawning for each one
+    serial_requests = True
+    # Posts to these methods are spawned in the control lane, so they are
+    # never queued behind hooks or background work
+    control_methods = ("abort", "pause", "disable")
+    # If True, Block.put_attribute_values sends one PutMany rather than a Put
+    # per attribute
+    put_many_supported = True
 
     # Attributes
     health = None
@@ -40,6 +51,9 @@ class Controller(Loggable):
         self.process = process
         self.mri = mri
         self._request_queue = Queue()
+        self._request_executor = SerialExecutor(
+            self.spawn, self._handle_request_batch,
+            lambda request, e: [request.error_response(e)])
         # {Part: Alarm} for current faults
         self._faults = {}
         # {Hook: name}
@@ -57,7 +71,7 @@ class Controller(Loggable):
         self.set_label(mri)
         for part in parts:
             self.add_part(part)
-        self._notifier = Notifier(mri, self._lock, self._block)
+        self._notifier = Notifier(mri, self._lock, self._block, self.spawn)
         self._block.set_notifier_path(self._notifier, [mri])
         self._write_functions = {}
         self._add_block_fields()
@@ -157,6 +171,12 @@ class Controller(Loggable):
     def changes_squashed(self):
         return self._notifier.changes_squashed
 
+    @property
+    def revision(self):
+        """The revision of our Block, which changes whenever anything in it
+        does. Can be read from any thread without taking the lock"""
+        return self._notifier.revision
+
     def update_health(self, part, alarm=None):
         """Set the health attribute. Called from part"""
         if alarm is not None:
@@ -230,35 +250,33 @@ class Controller(Loggable):
             return data
 
     def handle_request(self, request):
-        """Spawn a new thread that handles Request"""
+        """Spawn a new thread that handles Request, or if serial_requests and
+        it can't block, queue it for our request worker
+
+        Returns:
+            Spawned or Completion: that can be waited on for it to be handled
+        """
+        if self.serial_requests and \
+                not isinstance(request, (Put, PutMany, Post)):
+            return self._request_executor.submit(request)
+        if isinstance(request, Post) and len(request.path) > 1 and \
+                request.path[1] in self.control_methods:
+            # Pass the request directly so it can't pick up one of the
+            # requests on the queue that are waiting for a background thread
+            return self.process.spawn(self._handle_request, (request,), {},
+                                      self.use_cothread, CONTROL_LANE)
         # Put data on the queue, so if spawns are handled out of order we
         # still get the most up to date data
         self._request_queue.put(request)
         return self.spawn(self._handle_request)
 
-    def _handle_request(self):
-        responses = []
+    def _handle_request(self, request=None):
         with self._lock:
-            # We spawned just above, so there is definitely something on the
-            # queue
-            request = self._request_queue.get(timeout=0)
-            # self.log.debug(request)
-            if isinstance(request, Get):
-                handler = self._handle_get
-            elif isinstance(request, Put):
-                handler = self._handle_put
-            elif isinstance(request, Post):
-                handler = self._handle_post
-            elif isinstance(request, Subscribe):
-                handler = self._notifier.handle_subscribe
-            elif isinstance(request, Unsubscribe):
-                handler = self._notifier.handle_unsubscribe
-            else:
-                raise UnexpectedError("Unexpected request %s", request)
-            try:
-                responses += handler(request)
-            except Exception as e:
-                responses.append(request.error_response(e))
+            if request is None:
+                # We spawned just above, so there is definitely something on
+                # the queue
+                request = self._request_queue.get(timeout=0)
+            responses = self._respond_to(request)
         for cb, response in responses:
             try:
                 cb(response)
@@ -266,6 +284,39 @@ class Controller(Loggable):
                 self.log.exception("Exception notifying %s", response)
                 raise
 
+    def _handle_request_batch(self, requests):
+        # Take the lock once for the whole batch, leaving the SerialExecutor
+        # to call the callbacks
+        responses = []
+        with self._lock:
+            for request in requests:
+                responses += self._respond_to(request)
+        return responses
+
+    def _respond_to(self, request):
+        """Called with the lock taken"""
+        # self.log.debug(request)
+        if isinstance(request, Get):
+            handler = self._handle_get
+        elif isinstance(request, Put):
+            handler = self._handle_put
+        elif isinstance(request, PutMany):
+            handler = self._handle_put_many
+        elif isinstance(request, Post):
+            handler = self._handle_post
+        elif isinstance(request, Subscribe):
+            handler = self._notifier.handle_subscribe
+        elif isinstance(request, Unsubscribe):
+            handler = self._notifier.handle_unsubscribe
+        else:
+            handler = None
+        try:
+            if handler is None:
+                raise UnexpectedError("Unexpected request %s" % (request,))
+            return handler(request)
+        except Exception as e:
+            return [request.error_response(e)]
+
     def _handle_get(self, request):
         """Called with the lock taken"""
         data = self._block
@@ -298,6 +349,44 @@ class Controller(Loggable):
         ret = [request.return_response(result)]
         return ret
 
+    def _handle_put_many(self, request):
+        """Called with the lock taken"""
+        # Check them all before we put to any of them
+        puts = []
+        for attribute_name, value in request.values.items():
+            attribute = self._block[attribute_name]
+            assert attribute.meta.writeable, \
+                "Attribute %s is not writeable" % attribute_name
+            puts.append(
+                (attribute_name, self._write_functions[attribute_name], value))
+
+        # {name: {"value": result} or {"error": message}}
+        results = OrderedDict((name, None) for name, _, _ in puts)
+        # Each put notifies subscribers as it completes, so a client may see
+        # some of the new values before the others
+        with self.lock_released:
+            # Spawn all but the last so they run concurrently, then do the
+            # last one ourselves
+            spawned = [(name, self.spawn(put_function, value))
+                       for name, put_function, value in puts[:-1]]
+            for name, put_function, value in puts[-1:]:
+                results[name] = self._put_many_result(
+                    request, name, put_function, value)
+            for name, s in spawned:
+                results[name] = self._put_many_result(request, name, s.get)
+        return [request.return_response(results)]
+
+    def _put_many_result(self, request, name, func, *args):
+        # The result of one of the puts of a PutMany, whether it worked or not
+        result = OrderedDict()
+        try:
+            result["value"] = func(*args)
+        except Exception as e:
+            self.log.info("Exception raised putting %s for request %s",
+                          name, request, exc_info=True)
+            result["error"] = "%s: %s" % (e.__class__.__name__, e)
+        return result
+
     def _handle_post(self, request):
         """Called with the lock taken"""
         method_name = request.path[1]
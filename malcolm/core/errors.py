@@ -29,7 +29,8 @@ class BadValueError(MalcolmException):
 
 
 class WrongThreadError(MalcolmException):
-    """When you have called something outside of cothread's thread"""
+    """When you have called something outside of cothread's thread, or made
+    a blocking call in the event loop's thread"""
     pass
 
 
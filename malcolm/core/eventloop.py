@@ -0,0 +1,145 @@
+import logging
+import threading
+import time
+
+from malcolm.compat import maybe_import_asyncio, get_thread_ident
+
+
+# Create a module level logger
+log = logging.getLogger(__name__)
+
+
+class EventLoop(object):
+    """A single asyncio event loop run forever in its own thread. The Process
+    runs functions spawned in the loop lane as callbacks on it, and the
+    tornado IOLoops of the web comms all share it, so none of them need a
+    thread of their own. Functions run on it must never block"""
+
+    def __init__(self, asyncio):
+        """
+        Args:
+            asyncio (module): The asyncio module
+        """
+        self._lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._io_loop = None
+        self.thread_ident = None
+        # Number of callbacks waiting to run
+        self.queued = 0
+        # Biggest value that queued has reached
+        self.max_queued = 0
+        # Total number of callbacks that have been submitted
+        self.total = 0
+        # Imported here as spawnlane imports queue, which imports us
+        from .spawnlane import SpawnTimings, function_name
+        self.timings = SpawnTimings()
+        self._function_name = function_name
+        started = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run_forever, args=(asyncio, started),
+            name="EventLoop")
+        self._thread.daemon = True
+        self._thread.start()
+        started.wait()
+
+    def _run_forever(self, asyncio, started):
+        asyncio.set_event_loop(self._loop)
+        self.thread_ident = get_thread_ident()
+        self._loop.call_soon(started.set)
+        self._loop.run_forever()
+
+    def in_loop_thread(self):
+        """Return True if called from the event loop's thread"""
+        return get_thread_ident() == self.thread_ident
+
+    def apply_async(self, function):
+        """Run function as a callback on the event loop, with the same
+        signature as SpawnLane.apply_async() so Spawned can use either.
+        Called from any thread
+
+        Args:
+            function (callable): Function to call with no arguments
+        """
+        with self._lock:
+            self.queued += 1
+            self.total += 1
+            self.max_queued = max(self.max_queued, self.queued)
+        self._loop.call_soon_threadsafe(
+            self._run, function, self._function_name(function), time.time())
+
+    def _run(self, function, name, submitted):
+        with self._lock:
+            self.queued -= 1
+        token = self.timings.started(name, submitted)
+        try:
+            function()
+        except Exception:
+            # Spawned catches its own, but don't let anything else stop the
+            # loop
+            log.exception("Exception calling %s", function)
+        finally:
+            self.timings.finished(token)
+
+    def stats(self):
+        """Return a snapshot of the counters in the same form as
+        SpawnLane.stats(). There is only one thread and callbacks run to
+        completion, so running is at most 1
+
+        Returns:
+            dict: {name: value} for threads, queued, maxQueued, running, total
+        """
+        with self._lock:
+            return dict(
+                threads=1, queued=self.queued, maxQueued=self.max_queued,
+                running=0, total=self.total)
+
+    def io_loop(self):
+        """Get the tornado IOLoop that runs on this event loop
+
+        Returns:
+            IOLoop: for the comms to use instead of making their own
+        """
+        with self._lock:
+            if self._io_loop is None:
+                # IOLoop.current() wraps the asyncio loop of the thread it is
+                # called from
+                from tornado.ioloop import IOLoop
+                made = threading.Event()
+                io_loops = []
+
+                def make_io_loop():
+                    io_loops.append(IOLoop.current())
+                    made.set()
+
+                self._loop.call_soon_threadsafe(make_io_loop)
+                made.wait(timeout=10)
+                self._io_loop = io_loops[0]
+            return self._io_loop
+
+
+_event_loop = None
+_event_loop_lock = threading.Lock()
+
+
+def get_event_loop():
+    """Get the EventLoop shared by everything in this interpreter, starting
+    it if this is the first call
+
+    Returns:
+        EventLoop: the shared event loop, or None if PYMALCOLM_USE_ASYNCIO
+            is not set
+    """
+    global _event_loop
+    asyncio = maybe_import_asyncio()
+    if asyncio is None:
+        return None
+    with _event_loop_lock:
+        if _event_loop is None:
+            _event_loop = EventLoop(asyncio)
+    return _event_loop
+
+
+def in_event_loop_thread():
+    """Return True if called from the shared EventLoop's thread, where
+    nothing should block"""
+    return _event_loop is not None and _event_loop.in_loop_thread()
@@ -1,7 +1,16 @@
+import logging
+import threading
+
+
+# Create a module level logger
+log = logging.getLogger(__name__)
+
+
 class Future(object):
     """Represents the result of an asynchronous computation.
-    This class has a similar API to concurrent.futures.Future but this
-    simpler version is not thread safe"""
+    This class has a similar API to concurrent.futures.Future. It can be
+    resolved from any thread, but result() and exception() can only wait
+    in the thread that services its Context"""
     # Possible future states (for internal use).
     RUNNING = 'RUNNING'
     #  Task has set the return or exception and this future is filled
@@ -16,6 +25,8 @@ class Future(object):
         self._state = self.RUNNING
         self._result = None
         self._exception = None
+        self._lock = threading.Lock()
+        self._callbacks = []
 
     def done(self):
         """Return True if the future finished executing."""
@@ -67,6 +78,34 @@ class Future(object):
             self._context.wait_all_futures([self], timeout)
         return self._exception
 
+    def add_done_callback(self, fn):
+        """Attach a callable to be called when the future is done. It will be
+        called with the future as its only argument in the thread that
+        resolves the future, or immediately if it is already done
+
+        Args:
+            fn (callable): Function taking the future as its only argument
+        """
+        with self._lock:
+            if self._state == self.RUNNING:
+                self._callbacks.append(fn)
+                return
+        self._call_callback(fn)
+
+    def _call_callback(self, fn):
+        try:
+            fn(self)
+        except Exception:
+            log.exception("Exception calling %s for %s", fn, self)
+
+    def _finish(self):
+        with self._lock:
+            self._state = self.FINISHED
+            callbacks = self._callbacks
+            self._callbacks = []
+        for fn in callbacks:
+            self._call_callback(fn)
+
     # The following methods should only be used by Task and in unit tests.
 
     def set_result(self, result):
@@ -75,7 +114,7 @@ class Future(object):
         Should only be used by Task and unit tests.
         """
         self._result = result
-        self._state = self.FINISHED
+        self._finish()
 
     def set_exception(self, exception):
         """Sets the result of the future as being the given exception.
@@ -83,4 +122,4 @@ class Future(object):
         Should only be used by Task and unit tests.
         """
         self._exception = exception
-        self._state = self.FINISHED
+        self._finish()
@@ -1,6 +1,7 @@
 import logging
 
 from malcolm.core.errors import AbortedError
+from malcolm.core.spawnlane import HOOK_LANE
 
 
 # Create a module level logger
@@ -14,7 +15,9 @@ class HookRunner(object):
         self.func = func
         self.context = context
         self.args = args
-        self.spawned = self.part.spawn(self.func_result_on_queue)
+        self.spawned = self.part.process.spawn(
+            self.func_result_on_queue, (), {}, self.part.use_cothread,
+            HOOK_LANE)
 
     def func_result_on_queue(self):
         try:
@@ -0,0 +1,121 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+from malcolm.compat import OrderedDict
+
+
+def check_1d_arrays(o):
+    """Check that o, or any value directly inside it, is not a numpy array
+    with other than 1 dimension. Arrays only appear as the values of the
+    dicts that Serializable.to_dict() returns, so there is no need to look
+    any deeper
+
+    Args:
+        o: Object to check
+
+    Returns:
+        The object passed in
+    """
+    if isinstance(o, dict):
+        values = o.values()
+    elif isinstance(o, (list, tuple)):
+        values = o
+    else:
+        values = (o,)
+    for v in values:
+        if isinstance(v, np.ndarray):
+            assert v.ndim == 1, "Expected 1d array, got {}".format(v.shape)
+    return o
+
+
+class StdlibJSONBackend(object):
+    """JSON backend using the json module from the standard library"""
+
+    name = "json"
+    # What goes between items and between a key and its value in the output,
+    # without spaces so that every backend produces the same text
+    item_separator = ","
+    key_separator = ":"
+
+    def encode(self, o, default):
+        """JSON encode an object
+
+        Args:
+            o: Object to encode
+            default (callable): default(o) called with any object that isn't
+                natively supported, returning one that is
+
+        Returns:
+            str: The JSON text
+        """
+        return json.dumps(o, default=default, separators=(
+            self.item_separator, self.key_separator))
+
+    def decode(self, s):
+        """Decode JSON text into objects, keeping the order of keys
+
+        Args:
+            s (str): The JSON text
+
+        Returns:
+            The decoded object
+        """
+        return json.loads(s, object_pairs_hook=OrderedDict)
+
+
+class OrjsonBackend(StdlibJSONBackend):
+    """JSON backend using orjson, which encodes numpy arrays and scalars
+    natively rather than calling default for each one"""
+
+    name = "orjson"
+
+    def __init__(self, orjson):
+        """
+        Args:
+            orjson (module): The imported orjson module
+        """
+        self.orjson = orjson
+        # Attribute values only hold arrays of native byte order, which is
+        # all that orjson encodes correctly
+        self.option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def encode(self, o, default):
+        # orjson encodes arrays of any number of dimensions without calling
+        # default, so check them here and in whatever default returns
+        check_1d_arrays(o)
+        try:
+            encoded = self.orjson.dumps(
+                o, default=lambda x: check_1d_arrays(default(x)),
+                option=self.option)
+        except self.orjson.JSONEncodeError:
+            # Things like ints bigger than 64 bits need the slow path, which
+            # will also raise any error that default raised
+            return super(OrjsonBackend, self).encode(o, default)
+        else:
+            return encoded.decode("utf-8")
+
+    def decode(self, s):
+        # dicts keep their insertion order, so don't need OrderedDict
+        return self.orjson.loads(s)
+
+
+def choose_json_backend():
+    """Pick the fastest JSON backend that can be imported. This can be
+    overridden by setting PYMALCOLM_JSON_BACKEND to the name of a backend
+
+    Returns:
+        StdlibJSONBackend: The backend instance to use
+    """
+    name = os.environ.get("PYMALCOLM_JSON_BACKEND", OrjsonBackend.name)
+    # orjson decodes to plain dicts, which only keep key order from 3.7
+    if name == OrjsonBackend.name and sys.version_info >= (3, 7):
+        try:
+            import orjson
+        except ImportError:
+            pass
+        else:
+            return OrjsonBackend(orjson)
+    return StdlibJSONBackend()
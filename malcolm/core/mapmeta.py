@@ -1,6 +1,7 @@
 from malcolm.compat import str_, OrderedDict
 from .meta import Meta
-from .serializable import Serializable, deserialize_object, camel_to_title
+from .serializable import Serializable, deserialize_object, camel_to_title, \
+    check_camel_case
 from .stringarray import StringArray
 from .vmeta import VMeta
 
@@ -31,6 +32,7 @@ class MapMeta(Meta):
         for k, v in elements.items():
             if k != "typeid":
                 k = deserialize_object(k, str_)
+                check_camel_case(k)
                 v = deserialize_object(v, VMeta)
                 if not v.label:
                     v.set_label(camel_to_title(k))
@@ -1,4 +1,5 @@
-from .view import View
+from .methodmodel import MethodModel
+from .view import View, add_subscribe_methods
 
 
 class Method(View):
@@ -56,3 +57,6 @@ class Method(View):
     @property
     def returns(self):
         return self._controller.make_view(self._context, self._data, "returns")
+
+
+add_subscribe_methods(Method, MethodModel.endpoints)
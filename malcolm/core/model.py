@@ -4,12 +4,14 @@ from .serializable import Serializable
 
 
 class DummyNotifier(object):
+    table_deltas_wanted = False
+
     @property
     @contextmanager
     def changes_squashed(self):
         yield
 
-    def add_squashed_change(self, path, data=None):
+    def add_squashed_change(self, path, data=None, rows=None):
         pass
 
 
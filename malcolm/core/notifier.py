@@ -1,20 +1,65 @@
+import time
+from collections import deque
+
+from malcolm.compat import OrderedDict
+from .errors import TimeoutError
 from .serializable import serialize_object
 from .loggable import Loggable
+from .predicate import check_predicate
+from .queue import Queue
 from .request import Subscribe, Unsubscribe
+from .response import EncodedPayload, Delta
 
 
 class Notifier(Loggable):
     """Object that can service callbacks on given endpoints"""
 
-    def __init__(self, mri, lock, block):
+    # How many notify cycles of changes to keep for resyncing subscribers
+    journal_length = 1000
+
+    def __init__(self, mri, lock, block, spawn=None):
         super(Notifier, self).__init__(mri=mri)
         self._tree = NotifierNode(block)
         self._lock = lock
+        # Function to spawn the flushing of rate limited subscriptions with
+        self._spawn = spawn
         # Incremented every time we do with changes_squashed
         self._squashed_count = 0
         self._squashed_changes = []
         # {Subscribe.generator_key(): Subscribe}
         self._subscription_keys = {}
+        # {Subscribe.generator_key(): RateLimit} for those with a minInterval
+        self._rate_limits = {}
+        # True while there is a spawned _flush_rate_limits
+        self._flushing = False
+        # Waited on to sleep until the next rate limited response is due
+        self._flush_queue = Queue()
+        # time.time() that _flush_rate_limits is sleeping until, if it is
+        self._flush_deadline = None
+        # Incremented every notify cycle. Start from the time in microseconds
+        # so a restarted server can't reuse the revisions of a previous one
+        self._revision = int(time.time() * 1e6)
+        # deque([(revision, serialized changes)]), made when first needed
+        self._journal = None
+        # set(Subscribe.generate_key()) for Subscribes that want revisions
+        self._revision_keys = set()
+        # set(Subscribe.generate_key()) for delta Subscribes with tableDeltas
+        self._table_delta_keys = set()
+        # {Subscribe.generate_key(): predicate} for Subscribes with one
+        self._predicates = {}
+
+    @property
+    def revision(self):
+        """The revision of the last notify cycle. It is bumped after the
+        changes of each cycle are made, so anything serialized after reading
+        it is at least that revision"""
+        return self._revision
+
+    @property
+    def table_deltas_wanted(self):
+        """Whether any subscriber wants changed table rows, so it's worth
+        working them out when a table is set"""
+        return bool(self._table_delta_keys)
 
     def handle_subscribe(self, request):
         """Handle a Subscribe request from outside. Called with lock taken
@@ -25,8 +70,30 @@ class Notifier(Loggable):
         Returns:
             list: [(callback, Response)] that need to be called
         """
-        ret = self._tree.handle_subscribe(request, request.path[1:])
-        self._subscription_keys[request.generate_key()] = request
+        key = request.generate_key()
+        changes = None
+        if request.fromRevision is not None:
+            # Start keeping a journal so this subscriber can resync later
+            if self._journal is None:
+                self._journal = deque(maxlen=self.journal_length)
+            if request.delta:
+                self._revision_keys.add(key)
+                if len(request.path) == 1:
+                    changes = self._changes_since(request.fromRevision)
+        ret = self._tree.handle_subscribe(request, request.path[1:], changes)
+        self._add_revisions(ret)
+        self._subscription_keys[key] = request
+        if request.delta and request.tableDeltas:
+            self._table_delta_keys.add(key)
+        if request.minInterval:
+            assert self._spawn, \
+                "Can't rate limit subscriptions without a spawn function"
+            self._rate_limits[key] = RateLimit(request.minInterval)
+        if request.predicate:
+            self._predicates[key] = request.predicate
+            ret, finished = self._check_predicates(ret)
+            if finished:
+                ret += self._end_subscription(key)
         return ret
 
     def handle_unsubscribe(self, request):
@@ -38,8 +105,28 @@ class Notifier(Loggable):
         Returns:
             list: [(callback, Response)] that need to be called
         """
-        subscribe = self._subscription_keys.pop(request.generate_key())
-        ret = self._tree.handle_unsubscribe(subscribe, subscribe.path[1:])
+        return self._end_subscription(request.generate_key())
+
+    def _end_subscription(self, key):
+        """Stop notifying a subscriber and send it a Return. Called with lock
+        taken
+
+        Args:
+            key (tuple): The Subscribe.generate_key() of the subscriber
+
+        Returns:
+            list: [(callback, Response)] that need to be called
+        """
+        subscribe = self._subscription_keys.pop(key)
+        self._revision_keys.discard(key)
+        self._table_delta_keys.discard(key)
+        self._predicates.pop(key, None)
+        ret = []
+        rate_limit = self._rate_limits.pop(key, None)
+        if rate_limit and rate_limit.pending:
+            # Flush the latest value before we Return
+            ret.append((subscribe.callback, rate_limit.pending))
+        ret += self._tree.handle_unsubscribe(subscribe, subscribe.path[1:])
         return ret
 
     @property
@@ -53,18 +140,22 @@ class Notifier(Loggable):
         """
         return self
 
-    def add_squashed_change(self, path, data=None):
+    def add_squashed_change(self, path, data=None, rows=None):
         """Call setter, then notify subscribers of change
 
         Args:
             path (list): The path of what has changed, relative from Block
             data (object): The new data, None for deletion
+            rows (tuple): If data is a Table, the (start, stop, n, names)
+                from find_changed_rows() saying which rows changed
         """
         assert self._squashed_count, "Called while not squashing changes"
         if data is None:
             change = [path[1:]]
-        else:
+        elif rows is None:
             change = [path[1:], data]
+        else:
+            change = [path[1:], data, rows]
         self._squashed_changes.append(change)
 
     def __enter__(self):
@@ -78,14 +169,162 @@ class Notifier(Loggable):
         try:
             self._squashed_count -= 1
             if self._squashed_count == 0:
-                changes = self._squashed_changes
+                changes = squash_changes(self._squashed_changes)
                 self._squashed_changes = []
-                # TODO: squash intermediate changes here?
-                responses += self._tree.notify_changes(changes)
+                if changes:
+                    responses += self._notify_changes(changes)
         finally:
             self._lock.release()
             self._callback_responses(responses)
 
+    def _notify_changes(self, changes):
+        """Bump the revision, journal the changes and notify the tree of them.
+        Called with lock taken
+
+        Args:
+            changes (list): [[path, optional data]] squashed changes
+
+        Returns:
+            list: [(callback, Response)] that need to be called now
+        """
+        self._revision += 1
+        cache = {}
+        responses = self._tree.notify_changes(changes, cache)
+        if self._journal is not None:
+            self._journal.append(
+                (self._revision, self._tree.serialize_changes(changes, cache)))
+        self._add_revisions(responses)
+        responses, finished = self._check_predicates(responses)
+        responses = self._rate_limit(responses)
+        for key in finished:
+            responses += self._end_subscription(key)
+        return responses
+
+    def _check_predicates(self, responses):
+        """Drop the Updates of subscribers with a predicate that their values
+        don't pass. Called with lock taken
+
+        Args:
+            responses (list): [(callback, Response)] from the NotifierNodes
+
+        Returns:
+            tuple: ([(callback, Response)] that still need to be sent,
+                [Subscribe.generate_key()] of subscribers that have now got
+                the value they were waiting for, or a bad value)
+        """
+        if not self._predicates:
+            return responses, []
+        ret = []
+        finished = []
+        for cb, response in responses:
+            key = (cb, response.id)
+            predicate = self._predicates.get(key, None)
+            if predicate is None:
+                ret.append((cb, response))
+                continue
+            try:
+                satisfied = check_predicate(predicate, response.value)
+            except Exception:
+                # A bad value, send it so the subscriber can raise
+                satisfied = True
+            if satisfied:
+                ret.append((cb, response))
+                finished.append(key)
+        return ret, finished
+
+    def _add_revisions(self, responses):
+        """Tell the Deltas of subscribers that asked for it our revision
+
+        Args:
+            responses (list): [(callback, Response)] from the NotifierNodes
+        """
+        if self._revision_keys:
+            for cb, response in responses:
+                if (cb, response.id) in self._revision_keys and \
+                        isinstance(response, Delta):
+                    response.set_revision(self._revision)
+
+    def _changes_since(self, revision):
+        """Get the changes made since revision from the journal
+
+        Args:
+            revision (int): The revision the subscriber already has
+
+        Returns:
+            list: [[path, optional serialized data]] squashed changes, or None
+                if the journal doesn't go back that far
+        """
+        if revision == self._revision:
+            return []
+        elif self._journal and \
+                self._journal[0][0] <= revision + 1 <= self._revision:
+            changes = []
+            for journal_revision, journal_changes in self._journal:
+                if journal_revision > revision:
+                    changes += journal_changes
+            return squash_changes(changes)
+
+    def _rate_limit(self, responses):
+        """Hold back any responses to rate limited subscriptions that are not
+        yet due. Called with lock taken
+
+        Args:
+            responses (list): [(callback, Response)] from the NotifierNodes
+
+        Returns:
+            list: [(callback, Response)] that need to be called now
+        """
+        if not self._rate_limits:
+            return responses
+        now = time.time()
+        ret = []
+        for cb, response in responses:
+            rate_limit = self._rate_limits.get((cb, response.id), None)
+            if rate_limit is None:
+                ret.append((cb, response))
+            elif rate_limit.pending is None and now >= rate_limit.next_send:
+                rate_limit.next_send = now + rate_limit.min_interval
+                ret.append((cb, response))
+            else:
+                rate_limit.add_pending(response)
+                if not self._flushing:
+                    self._flushing = True
+                    self._spawn(self._flush_rate_limits)
+                elif self._flush_deadline is not None and \
+                        rate_limit.next_send < self._flush_deadline:
+                    # Due before the flusher would wake, so wake it now
+                    self._flush_deadline = rate_limit.next_send
+                    self._flush_queue.put(None)
+        return ret
+
+    def _flush_rate_limits(self):
+        """Send the pending responses of rate limited subscriptions as they
+        become due, returning when there are none left"""
+        while True:
+            responses = []
+            with self._lock:
+                now = time.time()
+                next_send = None
+                for key, rate_limit in self._rate_limits.items():
+                    if rate_limit.pending is None:
+                        continue
+                    elif now >= rate_limit.next_send:
+                        responses.append((key[0], rate_limit.pending))
+                        rate_limit.pending = None
+                        rate_limit.next_send = now + rate_limit.min_interval
+                    elif next_send is None or rate_limit.next_send < next_send:
+                        next_send = rate_limit.next_send
+                if next_send is None:
+                    self._flushing = False
+                self._flush_deadline = next_send
+            self._callback_responses(responses)
+            if next_send is None:
+                return
+            try:
+                self._flush_queue.get(timeout=next_send - now)
+            except TimeoutError:
+                pass
+
     def _callback_responses(self, responses):
         for cb, response in responses:
             try:
@@ -94,6 +333,64 @@ class Notifier(Loggable):
                 self.log.exception("Exception notifying %s", response)
 
 
+def squash_changes(changes):
+    """Remove any changes that are made redundant by a later change
+
+    A change to a path replaces any earlier change to the same path or to any
+    path below it, so only the last of these needs to be notified. Changes
+    to unrelated paths keep their relative order. A change to some rows of a
+    table only makes sense after the earlier changes to it, so it doesn't
+    replace them.
+
+    Args:
+        changes (list): [[path, optional data, optional rows]] in the order
+            they were made
+
+    Returns:
+        list: [[path, optional data, optional rows]] that have the same
+            effect when applied
+    """
+    # {(tuple(path), index): change}
+    squashed = OrderedDict()
+    for i, change in enumerate(changes):
+        path = tuple(change[0])
+        n = len(path)
+        if len(change) < 3:
+            # Drop any earlier change to this path, or one of its children
+            for key in [k for k in squashed if k[0][:n] == path]:
+                del squashed[key]
+        squashed[(path, i)] = change
+    return list(squashed.values())
+
+
+class RateLimit(object):
+    """Conflates the responses to a Subscribe with a minInterval"""
+
+    __slots__ = ["min_interval", "next_send", "pending"]
+
+    def __init__(self, min_interval):
+        """
+        Args:
+            min_interval (float): Minimum time in seconds between responses
+        """
+        self.min_interval = min_interval
+        # The initial response has just been sent
+        self.next_send = time.time() + min_interval
+        # Response that will be sent at next_send
+        self.pending = None
+
+    def add_pending(self, response):
+        """Conflate response with any pending one
+
+        Args:
+            response (Response): The Update or Delta that is not yet due
+        """
+        if self.pending is not None and isinstance(response, Delta):
+            changes = squash_changes(self.pending.changes + response.changes)
+            response = Delta(response.id, changes, response.revision)
+        self.pending = response
+
+
 class NotifierNode(object):
 
     # Define slots so it uses less resources to make these
@@ -111,17 +408,22 @@ class NotifierNode(object):
         # object
         self.data = data
 
-    def notify_changes(self, changes):
+    def notify_changes(self, changes, cache=None):
         """Set our data and notify anyone listening
 
         Args:
             changes (list): [[path, optional data]] where path is the path to
                 what has changed, and data is the unserialized object that has
                 changed
+            cache (dict): {id(data): (data, serialized)} of everything already
+                serialized in this notify cycle, shared between all nodes so
+                each object is only serialized once
 
         Returns:
             list: [(callback, Response)] that need to be called
         """
+        if cache is None:
+            cache = {}
         ret = []
         child_changes = {}
         for change in changes:
@@ -130,36 +432,104 @@ class NotifierNode(object):
 
         # If we have update subscribers, serialize at this level
         if self.update_requests:
-            serialized = serialize_object(self.data)
+            serialized = self._serialize(self.data, cache)
+            encoded = EncodedPayload(serialized)
             for request in self.update_requests:
-                ret.append(request.update_response(serialized))
+                ret.append(request.update_response(serialized, encoded))
 
-        # If we have delta subscribers, serialize the changes
+        # If we have delta subscribers, serialize the changes, with or without
+        # table rows depending on what they asked for
         if self.delta_requests:
-            for change in changes:
-                change[-1] = serialize_object(change[-1])
+            # {tableDeltas: (serialized_changes, encoded)}
+            variants = {}
             for request in self.delta_requests:
-                ret.append(request.delta_response(changes))
+                table_deltas = bool(request.tableDeltas)
+                if table_deltas not in variants:
+                    serialized_changes = self.serialize_changes(
+                        changes, cache, table_deltas)
+                    variants[table_deltas] = (
+                        serialized_changes, EncodedPayload(serialized_changes))
+                ret.append(request.delta_response(*variants[table_deltas]))
 
         # Now notify our children
         for name, child_changes in child_changes.items():
-            ret += self.children[name].notify_changes(child_changes)
+            ret += self.children[name].notify_changes(child_changes, cache)
         return ret
 
+    def serialize_changes(self, changes, cache, table_deltas=False):
+        """Serialize the data of each change, sharing cache between them
+
+        Args:
+            changes (list): [[path, optional data, optional rows]]
+                unserialized changes
+            cache (dict): {id(data): (data, serialized)} for this notify cycle
+            table_deltas (bool): If True then changes to some rows of a table
+                are serialized as [path, {name: new column values}, [start,
+                stop]], otherwise the whole table is sent
+
+        Returns:
+            list: [[path, optional serialized data]] in a new list
+        """
+        if not table_deltas and [c for c in changes if len(c) == 3]:
+            # Only the latest whole table is needed
+            changes = squash_changes([c[:2] for c in changes])
+        serialized_changes = []
+        for change in changes:
+            if len(change) == 3:
+                path, table, (start, stop, n, names) = change
+                columns = OrderedDict()
+                for name in names:
+                    columns[name] = serialize_object(
+                        table[name][start:start + n])
+                change = [path, columns, [start, stop]]
+            elif len(change) == 2:
+                change = [change[0], self._serialize(change[1], cache)]
+            serialized_changes.append(change)
+        return serialized_changes
+
+    def _serialize(self, data, cache):
+        """Serialize data, or reuse its serialized form if it is in cache
+
+        Args:
+            data (object): The unserialized object
+            cache (dict): {id(data): (data, serialized)} for this notify cycle
+
+        Returns:
+            object: The serialized form of data
+        """
+        try:
+            return cache[id(data)][1]
+        except KeyError:
+            serialized = serialize_object(data)
+            # Keep a reference to data so its id cannot be reused this cycle
+            cache[id(data)] = (data, serialized)
+            if data is self.data:
+                self._cache_children(data, serialized, cache)
+            return serialized
+
+    def _cache_children(self, data, serialized, cache):
+        """Add the serialized form of each subscribed child of data to cache,
+        so that children do not need to serialize it again"""
+        if isinstance(serialized, dict):
+            for name, child in self.children.items():
+                child_data = getattr(data, name, None)
+                if child_data is not None and name in serialized:
+                    child_serialized = serialized[name]
+                    cache.setdefault(
+                        id(child_data), (child_data, child_serialized))
+                    child._cache_children(child_data, child_serialized, cache)
+
     def _add_child_change(self, change, child_changes):
         path = change[0]
         if path:
             # This is for one of our children
             name = path[0]
             if name in self.children:
-                if len(change) == 2:
-                    child_change = [path[1:], change[1]]
-                else:
-                    child_change = [path[1:]]
+                child_change = [path[1:]] + change[1:]
                 child_changes.setdefault(name, []).append(child_change)
         else:
             # This is for us
-            if len(change) == 2:
+            if len(change) > 1:
                 child_change_dict = self._update_data(change[1])
             else:
                 child_change_dict = self._update_data(None)
@@ -189,13 +559,15 @@ class NotifierNode(object):
                 child_change_dict[name] = [[], child_data]
         return child_change_dict
 
-    def handle_subscribe(self, request, path):
+    def handle_subscribe(self, request, path, changes=None):
         """Add to the list of request to notify, and notify the initial value of
         the data held
 
         Args:
             request (Subscribe): The subscribe request
             path (list): The relative path from ourself
+            changes (list): If given, the serialized changes a delta
+                subscriber needs to be up to date, instead of the whole value
 
         Returns:
             list: [(callback, Response)] that need to be called
@@ -207,16 +579,19 @@ class NotifierNode(object):
             if name not in self.children:
                 self.children[name] = NotifierNode(
                     getattr(self.data, name, None), self)
-            ret += self.children[name].handle_subscribe(request, path[1:])
+            ret += self.children[name].handle_subscribe(
+                request, path[1:], changes)
+        elif request.delta:
+            # This is for us
+            self.delta_requests.append(request)
+            if changes is None:
+                changes = [[[], serialize_object(self.data)]]
+            ret.append(request.delta_response(changes))
         else:
             # This is for us
             serialized = serialize_object(self.data)
-            if request.delta:
-                self.delta_requests.append(request)
-                ret.append(request.delta_response([[[], serialized]]))
-            else:
-                self.update_requests.append(request)
-                ret.append(request.update_response(serialized))
+            self.update_requests.append(request)
+            ret.append(request.update_response(serialized))
         return ret
 
     def handle_unsubscribe(self, request, path):
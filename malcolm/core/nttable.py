@@ -1,6 +1,7 @@
 from malcolm.compat import OrderedDict
 from .attributemodel import AttributeModel
 from .serializable import Serializable
+from .table import find_changed_rows
 
 
 @Serializable.register_subclass("epics:nt/NTTable:1.0")
@@ -20,6 +21,9 @@ class NTTable(AttributeModel):
         d.update(super(NTTable, self).to_dict())
         return d
 
+    def changed_rows(self, old_value, new_value):
+        return find_changed_rows(old_value, new_value)
+
     @classmethod
     def from_dict(cls, d, ignore=()):
         ignore += ("labels",)
@@ -0,0 +1,185 @@
+import logging
+import threading
+from collections import deque
+
+from .notifier import squash_changes
+from .response import Update, Delta
+
+
+# Create a module level logger
+log = logging.getLogger(__name__)
+
+
+class OutboundQueue(object):
+    """Bounded queue of Responses for a single subscriber, so that a slow
+    consumer doesn't stall the thread that produced the change.
+
+    Responses are put on the queue from any thread. When the queue goes from
+    idle to having something on it, start_drain() is called so the consumer
+    can call get() in its own thread until it returns None. When the queue is
+    full the policy decides what happens:
+
+    - DROP_OLDEST: Throw away the oldest Update that a later Update with
+      the same id replaces. A Delta is never thrown away, as the
+      subscriber's copy would then be wrong, so the oldest Delta is
+      squashed into the next one with the same id instead. If nothing can
+      go the queue grows, so the latest value is never lost
+    - CONFLATE: Merge queued responses with the same id, keeping only the
+      latest Update and squashing Deltas together
+    - DISCONNECT: Throw away everything, call disconnect() and accept no more
+
+    These are used by the websocket and Server-Sent Events comms for their
+    clients. A Context's callback is a put() on its own unbounded Queue,
+    which never stalls the producer, so Contexts and other in-process
+    subscribers don't have one
+    """
+
+    DROP_OLDEST = "dropOldest"
+    CONFLATE = "conflate"
+    DISCONNECT = "disconnect"
+    policies = (DROP_OLDEST, CONFLATE, DISCONNECT)
+
+    def __init__(self, start_drain, size=1000, policy=CONFLATE,
+                 disconnect=None):
+        """
+        Args:
+            start_drain (callable): Called with no args from the producing
+                thread when the consumer should start calling get()
+            size (int): Maximum number of Responses to hold
+            policy (str): What to do when full, one of `policies`
+            disconnect (callable): Called with no args from the producing
+                thread when the DISCONNECT policy is triggered
+        """
+        assert policy in self.policies, \
+            "Policy %r not one of %s" % (policy, self.policies)
+        assert size > 0, "Queue size must be positive, got %s" % size
+        self.size = size
+        self.policy = policy
+        self._start_drain = start_drain
+        self._disconnect = disconnect
+        self._lock = threading.Lock()
+        self._responses = deque()
+        self._draining = False
+        #: True if the DISCONNECT policy has been triggered
+        self.disconnected = False
+        #: Number of Responses dropped or conflated away
+        self.dropped = 0
+        #: The maximum depth the queue has reached
+        self.max_depth = 0
+
+    @property
+    def depth(self):
+        """The number of Responses waiting to be consumed"""
+        return len(self._responses)
+
+    def put(self, response):
+        """Add a Response to the queue. Called from any thread
+
+        Args:
+            response (Response): The Response to send to the consumer
+        """
+        disconnect = start_drain = False
+        with self._lock:
+            if self.disconnected:
+                self.dropped += 1
+                return
+            if len(self._responses) >= self.size:
+                response = self._handle_overflow(response)
+                disconnect = self.disconnected
+            if disconnect:
+                self.dropped += 1
+            else:
+                self._responses.append(response)
+                self.max_depth = max(self.max_depth, len(self._responses))
+                if not self._draining:
+                    self._draining = start_drain = True
+        if disconnect:
+            log.warning(
+                "Outbound queue of %s responses full, disconnecting",
+                self.size)
+            if self._disconnect:
+                self._disconnect()
+        elif start_drain:
+            self._start_drain()
+
+    def get(self):
+        """Get the next Response for the consumer. Called from the consumer
+
+        Returns:
+            Response: The next Response, or None if the queue is empty, in
+                which case start_drain() will be called again on next put()
+        """
+        with self._lock:
+            if self._responses:
+                return self._responses.popleft()
+            else:
+                self._draining = False
+
+    def _handle_overflow(self, response):
+        """Make room in the queue according to policy, setting disconnected
+        if the consumer should be disconnected. Called with lock taken
+
+        Args:
+            response (Response): The Response about to be added
+
+        Returns:
+            Response: The Response to add, which may have a Delta squashed
+                into it
+        """
+        before = len(self._responses)
+        if self.policy == self.CONFLATE:
+            self._conflate()
+        if self.policy == self.DISCONNECT:
+            self._responses.clear()
+            self.disconnected = True
+        elif len(self._responses) >= self.size:
+            response = self._drop_oldest(response)
+        self.dropped += before - len(self._responses)
+        return response
+
+    def _drop_oldest(self, response):
+        # Returns and Errors end a request, so never drop those. An Update
+        # can only go if a later one replaces it, and a Delta if it can be
+        # squashed into a later one, including the one about to be added
+        responses = list(self._responses) + [response]
+        for i, dropped in enumerate(self._responses):
+            if not isinstance(dropped, (Update, Delta)):
+                continue
+            for j in range(i + 1, len(responses)):
+                later = responses[j]
+                if later.id != dropped.id:
+                    continue
+                if isinstance(dropped, Delta) and isinstance(later, Delta):
+                    changes = squash_changes(dropped.changes + later.changes)
+                    later = Delta(later.id, changes, later.revision)
+                    if j < len(self._responses):
+                        self._responses[j] = later
+                    else:
+                        response = later
+                elif not (isinstance(dropped, Update) and
+                          isinstance(later, Update)):
+                    break
+                del self._responses[i]
+                return response
+        # Nothing we can drop, so let the queue grow
+        return response
+
+    def _conflate(self):
+        # {id: index into responses of last Update or Delta}
+        subscription_indexes = {}
+        responses = []
+        for response in self._responses:
+            i = subscription_indexes.get(response.id, None)
+            if i is None or not isinstance(response, (Update, Delta)):
+                if isinstance(response, (Update, Delta)):
+                    subscription_indexes[response.id] = len(responses)
+                else:
+                    subscription_indexes.pop(response.id, None)
+                responses.append(response)
+            elif isinstance(response, Delta):
+                changes = responses[i].changes + response.changes
+                changes = squash_changes(changes)
+                responses[i] = Delta(response.id, changes, response.revision)
+            else:
+                responses[i] = response
+        self._responses = deque(responses)
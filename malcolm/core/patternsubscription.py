@@ -0,0 +1,167 @@
+import fnmatch
+import logging
+import threading
+from functools import partial
+
+from .notifier import squash_changes
+from .request import Subscribe, Unsubscribe
+from .response import Update, Delta, Error
+
+
+# Create a module level logger
+log = logging.getLogger(__name__)
+
+
+def is_pattern(mri):
+    """Whether the first element of a path is a pattern rather than an mri
+
+    Args:
+        mri (str): The first element of a Subscribe path
+
+    Returns:
+        bool: True if it contains any of the glob characters "*?["
+    """
+    return any(c in mri for c in "*?[")
+
+
+class PatternSubscription(object):
+    """Single Subscribe to the same path in every Block whose mri matches a
+    glob pattern, like ["*", "health", "value"].
+
+    A child Subscribe is made to each matching Controller, and their responses
+    are merged into Deltas whose paths start with the mri of the Block, so a
+    client ends up with {mri: value}. Changes that arrive while a Delta is
+    waiting to be sent are batched into it. Controllers added to the Process
+    later are subscribed to if they match, and removed ones are deleted.
+    """
+
+    def __init__(self, request, spawn):
+        """
+        Args:
+            request (Subscribe): The Subscribe whose path[0] is a pattern
+            spawn (callable): spawn(function, *args) to run things in another
+                thread
+        """
+        self.request = request
+        self._spawn = spawn
+        self._lock = threading.Lock()
+        # {mri: child Subscribe}
+        self._subscribes = {}
+        # [[path, optional serialized data]] waiting to be sent
+        self._changes = []
+        # Whether a flush will send self._changes without us spawning one
+        self._flush_pending = False
+        self._active = True
+
+    def matches(self, mri):
+        """Whether we should subscribe to a Block
+
+        Args:
+            mri (str): The mri of the Block
+        """
+        return fnmatch.fnmatchcase(mri, self.request.path[0])
+
+    def subscribe(self, controllers):
+        """Subscribe to the initial matching Controllers, then send a single
+        Delta with all of their values. Call this in its own thread as it
+        waits for the Controllers to respond
+
+        Args:
+            controllers (list): [Controller] that match our pattern
+        """
+        with self._lock:
+            # Hold back any responses until all the initial values are in
+            self._flush_pending = True
+        spawned = [self.add_controller(c) for c in controllers]
+        for s in spawned:
+            if s:
+                s.wait()
+        self._flush(initial=True)
+
+    def add_controller(self, controller):
+        """Subscribe to a newly matching Controller
+
+        Args:
+            controller (Controller): The Controller to subscribe to
+
+        Returns:
+            Spawned: that can be waited on for the initial value to arrive, or
+                None if we have been unsubscribed
+        """
+        mri = controller.mri
+        request = Subscribe(
+            self.request.id, [mri] + self.request.path[1:],
+            self.request.delta, partial(self._on_response, mri),
+            self.request.minInterval)
+        with self._lock:
+            if not self._active:
+                return
+            self._subscribes[mri] = request
+        return controller.handle_request(request)
+
+    def remove_controller(self, controller):
+        """Unsubscribe from a Controller that has gone, deleting its entry
+
+        Args:
+            controller (Controller): The Controller that was removed
+        """
+        with self._lock:
+            request = self._subscribes.pop(controller.mri, None)
+        if request:
+            controller.handle_request(
+                Unsubscribe(request.id, request.callback))
+            self._add_changes([[[controller.mri]]])
+
+    def unsubscribe(self, controllers):
+        """Unsubscribe from every Controller, sending no more Deltas
+
+        Args:
+            controllers (dict): {mri: Controller} of the Process
+        """
+        with self._lock:
+            self._active = False
+            subscribes = list(self._subscribes.items())
+            self._subscribes = {}
+        for mri, request in subscribes:
+            controller = controllers.get(mri, None)
+            if controller:
+                controller.handle_request(
+                    Unsubscribe(request.id, request.callback))
+
+    def _on_response(self, mri, response):
+        # called from any Controller's thread
+        if isinstance(response, Delta):
+            changes = [[[mri] + change[0]] + change[1:]
+                       for change in response.changes]
+        elif isinstance(response, Update):
+            changes = [[[mri], response.value]]
+        elif isinstance(response, Error):
+            log.warning("Subscription to %s failed: %s", mri, response.message)
+            return
+        else:
+            # Return from our Unsubscribe
+            return
+        self._add_changes(changes)
+
+    def _add_changes(self, changes):
+        with self._lock:
+            if not self._active:
+                return
+            self._changes += changes
+            spawn = not self._flush_pending
+            self._flush_pending = True
+        if spawn:
+            self._spawn(self._flush)
+
+    def _flush(self, initial=False):
+        with self._lock:
+            changes = squash_changes(self._changes)
+            if initial:
+                # Like the first Delta of a Block, replace everything
+                changes.insert(0, [[], {}])
+            self._changes = []
+            self._flush_pending = False
+            active = self._active
+        if active and changes:
+            cb, response = self.request.delta_response(changes)
+            cb(response)
@@ -0,0 +1,114 @@
+from .errors import BadValueError
+
+
+# The tests that a Subscribe predicate can make, each taking an operand
+EQUALS = "equals"
+GREATER_OR_EQUAL = "greaterOrEqual"
+IN = "in"
+TESTS = (EQUALS, GREATER_OR_EQUAL, IN)
+# Values that end the wait with a BadValueError
+BAD_VALUES = "badValues"
+
+
+class GreaterOrEqual(object):
+    """A good_value for when_matches that is satisfied by any value that is
+    at least the given one, and can be checked by the producing Controller"""
+
+    def __init__(self, value):
+        """
+        Args:
+            value (object): The smallest value that will satisfy it
+        """
+        self.value = value
+
+    def __call__(self, value):
+        return value >= self.value
+
+    def __repr__(self):
+        return "GreaterOrEqual(%r)" % (self.value,)
+
+
+class OneOf(object):
+    """A good_value for when_matches that is satisfied by any of the given
+    values, and can be checked by the producing Controller"""
+
+    def __init__(self, values):
+        """
+        Args:
+            values (list): The values that will satisfy it
+        """
+        self.values = list(values)
+
+    def __call__(self, value):
+        return value in self.values
+
+    def __repr__(self):
+        return "OneOf(%r)" % (self.values,)
+
+
+def make_predicate(good_value, bad_values=None):
+    """Make the predicate of a Subscribe that waits for good_value
+
+    Args:
+        good_value (object): A value to compare for equality, a GreaterOrEqual
+            or a OneOf
+        bad_values (list): Values that should end the wait with an error
+
+    Returns:
+        dict: {test: operand} to pass as Subscribe.predicate, or None if
+            good_value is any other callable that can only run locally
+    """
+    if isinstance(good_value, GreaterOrEqual):
+        predicate = {GREATER_OR_EQUAL: good_value.value}
+    elif isinstance(good_value, OneOf):
+        predicate = {IN: good_value.values}
+    elif callable(good_value):
+        return None
+    else:
+        predicate = {EQUALS: good_value}
+    if bad_values:
+        predicate[BAD_VALUES] = list(bad_values)
+    return predicate
+
+
+def validate_predicate(predicate):
+    """Check that a predicate has exactly one test and nothing else unknown
+
+    Args:
+        predicate (dict): {test: operand} from a Subscribe
+
+    Returns:
+        dict: The predicate
+    """
+    assert isinstance(predicate, dict), \
+        "Expected predicate to be a dict, got %r" % (predicate,)
+    tests = [k for k in predicate if k in TESTS]
+    assert len(tests) == 1, \
+        "Expected one of %s in predicate, got %r" % (TESTS, predicate)
+    unknown = set(predicate) - set(TESTS) - {BAD_VALUES}
+    assert not unknown, "Unknown predicate fields %s" % sorted(unknown)
+    return predicate
+
+
+def check_predicate(predicate, value):
+    """Check a serialized value against a predicate
+
+    Args:
+        predicate (dict): {test: operand} from a Subscribe
+        value (object): The serialized value
+
+    Returns:
+        bool: True if the value satisfies the predicate
+
+    Raises:
+        BadValueError: If the value is one of the predicate's badValues
+    """
+    bad_values = predicate.get(BAD_VALUES, None)
+    if bad_values and value in bad_values:
+        raise BadValueError("Waiting for %r, got %r" % (predicate, value))
+    if EQUALS in predicate:
+        return value == predicate[EQUALS]
+    elif GREATER_OR_EQUAL in predicate:
+        return value is not None and value >= predicate[GREATER_OR_EQUAL]
+    else:
+        return value in predicate[IN]
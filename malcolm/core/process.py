@@ -1,14 +1,18 @@
-from multiprocessing.pool import ThreadPool
 import inspect
 
 from malcolm.compat import OrderedDict, maybe_import_cothread, \
     get_pool_num_threads
 from .context import Context
+from .eventloop import get_event_loop
 from .hook import Hook, get_hook_decorated
 from .loggable import Loggable
+from .patternsubscription import PatternSubscription
+from .request import Subscribe, Unsubscribe
 from .spawned import Spawned
+from .spawnlane import SpawnLane, CONTROL_LANE, HOOK_LANE, BACKGROUND_LANE, \
+    LOOP_LANE
 from .rlock import RLock
-from .errors import WrongThreadError
+from .errors import WrongThreadError, UnexpectedError
 
 
 # Clear spawned handles after how many spawns?
@@ -37,10 +41,33 @@ class Process(Loggable):
         self._cothread = maybe_import_cothread()
         self._controllers = OrderedDict()  # mri -> Controller
         self._published = []  # [mri] for publishable controllers
+        # {Subscribe.generate_key(): PatternSubscription}
+        self._pattern_subscriptions = OrderedDict()
         self.started = False
         self._spawned = []
         self._spawn_count = 0
-        self._thread_pool = None
+        # The shared asyncio EventLoop if PYMALCOLM_USE_ASYNCIO, else None
+        self._event_loop = get_event_loop()
+        # {lane: SpawnLane}, splitting get_pool_num_threads() between them.
+        # The control lane is smaller as its requests are short, and it only
+        # needs to be free when the others are busy
+        num_threads = get_pool_num_threads()
+        control = max(2, num_threads // 8)
+        if self._event_loop:
+            # Short functions run in the loop's thread, so the background
+            # lane can be as small as the control lane. Hooked functions
+            # block their threads waiting for their children, so the hook
+            # lane gets everything else
+            background = control
+            hook = num_threads - 1 - control - background
+        else:
+            hook = (num_threads - control) // 2
+            background = num_threads - control - hook
+        self._lanes = OrderedDict()
+        for lane, n in ((CONTROL_LANE, control),
+                        (HOOK_LANE, hook),
+                        (BACKGROUND_LANE, background)):
+            self._lanes[lane] = SpawnLane(lane, n)
         self._lock = RLock()
         self._hooked_func_names = {}
         self._hook_names = {}
@@ -78,7 +105,8 @@ class Process(Loggable):
             func_name = self._hooked_func_names[hook].get(controller, None)
             if func_name:
                 func = getattr(controller, func_name)
-                spawned.append(controller.spawn(func, *args))
+                spawned.append(self.spawn(
+                    func, args, {}, controller.use_cothread, HOOK_LANE))
         for s in spawned:
             s.wait(timeout)
 
@@ -98,13 +126,13 @@ class Process(Loggable):
         self._spawned = []
         self._controllers = OrderedDict()
         self._published = []
+        self._pattern_subscriptions = OrderedDict()
         self.started = False
-        if self._thread_pool:
-            self._thread_pool.close()
-            self._thread_pool.join()
-            self._thread_pool = None
+        for lane in self._lanes.values():
+            lane.close()
 
-    def spawn(self, function, args, kwargs, use_cothread):
+    def spawn(self, function, args, kwargs, use_cothread,
+              lane=BACKGROUND_LANE):
         """Runs the function in a worker thread, returning a Result object
 
         Args:
@@ -112,13 +140,16 @@ class Process(Loggable):
             args: Positional arguments to run the function with
             kwargs: Keyword arguments to run the function with
             use_cothread (bool): Whether to try and run this as a cothread
+            lane (str): If run in a thread, which lane's pool to use. One of
+                CONTROL_LANE, HOOK_LANE or BACKGROUND_LANE, or LOOP_LANE to
+                run on the shared EventLoop if there is one
 
         Returns:
             Spawned: Something you can call wait(timeout) on to see when it's
                 finished executing
         """
         return self._call_in_right_thread(
-            self._spawn, function, args, kwargs, use_cothread)
+            self._spawn, function, args, kwargs, use_cothread, lane)
 
     def _call_in_right_thread(self, func, *args):
         try:
@@ -127,14 +158,18 @@ class Process(Loggable):
             # called from outside cothread's thread, spawn it again
             return self._cothread.CallbackResult(func, *args)
 
-    def _spawn(self, function, args, kwargs, use_cothread):
+    def _spawn(self, function, args, kwargs, use_cothread, lane):
         with self._lock:
             assert self.started, "Can't spawn before process started"
-            if self._thread_pool is None:
-                if not self._cothread or not use_cothread:
-                    self._thread_pool = ThreadPool(get_pool_num_threads())
+            if lane != LOOP_LANE:
+                thread_pool = self._lanes[lane]
+            elif self._event_loop:
+                thread_pool = self._event_loop
+                use_cothread = False
+            else:
+                thread_pool = self._lanes[BACKGROUND_LANE]
             spawned = Spawned(
-                function, args, kwargs, use_cothread, self._thread_pool)
+                function, args, kwargs, use_cothread, thread_pool)
             self._spawned.append(spawned)
             self._spawn_count += 1
             # Filter out things that are ready to avoid memory leaks
@@ -146,6 +181,52 @@ class Process(Loggable):
         self._spawn_count = 0
         self._spawned = [s for s in self._spawned if not s.ready()]
 
+    def lane_stats(self):
+        """Get the thread count and queue depth of each spawn lane. Functions
+        run as cothreads don't use a lane so aren't counted. LOOP_LANE is
+        only included if there is a shared EventLoop
+
+        Returns:
+            OrderedDict: {lane: {name: value}} for threads, queued, maxQueued,
+                running and total
+        """
+        stats = OrderedDict()
+        for lane, spawn_lane in self._all_lanes():
+            stats[lane] = spawn_lane.stats()
+        return stats
+
+    def spawn_timings(self):
+        """Get percentiles of how long the most recent functions spawned in
+        each lane waited for a thread, and how long they ran for
+
+        Returns:
+            list: [(lane, name, count, wait_p50, wait_p99, run_p50, run_p99)]
+                with times in seconds, for each function name in each lane
+        """
+        timings = []
+        for lane, spawn_lane in self._all_lanes():
+            for summary in spawn_lane.timings.summary():
+                timings.append((lane,) + summary)
+        return timings
+
+    def running_spawns(self):
+        """Get the spawned functions that are running in a lane now
+
+        Returns:
+            list: [(lane, name, start_time)] with the one that has been running
+                longest first
+        """
+        running = []
+        for lane, spawn_lane in self._all_lanes():
+            running += [(lane,) + r for r in spawn_lane.timings.running()]
+        return sorted(running, key=lambda r: r[2])
+
+    def _all_lanes(self):
+        for lane, spawn_lane in self._lanes.items():
+            yield lane, spawn_lane
+        if self._event_loop:
+            yield LOOP_LANE, self._event_loop
+
     def add_controller(self, mri, controller, publish=True, timeout=None):
         """Add a controller to be hosted by this process
 
@@ -170,8 +251,13 @@ class Process(Loggable):
                     "Controller %s func %s not hooked into %s" % (
                         mri, func_name, self)
                 self._hooked_func_names[hook][controller] = func_name
+            subscriptions = []
             if publish:
                 self._published.append(mri)
+                subscriptions = [s for s in self._pattern_subscriptions.values()
+                                 if s.matches(mri)]
+        for subscription in subscriptions:
+            subscription.add_controller(controller)
         if self.started:
             self._run_hook(self.Init, [controller], timeout=timeout)
             self._run_hook(self.Publish, args=(self._published,),
@@ -194,11 +280,74 @@ class Process(Loggable):
                 d.pop(controller, None)
             if mri in self._published:
                 self._published.remove(mri)
+            subscriptions = list(self._pattern_subscriptions.values())
+        for subscription in subscriptions:
+            subscription.remove_controller(controller)
         if self.started:
             self._run_hook(self.Publish, args=(self._published,),
                            timeout=timeout)
             self._run_hook(self.Halt, [controller], timeout=timeout)
 
+    def handle_request(self, request):
+        """Handle a Subscribe to a path whose first element is a glob pattern
+        of mris, like ["*", "health", "value"], or the Unsubscribe for it.
+        Responses are Deltas whose paths start with the mri of each matching
+        published Block, including those added later. Any other request, or
+        a Subscribe with tableDeltas, predicate or fromRevision, gets an
+        Error response.
+
+        Only a single path is supported. To watch several different paths,
+        send one Subscribe per path, as a list of paths would change the
+        Subscribe wire format
+
+        Args:
+            request (Request): The Subscribe or Unsubscribe
+
+        Returns:
+            Spawned: Something you can call wait(timeout) on to see when it's
+                finished executing
+        """
+        return self._call_in_right_thread(self._handle_request, request)
+
+    def _handle_request(self, request):
+        key = request.generate_key()
+        with self._lock:
+            if isinstance(request, Subscribe) and (
+                    request.tableDeltas or request.predicate is not None or
+                    request.fromRevision is not None):
+                # These only make sense for a single Block
+                error = UnexpectedError(
+                    "Pattern Subscribes can't use tableDeltas, predicate or "
+                    "fromRevision, got %s" % (request,))
+                cb, response = request.error_response(error)
+                return self.spawn(cb, (response,), {}, True)
+            elif isinstance(request, Subscribe):
+                subscription = PatternSubscription(
+                    request, lambda func: self.spawn(func, (), {}, True))
+                self._pattern_subscriptions[key] = subscription
+                controllers = [self._controllers[mri] for mri in
+                               self._published if subscription.matches(mri)]
+                return self.spawn(subscription.subscribe, (controllers,), {},
+                                  True)
+            elif isinstance(request, Unsubscribe) and \
+                    key in self._pattern_subscriptions:
+                subscription = self._pattern_subscriptions.pop(key)
+                controllers = dict(self._controllers)
+            elif isinstance(request, Unsubscribe):
+                error = UnexpectedError(
+                    "No pattern subscription for %s" % (request,))
+                cb, response = request.error_response(error)
+                return self.spawn(cb, (response,), {}, True)
+            else:
+                error = UnexpectedError(
+                    "Can only Subscribe to a pattern of mris, not %s" % (
+                        request,))
+                cb, response = request.error_response(error)
+                return self.spawn(cb, (response,), {}, True)
+        subscription.unsubscribe(controllers)
+        cb, response = subscription.request.return_response()
+        return self.spawn(cb, (response,), {}, True)
+
     @property
     def mri_list(self):
         return list(self._controllers)
@@ -1,7 +1,8 @@
 import signal
 
 from malcolm.compat import queue, maybe_import_cothread, get_thread_ident
-from .errors import TimeoutError
+from .errors import TimeoutError, WrongThreadError
+from .eventloop import in_event_loop_thread
 
 
 class Queue(object):
@@ -26,6 +27,14 @@ class Queue(object):
     def get(self, timeout=None):
         if self.cothread is None:
             # No cothread, this is a queue.Queue()
+            if timeout != 0 and in_event_loop_thread():
+                # Blocking here would stop the very loop that might put to
+                # us, so only take what is already there
+                try:
+                    return self._queue.get_nowait()
+                except queue.Empty:
+                    raise WrongThreadError(
+                        "Can't block the event loop waiting on a Queue")
             if self.user_facing and timeout is None:
                 # If user facing then need to make it interruptable
                 # http://stackoverflow.com/a/212975
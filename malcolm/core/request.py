@@ -1,6 +1,7 @@
 import logging
 
-from malcolm.compat import OrderedDict, str_
+from malcolm.compat import OrderedDict, str_, long_
+from .predicate import validate_predicate
 from .response import Return, Error, Update, Delta
 from .serializable import Serializable, deserialize_object, serialize_object, \
     json_encode
@@ -140,6 +141,42 @@ class Put(PathRequest):
         self.value = serialize_object(value)
 
 
+@Serializable.register_subclass("malcolm:core/PutMany:1.0")
+class PutMany(PathRequest):
+    """Create a PutMany Request object to put to several attributes of a
+    Block at once"""
+
+    endpoints = ["id", "path", "values"]
+    __slots__ = []
+
+    values = None
+
+    def __init__(self, id=None, path=(), values=None, callback=None):
+        """
+        Args:
+            id (int): Unique identifier for request
+            path (list): [`str`] Path to target Block, just [mri]
+            values (dict): {attr_name: value} to put to the value of each
+                attribute
+            callback (callable): Callback for when the response is available
+        """
+        super(PutMany, self).__init__(id, path, callback)
+        self.set_values(values)
+
+    def set_values(self, values):
+        """Values to Put to each attribute
+
+        Args:
+            values (dict): {attr_name: value} to put to the value of each
+                attribute
+        """
+        if values is None:
+            values = {}
+        self.values = OrderedDict(
+            (deserialize_object(k, str_), serialize_object(v))
+            for k, v in values.items())
+
+
 @Serializable.register_subclass("malcolm:core/Post:1.0")
 class Post(PathRequest):
     """Create a Post Request object"""
@@ -177,21 +214,58 @@ class Post(PathRequest):
 class Subscribe(PathRequest):
     """Create a Subscribe Request object"""
 
-    endpoints = ["id", "path", "delta"]
+    endpoints = ["id", "path", "delta", "minInterval", "fromRevision",
+                 "predicate", "tableDeltas"]
     __slots__ = []
 
     delta = None
-
-    def __init__(self, id=None, path=(), delta=False, callback=None):
+    minInterval = None
+    fromRevision = None
+    predicate = None
+    tableDeltas = None
+
+    def __init__(self, id=None, path=(), delta=False, callback=None,
+                 minInterval=None, fromRevision=None, predicate=None,
+                 tableDeltas=False):
         """Args:
             id (int): Unique identifier for request
             path (list): [`str`] Path to target Block substructure
             delta (bool): Notify of differences only (default False)
             callback (callable): Callback for when the response is available
+            minInterval (float): If given, conflate changes so that responses
+                are sent at most once per minInterval seconds
+            fromRevision (int): If given, the revision of the last Delta
+                already received, or 0 if none. Deltas will then carry the
+                revision, and if the server still has the changes since
+                fromRevision then only those will be sent initially
+            predicate (dict): If given, {test: operand} where test is one of
+                "equals", "greaterOrEqual" or "in", with optional
+                "badValues": [values]. Only an Update with a value that passes
+                the test or is a bad value will be sent, followed by a Return
+                that ends the subscription
+            tableDeltas (bool): If True and delta, then when only some rows of
+                a table change, send [path, {name: new column values}, [start,
+                stop]] meaning rows [start:stop] were replaced by the new
+                values. Columns that didn't change are left out if the number
+                of rows didn't change
         """
 
         super(Subscribe, self).__init__(id, path, callback)
         self.set_delta(delta)
+        self.set_minInterval(minInterval)
+        self.set_fromRevision(fromRevision)
+        self.set_predicate(predicate)
+        self.set_tableDeltas(tableDeltas)
+
+    def to_dict(self):
+        d = super(Subscribe, self).to_dict()
+        # Optional, so only send them if set so older servers understand us
+        for endpoint in ("minInterval", "fromRevision", "predicate"):
+            if d[endpoint] is None:
+                d.pop(endpoint)
+        if not d["tableDeltas"]:
+            d.pop("tableDeltas")
+        return d
 
     def set_delta(self, delta):
         """Whether to ask for delta responses or not
@@ -201,22 +275,72 @@ class Subscribe(PathRequest):
         """
         self.delta = deserialize_object(delta, bool)
 
-    def update_response(self, value):
+    def set_minInterval(self, minInterval):
+        """Set the minimum time between responses
+
+        Args:
+            minInterval (float): Minimum time in seconds between responses,
+                None for no limit
+        """
+        if minInterval is not None:
+            minInterval = float(deserialize_object(minInterval, (int, float)))
+            assert minInterval >= 0, \
+                "minInterval must not be negative, got %s" % minInterval
+        self.minInterval = minInterval
+
+    def set_fromRevision(self, fromRevision):
+        """Set the revision of the last Delta already received
+
+        Args:
+            fromRevision (int): Revision number, 0 if nothing received yet,
+                None if revisions are not wanted
+        """
+        if fromRevision is not None:
+            fromRevision = deserialize_object(fromRevision, (int, long_))
+        self.fromRevision = fromRevision
+
+    def set_tableDeltas(self, tableDeltas):
+        """Whether to ask for changes to table rows rather than whole tables
+
+        Args:
+            tableDeltas (bool): If True then send row changes in Deltas
+        """
+        self.tableDeltas = deserialize_object(tableDeltas, bool)
+
+    def set_predicate(self, predicate):
+        """Set the test that values must pass to be sent
+
+        Args:
+            predicate (dict): {test: operand} as described in __init__, None
+                to send every value
+        """
+        if predicate is not None:
+            assert not self.delta, "Can't use a predicate with delta"
+            predicate = validate_predicate(predicate)
+        self.predicate = predicate
+
+    def update_response(self, value, encoded_payload=None):
         """Create an Update Response object to handle the request
 
         Args:
             value: Serialized new value
+            encoded_payload (EncodedPayload): If given, the shared JSON
+                encoding of value
         """
         response = Update(id=self.id, value=value)
+        response.encoded_payload = encoded_payload
         return self.callback, response
 
-    def delta_response(self, changes):
+    def delta_response(self, changes, encoded_payload=None):
         """Create a Delta Response object to handle the request
 
         Args:
             changes (list): list of [[path], value] pairs for changed values
+            encoded_payload (EncodedPayload): If given, the shared JSON
+                encoding of changes
         """
         response = Delta(id=self.id, changes=changes)
+        response.encoded_payload = encoded_payload
         return self.callback, response
 
 
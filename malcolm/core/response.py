@@ -1,5 +1,43 @@
-from malcolm.compat import str_
-from .serializable import Serializable, deserialize_object, serialize_object
+from malcolm.compat import str_, long_
+from .serializable import Serializable, deserialize_object, \
+    serialize_object, json_encode, binary_encode, binary_encode_parts, \
+    binary_pack, json_splice
+
+
+class EncodedPayload(object):
+    """The serialized payload of an Update or Delta, JSON encoded on first
+    use and then shared by the Responses of every subscriber it is sent to"""
+
+    __slots__ = ["payload", "_encoded", "_binary_parts"]
+
+    def __init__(self, payload):
+        """
+        Args:
+            payload: Serialized value or changes of the Response
+        """
+        self.payload = payload
+        self._encoded = None
+        self._binary_parts = None
+
+    def encode(self):
+        """Return the JSON encoded payload, encoding it if not already done
+
+        Returns:
+            str: JSON encoded payload
+        """
+        if self._encoded is None:
+            self._encoded = json_encode(self.payload)
+        return self._encoded
+
+    def encode_binary_parts(self):
+        """Return the binary encoded payload, encoding it if not already done
+
+        Returns:
+            tuple: (JSON text, [bytes]) as for binary_encode_parts()
+        """
+        if self._binary_parts is None:
+            self._binary_parts = binary_encode_parts(self.payload)
+        return self._binary_parts
 
 
 class Response(Serializable):
@@ -16,6 +54,22 @@ class Response(Serializable):
         """
         self.set_id(id)
 
+    def to_json(self):
+        """JSON encode this Response
+
+        Returns:
+            str: The same as json_encode(self)
+        """
+        return json_encode(self)
+
+    def to_binary(self):
+        """Binary encode this Response
+
+        Returns:
+            bytes: The same as binary_encode(self)
+        """
+        return binary_encode(self)
+
     def set_id(self, id):
         """Set the identifier for the response
 
@@ -88,6 +142,8 @@ class Update(Response):
     __slots__ = []
 
     value = None
+    # EncodedPayload of value shared with other subscribers
+    encoded_payload = None
 
     def __init__(self, id=None, value=None):
         """
@@ -106,25 +162,71 @@ class Update(Response):
         """
         self.value = value
 
+    def to_json(self):
+        if self.encoded_payload is None:
+            return json_encode(self)
+        return self._splice(self.encoded_payload.encode())
+
+    def to_binary(self):
+        if self.encoded_payload is None:
+            return binary_encode(self)
+        text, buffers = self.encoded_payload.encode_binary_parts()
+        return binary_pack(self._splice(text), buffers)
+
+    def _splice(self, encoded):
+        # Splice our id into the shared encoding of the value
+        return json_splice([("typeid", json_encode(self.typeid)),
+                            ("id", json_encode(self.id)),
+                            ("value", encoded)])
+
+
+def splice_table_rows(table, start, stop, columns):
+    """Replace rows [start:stop] of a serialized table in place
+
+    Args:
+        table (dict): {name: [value for each row]} for each column
+        start (int): Index of the first row to replace
+        stop (int): Index after the last row to replace
+        columns (dict): {name: [value for each new row]}. Columns that aren't
+            given keep their values
+    """
+    for name, values in columns.items():
+        column = list(table[name])
+        column[start:stop] = values
+        table[name] = column
+
 
 @Serializable.register_subclass("malcolm:core/Delta:1.0")
 class Delta(Response):
     """Create a Delta Response object with the provided parameters"""
 
-    endpoints = ["id", "changes"]
+    endpoints = ["id", "changes", "revision"]
     __slots__ = []
 
     changes = None
+    revision = None
+    # EncodedPayload of changes shared with other subscribers
+    encoded_payload = None
 
-    def __init__(self, id=None, changes=None):
+    def __init__(self, id=None, changes=None, revision=None):
         """
         Args:
             id (int): ID that the Request was sent with
             changes (list): list of [[path], value] pairs for changed values
+            revision (int): If the Subscribe asked for it, the revision of the
+                Block after these changes
         """
 
         super(Delta, self).__init__(id)
         self.set_changes(changes)
+        self.set_revision(revision)
+
+    def to_dict(self):
+        d = super(Delta, self).to_dict()
+        # Optional, so only send it if set so older clients understand us
+        if d["revision"] is None:
+            d.pop("revision")
+        return d
 
     def set_changes(self, changes):
         """Set the change set for the Request, should already be serialized
@@ -134,11 +236,47 @@ class Delta(Response):
         """
         self.changes = changes
 
+    def set_revision(self, revision):
+        """Set the revision of the Block after these changes
+
+        Args:
+            revision (int): Revision number, None if not requested
+        """
+        if revision is not None:
+            revision = deserialize_object(revision, (int, long_))
+        self.revision = revision
+
+    def to_json(self):
+        if self.encoded_payload is None:
+            return json_encode(self)
+        return self._splice(self.encoded_payload.encode())
+
+    def to_binary(self):
+        if self.encoded_payload is None:
+            return binary_encode(self)
+        text, buffers = self.encoded_payload.encode_binary_parts()
+        return binary_pack(self._splice(text), buffers)
+
+    def _splice(self, encoded):
+        # Splice our id into the shared encoding of the changes
+        items = [("typeid", json_encode(self.typeid)),
+                 ("id", json_encode(self.id)),
+                 ("changes", encoded)]
+        if self.revision is not None:
+            items.append(("revision", json_encode(self.revision)))
+        return json_splice(items)
+
     def apply_changes_to(self, d):
         """Apply the changes to a dict like object"""
         for change in self.changes:
             path = change[0]
-            if path:
+            if len(change) == 3:
+                # Replace some rows of a serialized table
+                o = d
+                for p in path:
+                    o = o[p]
+                splice_table_rows(o, change[2][0], change[2][1], change[1])
+            elif path:
                 o = d
                 # Update a sub-element
                 for p in path[:-1]:
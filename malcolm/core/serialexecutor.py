@@ -0,0 +1,146 @@
+import logging
+import threading
+from collections import deque
+
+from malcolm.compat import get_thread_ident
+from .queue import Queue
+
+
+# Create a module level logger
+log = logging.getLogger(__name__)
+
+
+# Maximum number of items to pass to handle_batch() at once
+MAX_BATCH = 100
+
+
+class Completion(object):
+    """Lightweight handle for an item submitted to a SerialExecutor, with the
+    same wait(), ready() and get() as Spawned. The Queue to wait on is only
+    made if someone waits before the item has been handled"""
+
+    __slots__ = ["_lock", "_done", "_queue"]
+
+    def __init__(self, lock):
+        self._lock = lock
+        self._done = False
+        self._queue = None
+
+    def set_done(self):
+        """Mark as handled, waking anyone who is waiting"""
+        with self._lock:
+            self._done = True
+            queue = self._queue
+        if queue:
+            queue.put(None)
+
+    def wait(self, timeout=None):
+        # Only one person can wait on this at a time
+        with self._lock:
+            if self._done:
+                return
+            if self._queue is None:
+                self._queue = Queue()
+            queue = self._queue
+        queue.get(timeout)
+        # Allow the next waiter to wait too
+        queue.put(None)
+
+    def ready(self):
+        return self._done
+
+    def get(self, timeout=None):
+        self.wait(timeout)
+
+
+class SerialExecutor(object):
+    """Handles items in the order they were submitted, in batches, one batch
+    at a time. A worker is spawned when an item is submitted to an idle
+    executor, and handles everything queued up to that point as a batch, so
+    a burst of items only costs a single spawn. The callbacks of a batch are
+    all called before the next batch is handled, so responses are delivered
+    in the order the items were submitted"""
+
+    def __init__(self, spawn, handle_batch, handle_error):
+        """
+        Args:
+            spawn (callable): spawn(function) that runs function in a worker
+                thread or cothread
+            handle_batch (callable): handle_batch(items) that handles a list
+                of items in order, returning [(callback, response)] to call
+            handle_error (callable): handle_error(item, exception) that
+                returns [(callback, response)] to call when handling an item
+                raised
+        """
+        self._spawn = spawn
+        self._handle_batch = handle_batch
+        self._handle_error = handle_error
+        self._lock = threading.Lock()
+        # deque([(item, Completion)])
+        self._items = deque()
+        self._working = False
+        # (thread ident, worker token) of the worker calling callbacks
+        self._notifying = None
+
+    def submit(self, item):
+        """Queue an item to be handled. Called from any thread
+
+        Args:
+            item: The item to pass to handle_batch()
+
+        Returns:
+            Completion: that can be waited on for the item to be handled and
+                its callbacks called
+        """
+        completion = Completion(self._lock)
+        with self._lock:
+            self._items.append((item, completion))
+            if not self._working:
+                spawn = self._working = True
+            elif self._notifying and \
+                    self._notifying[0] == get_thread_ident():
+                # A callback is submitting, and may wait for the item to be
+                # handled, so hand over to the next worker now rather than
+                # after the rest of the callbacks
+                self._notifying = None
+                spawn = True
+            else:
+                spawn = False
+        if spawn:
+            self._spawn(self._work)
+        return completion
+
+    def _work(self):
+        token = object()
+        with self._lock:
+            batch = [self._items.popleft() for _ in
+                     range(min(len(self._items), MAX_BATCH))]
+        try:
+            responses = self._handle_batch([item for item, _ in batch])
+        except Exception:
+            # Handle them one at a time so only the ones that fail get errors
+            log.exception("Exception handling batch %s", batch)
+            responses = []
+            for item, _ in batch:
+                try:
+                    responses += self._handle_batch([item])
+                except Exception as e:
+                    responses += self._handle_error(item, e)
+        with self._lock:
+            self._notifying = (get_thread_ident(), token)
+        for cb, response in responses:
+            try:
+                cb(response)
+            except Exception:
+                # Carry on so the rest of the batch still get their responses
+                log.exception("Exception notifying %s", response)
+        for _, completion in batch:
+            completion.set_done()
+        with self._lock:
+            if self._notifying is None or self._notifying[1] is not token:
+                # A callback has already handed over to the next worker
+                return
+            self._notifying = None
+            spawn = self._working = bool(self._items)
+        if spawn:
+            self._spawn(self._work)
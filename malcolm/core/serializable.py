@@ -1,36 +1,176 @@
 import re
+import inspect
 import logging
 import json
+import struct
 
 import numpy as np
 
-from malcolm.compat import OrderedDict
+from malcolm.compat import OrderedDict, long_
+from .jsonbackend import choose_json_backend
 
 # Create a module level logger
 log = logging.getLogger(__name__)
 
 camel_re = re.compile(r"[a-z][a-z0-9]*([A-Z][a-z0-9]*)*")
+identifier_re = re.compile(r"[A-Za-z_][A-Za-z0-9_]*$")
+
+# Key of the dict that binary_encode() puts in place of an array
+ndarray_key = "__ndarray__"
+
+# numpy dtype kinds that binary_encode() sends as raw buffers
+raw_dtype_kinds = "biuf"
+
+# The fastest JSON backend available, picked at import time
+json_backend = choose_json_backend()
+
+# Types that serialize to themselves, so don't need a to_dict() lookup
+plain_types = frozenset([str, type(u""), int, long_, float, bool, type(None)])
 
 
 def json_encode(o, indent=None):
-    s = json.dumps(o, default=serialize_hook, indent=indent)
+    if indent is None:
+        s = json_backend.encode(o, serialize_hook)
+    else:
+        # Only used for saving files, so keep their format the same
+        s = json.dumps(o, default=serialize_hook, indent=indent)
     return s
 
 
 def json_decode(s):
-    o = json.loads(s, object_pairs_hook=OrderedDict)
+    o = json_backend.decode(s)
+    return o
+
+
+def json_splice(items):
+    """Make the JSON text of an object from keys and already encoded values,
+    formatted as json_encode() would have done
+
+    Args:
+        items (list): [(key, JSON text of value)]
+
+    Returns:
+        str: JSON text of the object
+    """
+    return "{%s}" % json_backend.item_separator.join(
+        json_encode(k) + json_backend.key_separator + v for k, v in items)
+
+
+def binary_encode(o):
+    """Encode as a binary frame of JSON with numpy arrays as raw buffers
+
+    Args:
+        o: Object to encode, as for json_encode()
+
+    Returns:
+        bytes: The frame that binary_decode() will turn back into o
+    """
+    text, buffers = binary_encode_parts(o)
+    return binary_pack(text, buffers)
+
+
+def binary_encode_parts(o):
+    """JSON encode, replacing numeric numpy arrays with placeholders
+
+    Args:
+        o: Object to encode, as for json_encode()
+
+    Returns:
+        tuple: (JSON text, [bytes]) where the placeholder for an array is
+            {"__ndarray__": index into buffers, "dtype": str, "shape": list}
+    """
+    buffers = []
+
+    def hook(o):
+        if isinstance(o, np.ndarray) and o.dtype.kind in raw_dtype_kinds:
+            placeholder = OrderedDict()
+            placeholder[ndarray_key] = len(buffers)
+            placeholder["dtype"] = o.dtype.str
+            placeholder["shape"] = list(o.shape)
+            buffers.append(o.tobytes())
+            return placeholder
+        else:
+            return serialize_hook(o)
+
+    text = json.dumps(o, default=hook, separators=(
+        json_backend.item_separator, json_backend.key_separator))
+    return text, buffers
+
+
+def binary_pack(text, buffers):
+    """Pack JSON text and buffers into a frame. This is a little endian
+    uint32 count of parts, then a (uint32 offset, uint32 length) for each
+    part. The first part is the UTF-8 JSON text, the rest are the buffers,
+    each starting on an 8 byte boundary so they can be used in place
+
+    Args:
+        text (str): JSON text from binary_encode_parts()
+        buffers (list): [bytes] from binary_encode_parts()
+
+    Returns:
+        bytes: The packed frame
+    """
+    if not isinstance(text, bytes):
+        text = text.encode("utf-8")
+    parts = [text] + buffers
+    offset = 4 + 8 * len(parts)
+    table = []
+    chunks = []
+    for part in parts:
+        padding = -offset % 8
+        chunks.append(b"\0" * padding)
+        offset += padding
+        table += [offset, len(part)]
+        chunks.append(part)
+        offset += len(part)
+    header = struct.pack("<%dI" % (1 + len(table)), len(parts), *table)
+    return header + b"".join(chunks)
+
+
+def binary_decode(data):
+    """Decode a frame made by binary_encode(). Arrays are made with
+    np.frombuffer so they share memory with data rather than being copied
+
+    Args:
+        data (bytes): The frame
+
+    Returns:
+        The decoded object, with dicts as OrderedDicts like json_decode()
+    """
+    n_parts = struct.unpack_from("<I", data)[0]
+    table = struct.unpack_from("<%dI" % (2 * n_parts), data, 4)
+    offset, length = table[:2]
+    text = data[offset:offset + length].decode("utf-8")
+
+    def hook(pairs):
+        if pairs and pairs[0][0] == ndarray_key:
+            d = dict(pairs)
+            dtype = np.dtype(str(d["dtype"]))
+            offset, length = table[2 + 2 * d[ndarray_key]:][:2]
+            if length:
+                array = np.frombuffer(
+                    data, dtype, length // dtype.itemsize, offset)
+            else:
+                array = np.zeros(0, dtype)
+            if not dtype.isnative:
+                array = array.astype(dtype.newbyteorder("="))
+            return array.reshape(d["shape"])
+        else:
+            return OrderedDict(pairs)
+
+    o = json.loads(text, object_pairs_hook=hook)
     return o
 
 
 def serialize_hook(o):
-    o = serialize_object(o)
+    # Check for numpy first as it is cheaper than failing to find to_dict()
     if isinstance(o, (np.number, np.bool_)):
         return o.tolist()
     elif isinstance(o, np.ndarray):
         assert len(o.shape) == 1, "Expected 1d array, got {}".format(o.shape)
         return o.tolist()
     else:
-        return o
+        return serialize_object(o)
 
 
 def check_camel_case(name):
@@ -69,6 +209,8 @@ def snake_to_camel(name):
 
 
 def serialize_object(o):
+    if type(o) in plain_types:
+        return o
     try:
         # This will do all the sub layers for us
         return o.to_dict()
@@ -114,6 +256,70 @@ def deserialize_object(ob, type_check=None):
     return ob
 
 
+def compile_to_dict(cls):
+    """Make a to_dict function specialised for the endpoints of a class,
+    checking they are camelCase once rather than on every call
+
+    Args:
+        cls (type): Serializable subclass with typeid set
+
+    Returns:
+        callable: to_dict(self) function, or None if endpoints are not fixed
+            at the class level
+    """
+    endpoints = cls.endpoints
+    if not isinstance(endpoints, (list, tuple)):
+        # e.g. a property, so could be different for every instance
+        return None
+    lines = ["def to_dict(self):",
+             "    d = OrderedDict()",
+             "    d['typeid'] = typeid"]
+    for endpoint in endpoints:
+        check_camel_case(endpoint)
+        assert identifier_re.match(endpoint), \
+            "Endpoint %r of %s is not an identifier" % (endpoint, cls)
+        lines.append("    d[%r] = serialize_object(self.%s)" % (
+            endpoint, endpoint))
+    lines.append("    return d")
+    namespace = dict(OrderedDict=OrderedDict, typeid=cls.typeid,
+                     serialize_object=serialize_object)
+    exec("\n".join(lines), namespace)
+    return namespace["to_dict"]
+
+
+def compile_from_dict(cls):
+    """Make a from_dict function specialised for the endpoints of a class,
+    that passes a dict with exactly those keys straight to the constructor
+
+    Args:
+        cls (type): Serializable subclass with typeid set
+
+    Returns:
+        callable: from_dict(d) function returning the instance, or None if d
+            has other keys so needs the generic path. None if the endpoints
+            are not fixed at the class level or aren't all constructor args
+    """
+    endpoints = cls.endpoints
+    if not isinstance(endpoints, (list, tuple)):
+        return None
+    if cls.__init__ is object.__init__:
+        args, keywords = [], None
+    else:
+        args, _, keywords, _ = inspect.getargspec(cls.__init__)
+    if keywords is None and not set(endpoints).issubset(args):
+        return None
+    tests = ["len(d) == %d" % (len(endpoints) + 1),
+             "d.get('typeid') == typeid"]
+    tests += ["%r in d" % endpoint for endpoint in endpoints]
+    kwargs = ", ".join("%s=d[%r]" % (e, e) for e in endpoints)
+    lines = ["def from_dict(d):",
+             "    if %s:" % " and ".join(tests),
+             "        return cls(%s)" % kwargs]
+    namespace = dict(cls=cls, typeid=cls.typeid)
+    exec("\n".join(lines), namespace)
+    return namespace["from_dict"]
+
+
 class Serializable(object):
     """Mixin class for serializable objects"""
 
@@ -148,12 +354,16 @@ class Serializable(object):
         Returns:
             OrderedDict serialised version of self
         """
+        cls = type(self)
+        compiled = cls.__dict__.get("_compiled_to_dict", None)
+        if compiled and self.endpoints is cls.endpoints:
+            # Fixed endpoints, so use the one made in register_subclass()
+            return compiled(self)
 
         d = OrderedDict()
         d["typeid"] = self.typeid
 
         for endpoint in self.endpoints:
-            check_camel_case(endpoint)
             d[endpoint] = serialize_object(getattr(self, endpoint))
 
         return d
@@ -190,14 +400,20 @@ class Serializable(object):
         Returns:
             Instance of this class
         """
-        filtered = {}
-        for k, v in d.items():
-            if k == "typeid":
-                assert v == cls.typeid, \
-                    "Dict has typeid %s but %s has typeid %s" % \
-                    (v, cls, cls.typeid)
-            elif k not in ignore:
-                filtered[k] = v
+        compiled = cls.__dict__.get("_compiled_from_dict", None)
+        if compiled and not ignore:
+            # Use the one made in register_subclass() if d has the usual keys
+            inst = compiled(d)
+            if inst is not None:
+                return inst
+
+        filtered = dict(d)
+        typeid = filtered.pop("typeid", cls.typeid)
+        assert typeid == cls.typeid, \
+            "Dict has typeid %s but %s has typeid %s" % \
+            (typeid, cls, cls.typeid)
+        for k in ignore:
+            filtered.pop(k, None)
 
         inst = cls(**filtered)
         return inst
@@ -212,6 +428,8 @@ class Serializable(object):
         def decorator(subclass):
             cls._subcls_lookup[typeid] = subclass
             subclass.typeid = typeid
+            subclass._compiled_to_dict = compile_to_dict(subclass)
+            subclass._compiled_from_dict = compile_from_dict(subclass)
             return subclass
         return decorator
 
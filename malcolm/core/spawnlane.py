@@ -0,0 +1,205 @@
+from multiprocessing.pool import ThreadPool
+from collections import deque
+import inspect
+import itertools
+import threading
+import time
+
+from malcolm.compat import OrderedDict
+from .spawned import Spawned
+
+
+# Lanes that Process.spawn() can run functions in, each with its own pool of
+# threads so that work in one can never hold up another
+CONTROL_LANE = "control"
+"""For requests that interrupt other work, like abort, pause and disable"""
+
+HOOK_LANE = "hook"
+"""For hooked functions run by Controllers and the Process"""
+
+BACKGROUND_LANE = "background"
+"""For everything else"""
+
+LOOP_LANE = "loop"
+"""For short functions that never block. With PYMALCOLM_USE_ASYNCIO they run
+as callbacks on the shared EventLoop, otherwise they go in the background
+lane"""
+
+# How many of the most recent queue wait and run times to keep per function
+TIMING_SAMPLES = 1000
+
+
+def function_name(function):
+    """Get the name that the timings of a function are kept under, looking
+    through the catching_function of a Spawned to the function it calls
+
+    Args:
+        function (callable): The function passed to apply_async()
+
+    Returns:
+        str: Like "Controller._handle_request" for bound methods, or the
+            function name otherwise
+    """
+    spawned = getattr(function, "__self__", None)
+    if isinstance(spawned, Spawned):
+        function = spawned._function
+    name = getattr(function, "__name__", type(function).__name__)
+    obj = getattr(function, "__self__", None)
+    # Builtin functions in Python3 are bound to their module
+    if obj is not None and not inspect.ismodule(obj):
+        name = "%s.%s" % (type(obj).__name__, name)
+    return name
+
+
+def _percentile(sorted_samples, fraction):
+    return sorted_samples[int(round(fraction * (len(sorted_samples) - 1)))]
+
+
+class SpawnTimings(object):
+    """The most recent queue wait and run times of functions, grouped by
+    function name, and which functions are running now"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # {name: (count, deque(wait), deque(run))}
+        self._samples = OrderedDict()
+        # {token: (name, start_time)} in the order they started
+        self._running = OrderedDict()
+        self._tokens = itertools.count()
+
+    def started(self, name, submitted):
+        """Record that a function has started
+
+        Args:
+            name (str): The function_name() of the function
+            submitted (float): The time.time() it was submitted
+
+        Returns:
+            tuple: token to pass to finished()
+        """
+        now = time.time()
+        with self._lock:
+            token = next(self._tokens)
+            self._running[token] = (name, now)
+        return token, name, now - submitted, now
+
+    def finished(self, token):
+        """Record that a function has finished
+
+        Args:
+            token (tuple): The return value of started()
+        """
+        key, name, wait, start = token
+        run = time.time() - start
+        with self._lock:
+            self._running.pop(key, None)
+            try:
+                count, waits, runs = self._samples[name]
+            except KeyError:
+                waits = deque(maxlen=TIMING_SAMPLES)
+                runs = deque(maxlen=TIMING_SAMPLES)
+                count = 0
+            waits.append(wait)
+            runs.append(run)
+            self._samples[name] = (count + 1, waits, runs)
+
+    def running(self):
+        """Get the functions that are running now
+
+        Returns:
+            list: [(name, start_time)] with the oldest first
+        """
+        with self._lock:
+            return list(self._running.values())
+
+    def summary(self):
+        """Work out percentiles of the recorded times
+
+        Returns:
+            list: [(name, count, wait_p50, wait_p99, run_p50, run_p99)] in
+                seconds, for each function name that has finished
+        """
+        with self._lock:
+            samples = [(name, count, sorted(waits), sorted(runs))
+                       for name, (count, waits, runs) in self._samples.items()]
+        summary = []
+        for name, count, waits, runs in samples:
+            summary.append((
+                name, count, _percentile(waits, 0.5), _percentile(waits, 0.99),
+                _percentile(runs, 0.5), _percentile(runs, 0.99)))
+        return summary
+
+
+class SpawnLane(object):
+    """A ThreadPool with its own size limit that keeps count of how many
+    functions are waiting for a thread, and how many are running, and times
+    how long they waited and ran"""
+
+    def __init__(self, name, num_threads):
+        """
+        Args:
+            name (str): The name of the lane, like CONTROL_LANE
+            num_threads (int): Maximum number of threads in the pool
+        """
+        self.name = name
+        self.num_threads = num_threads
+        self._lock = threading.Lock()
+        self._thread_pool = None
+        # Number of functions waiting for a thread
+        self.queued = 0
+        # Biggest value that queued has reached
+        self.max_queued = 0
+        # Number of functions currently running
+        self.running = 0
+        # Total number of functions that have been submitted
+        self.total = 0
+        self.timings = SpawnTimings()
+
+    def apply_async(self, function):
+        """Run function in one of our threads, creating the pool if needed
+
+        Args:
+            function (callable): Function to call with no arguments
+        """
+        with self._lock:
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPool(self.num_threads)
+            self.queued += 1
+            self.total += 1
+            self.max_queued = max(self.max_queued, self.queued)
+            thread_pool = self._thread_pool
+        thread_pool.apply_async(
+            self._run, (function, function_name(function), time.time()))
+
+    def _run(self, function, name, submitted):
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        token = self.timings.started(name, submitted)
+        try:
+            function()
+        finally:
+            self.timings.finished(token)
+            with self._lock:
+                self.running -= 1
+
+    def stats(self):
+        """Return a snapshot of the counters
+
+        Returns:
+            dict: {name: value} for threads, queued, maxQueued, running, total
+        """
+        with self._lock:
+            return dict(
+                threads=self.num_threads, queued=self.queued,
+                maxQueued=self.max_queued, running=self.running,
+                total=self.total)
+
+    def close(self):
+        """Wait for any running functions and close the pool"""
+        with self._lock:
+            thread_pool = self._thread_pool
+            self._thread_pool = None
+        if thread_pool:
+            thread_pool.close()
+            thread_pool.join()
@@ -1,22 +1,147 @@
+from copy import deepcopy
+import threading
+
 import numpy as np
 
 from malcolm.core.serializable import Serializable
 from malcolm.core.stringarray import StringArray
 
 
+def _join_columns(column, new_values):
+    """Join two validated columns without validating every element again
+
+    Args:
+        column (StringArray or numpy.ndarray): The existing column
+        new_values (StringArray or numpy.ndarray): Validated values to add
+
+    Returns:
+        StringArray or numpy.ndarray: The joined column
+    """
+    if isinstance(column, tuple):
+        # Both already only contain strings
+        return tuple.__new__(StringArray, column + new_values)
+    else:
+        joined = np.concatenate((column, new_values))
+        joined.setflags(write=False)
+        return joined
+
+
+def _first_difference(a, b, length):
+    # Index of the first of the first length elements that differ
+    if isinstance(a, np.ndarray) and isinstance(b, np.ndarray):
+        different = np.flatnonzero(a[:length] != b[:length])
+        if len(different):
+            return int(different[0])
+    else:
+        for i in range(length):
+            if a[i] != b[i]:
+                return i
+    return length
+
+
+def find_changed_rows(old, new):
+    """Work out the single range of rows that changed between two Tables
+
+    Args:
+        old (Table): The previous value
+        new (Table): The new value
+
+    Returns:
+        tuple: (start, stop, n, names) where rows [start:stop] of old were
+            replaced by rows [start:start+n] of new, and names are the
+            columns that changed in those rows. None if they aren't Tables
+            with the same columns, or if the change is most of the table so
+            it may as well be sent whole
+    """
+    if not isinstance(old, Table) or not isinstance(new, Table):
+        return None
+    names = list(new.meta.elements)
+    if list(old.meta.elements) != names or not names:
+        return None
+    old_len = old.verify_column_lengths()
+    new_len = new.verify_column_lengths()
+    # Find how many rows are the same at the start and end of both
+    common = min(old_len, new_len)
+    start = common
+    for name in names:
+        start = _first_difference(old[name], new[name], start)
+    end = common - start
+    for name in names:
+        end = _first_difference(old[name][::-1], new[name][::-1], end)
+    stop = old_len - end
+    n = new_len - end - start
+    if n == stop - start:
+        # Same number of rows, so only send the columns that changed
+        names = [name for name in names if _first_difference(
+            old[name][start:stop], new[name][start:stop], n) < n]
+    if 2 * max(n, stop - start) > max(new_len, old_len):
+        return None
+    return start, stop, n, names
+
+
 @Serializable.register_subclass("malcolm:core/Table:1.0")
 class Table(Serializable):
-    # real data stored as attributes
+    # real data stored in _columns and read as attributes via __getattr__,
+    # rows added by append() wait in _appended until a column is next read
     # getitem supported for row by row operations
 
     def __init__(self, meta, d=None):
-        self.meta = meta
+        self._init_storage(meta)
         if d is None:
             d = {}
         for e in meta.elements:
             v = d[e] if e in d else []
             setattr(self, e, v)
 
+    @classmethod
+    def from_rows(cls, meta, rows):
+        """Make a Table from a list of rows, validating each column once
+
+        Args:
+            meta (TableMeta): The meta with the column elements
+            rows (list): [[value for each column]]
+
+        Returns:
+            Table: The new table
+        """
+        table = cls(meta)
+        table.extend(rows)
+        return table
+
+    @classmethod
+    def _from_validated_columns(cls, meta, columns):
+        # Make a Table from columns that don't need validating again
+        table = cls.__new__(cls)
+        table._init_storage(meta)
+        table._columns.update(zip(meta.elements, columns))
+        return table
+
+    def _init_storage(self, meta):
+        object.__setattr__(self, "meta", meta)
+        # {name: StringArray or numpy.ndarray}
+        object.__setattr__(self, "_columns", {})
+        # {name: [validated value for each appended row]} or None
+        object.__setattr__(self, "_appended", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def _set_validated_columns(self, columns):
+        with self._lock:
+            if self._appended:
+                # Don't lose rows appended to the other columns
+                self._join_appended()
+            self._columns.update(zip(self.meta.elements, columns))
+
+    def __copy__(self):
+        # Columns can't be changed in place so can be shared, but rows
+        # appended to the copy must not appear in this table
+        return self._from_validated_columns(
+            self.meta, [getattr(self, e) for e in self.meta.elements])
+
+    def __deepcopy__(self, memo):
+        return self._from_validated_columns(
+            deepcopy(self.meta, memo),
+            [deepcopy(getattr(self, e), memo) for e in self.meta.elements])
+
     @property
     def endpoints(self):
         return list(self.meta.elements)
@@ -29,15 +154,27 @@ class Table(Serializable):
             "Column lengths %s don't match" % lengths
         return lengths[0]
 
+    def rows(self):
+        """Iterate over the rows of the table
+
+        Yields:
+            list: [value for each column]
+        """
+        self.verify_column_lengths()
+        columns = [getattr(self, e) for e in self.meta.elements]
+        for row in zip(*columns):
+            yield list(row)
+
     def __getitem__(self, idx):
-        """Get row"""
+        """Get row for int, Table of rows for slice, column for string"""
         if isinstance(idx, int):
             self.verify_column_lengths()
-            columns = len(self.meta.elements)
-            row = [None] * columns
-            for i in range(columns):
-                row[i] = getattr(self, list(self.meta.elements)[i])[idx]
-            return row
+            return [getattr(self, e)[idx] for e in self.meta.elements]
+        elif isinstance(idx, slice):
+            # numpy slices are views, so this doesn't copy numeric columns
+            self.verify_column_lengths()
+            return self._from_validated_columns(
+                self.meta, [getattr(self, e)[idx] for e in self.meta.elements])
         else:
             return getattr(self, idx)
 
@@ -52,41 +189,133 @@ class Table(Serializable):
             if len(row) != len(self.meta.elements):
                 raise ValueError(
                     "Row %s does not specify correct number of values" % row)
+            new_columns = []
             for e, v in zip(self.meta.elements, row):
                 column = getattr(self, e)
-                if isinstance(column, StringArray):
-                    new_column = StringArray(
-                        column[:idx] + (v,) + column[idx+1:])
+                v = self.meta.elements[e].validate([v])
+                if isinstance(column, tuple):
+                    new_column = tuple.__new__(
+                        StringArray, column[:idx] + v + column[idx+1:])
                 else:
-                    # numpy array
-                    v = self.meta.elements[e].validate([v])
-                    new_column = np.concatenate(
-                        (column[:idx], v, column[idx+1:]))
-                setattr(self, e, new_column)
+                    # numpy array, copy it as views of it may be shared
+                    new_column = column.copy()
+                    new_column[idx] = v[0]
+                    new_column.setflags(write=False)
+                new_columns.append(new_column)
+            # Only change the table once every value is valid
+            self._set_validated_columns(new_columns)
         else:
             setattr(self, idx, row)
 
+    def __getattr__(self, attr):
+        """Get column, joining on any rows added by append() first"""
+        # Only called when normal lookup fails, so use __dict__ directly to
+        # avoid recursing if called before _init_storage()
+        columns = self.__dict__.get("_columns")
+        if columns is None or attr not in columns:
+            raise AttributeError(attr)
+        with self._lock:
+            if self._appended:
+                self._join_appended()
+            return columns[attr]
+
     def __setattr__(self, attr, value):
         """Set column"""
-        if hasattr(self, "meta"):
-            if attr not in self.meta.elements:
-                raise AttributeError(
-                    "Attr %s not in %s" % (attr, self.meta.elements))
-            column_meta = self.meta.elements[attr]
-            value = column_meta.validate(value)
-        object.__setattr__(self, attr, value)
+        if attr not in self.meta.elements:
+            raise AttributeError(
+                "Attr %s not in %s" % (attr, self.meta.elements))
+        column_meta = self.meta.elements[attr]
+        value = column_meta.validate(value)
+        with self._lock:
+            if self._appended:
+                # Don't lose rows appended to the other columns
+                self._join_appended()
+            self._columns[attr] = value
+
+    def splice_rows(self, start, stop, columns):
+        """Make a new Table with some rows replaced, validating each new
+        column once
+
+        Args:
+            start (int): Index of the first row to replace
+            stop (int): Index after the last row to replace
+            columns (dict): {name: [value for each new row]}, for every column
+                unless they replace the same number of rows, in which case
+                missing columns keep their values
+
+        Returns:
+            Table: The new table, leaving this one unchanged
+        """
+        lengths = set(len(values) for values in columns.values())
+        assert len(lengths) <= 1, "New column lengths %s don't match" % lengths
+        n = lengths.pop() if lengths else 0
+        new_columns = []
+        for e, column_meta in self.meta.elements.items():
+            column = getattr(self, e)
+            if e in columns:
+                new_values = column_meta.validate(list(columns[e]))
+            else:
+                assert n == stop - start, \
+                    "Column %s needed to change the number of rows" % e
+                new_values = column[start:stop]
+            new_columns.append(_join_columns(
+                _join_columns(column[:start], new_values), column[stop:]))
+        table = self._from_validated_columns(self.meta, new_columns)
+        table.verify_column_lengths()
+        return table
 
     def append(self, row):
-        self.verify_column_lengths()
+        """Add a row to the end of the table. The row is validated now, but
+        only joined onto the columns when one is next read, so appending N
+        rows in a row is O(N) rather than O(N^2)
+
+        Args:
+            row (list): [value for each column]
+        """
         if len(row) != len(self.meta.elements):
             raise ValueError(
                 "Row %s does not specify correct number of values" % row)
-        for e, v in zip(self.meta.elements, row):
-            column = getattr(self, e)
-            if isinstance(column, StringArray):
-                new_column = StringArray(column + (v,))
+        values = [self.meta.elements[e].validate([v])[0]
+                  for e, v in zip(self.meta.elements, row)]
+        if not self._appended:
+            self.verify_column_lengths()
+        with self._lock:
+            if not self._appended:
+                object.__setattr__(self, "_appended", dict(
+                    (e, []) for e in self.meta.elements))
+            for e, v in zip(self.meta.elements, values):
+                self._appended[e].append(v)
+
+    def _join_appended(self):
+        # Join the rows added by append() onto the columns, called with
+        # self._lock held
+        for e, values in self._appended.items():
+            column = self._columns[e]
+            if isinstance(column, tuple):
+                new_values = tuple.__new__(StringArray, tuple(values))
             else:
-                v = self.meta.elements[e].validate([v])
-                new_column = np.concatenate((column, v))
-            setattr(self, e, new_column)
+                new_values = np.array(values, dtype=column.dtype)
+            self._columns[e] = _join_columns(column, new_values)
+        object.__setattr__(self, "_appended", None)
 
+    def extend(self, rows):
+        """Add rows to the end of the table, validating each column once and
+        joining it with the existing column once
+
+        Args:
+            rows (list): [[value for each column]]
+        """
+        self.verify_column_lengths()
+        rows = list(rows)
+        for row in rows:
+            if len(row) != len(self.meta.elements):
+                raise ValueError(
+                    "Row %s does not specify correct number of values" % row)
+        if not rows:
+            return
+        new_columns = []
+        for e, new_values in zip(self.meta.elements, zip(*rows)):
+            new_values = self.meta.elements[e].validate(list(new_values))
+            new_columns.append(_join_columns(getattr(self, e), new_values))
+        # Only change the table once every value is valid
+        self._set_validated_columns(new_columns)
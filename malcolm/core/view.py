@@ -8,6 +8,32 @@ class View(object):
     def __init__(self):
         raise NotImplementedError("View must be instantiated with make_view()")
 
+    @classmethod
+    def view_signature(cls, data):
+        """Get what the members that get_view_class() adds depend on
+
+        Args:
+            data (Model): The data the view will be of
+
+        Returns:
+            tuple: Hashable signature, views of data with the same one can
+                share a class
+        """
+        return tuple(data)
+
+    @classmethod
+    def add_endpoint_members(cls, subclass, data):
+        """Add a property and a subscribe method for each endpoint of data
+
+        Args:
+            subclass (type): The subclass made by get_view_class()
+            data (Model): The data the view will be of
+        """
+        for endpoint in data:
+            # make properties for the endpoints we know about
+            make_get_property(subclass, endpoint)
+        add_subscribe_methods(subclass, data)
+
     def _do_init(self, controller, context, data):
         # This will be called by the subclass created in make_view
         object.__setattr__(self, "_controller", controller)
@@ -19,9 +45,6 @@ class View(object):
 
     def _prepare_endpoints(self, data):
         object.__setattr__(self, "_endpoints", tuple(data))
-        for endpoint in self._endpoints:
-            # Add _subscribe methods for each endpoint
-            self._make_subscribe_method(endpoint)
 
     def __iter__(self):
         return iter(self._endpoints)
@@ -38,13 +61,31 @@ class View(object):
     def __setattr__(self, name, value):
         raise NameError("Cannot set attribute %s on view" % name)
 
-    def _make_subscribe_method(self, endpoint):
-        # Make subscribe_endpoint method
-        def subscribe_child(callback, *args, **kwargs):
-            return self._context.subscribe(
-                self._data.path + [endpoint], callback, *args, **kwargs)
 
-        object.__setattr__(self, "subscribe_%s" % endpoint, subscribe_child)
+def make_subscribe_method(endpoint):
+    """Make a subscribe_endpoint method for a View class
+
+    Args:
+        endpoint (str): The endpoint it will subscribe to
+
+    Returns:
+        function: Taking (self, callback, *args, **kwargs)
+    """
+    def subscribe_child(self, callback, *args, **kwargs):
+        return self._context.subscribe(
+            self._data.path + [endpoint], callback, *args, **kwargs)
+    return subscribe_child
+
+
+def add_subscribe_methods(cls, endpoints):
+    """Add a subscribe_endpoint method to cls for each endpoint
+
+    Args:
+        cls (type): The View subclass
+        endpoints (list): [str] endpoint names
+    """
+    for endpoint in endpoints:
+        setattr(cls, "subscribe_%s" % endpoint, make_subscribe_method(endpoint))
 
 
 def make_get_property(cls, endpoint):
@@ -58,6 +99,40 @@ def make_get_property(cls, endpoint):
     setattr(cls, endpoint, make_child_view)
 
 
+# {(base class, view_signature): subclass} of the View subclasses made so far
+_view_classes = {}
+
+
+def get_view_class(base, data):
+    """Get the subclass of base with properties and methods for each endpoint
+    of data, only making it the first time these endpoints are seen. If the
+    endpoints change then the signature does, so a new class is made
+
+    Args:
+        base (type): View or a subclass of it
+        data (Model): The data the view will be of
+
+    Returns:
+        type: A subclass of base that takes (controller, context, data)
+    """
+    key = (base, base.view_signature(data))
+    try:
+        return _view_classes[key]
+    except KeyError:
+        pass
+
+    # Properties can only be set on classes, so make subclass that we can use
+    class ViewSubclass(base):
+        def __init__(self, controller, context, data):
+            self._do_init(controller, context, data)
+
+    ViewSubclass.__name__ = "%sSubclass" % base.__name__
+    base.add_endpoint_members(ViewSubclass, data)
+    # Another thread might have made one at the same time, but they are
+    # equivalent so use whichever got there first
+    return _view_classes.setdefault(key, ViewSubclass)
+
+
 def make_view(controller, context, data):
     """Make a View subclass containing properties specific for given data
 
@@ -71,20 +146,5 @@ def make_view(controller, context, data):
         View: A View subclass instance that provides a user-focused API to
             the given data
     """
-    # Properties can only be set on classes, so make subclass that we can use
-
-    class ViewSubclass(View):
-        def __init__(self):
-            self._do_init(controller, context, data)
-
-    for endpoint in data:
-        # make properties for the endpoints we know about
-        make_get_property(ViewSubclass, endpoint)
-
-    view = ViewSubclass()
+    view = get_view_class(View, data)(controller, context, data)
     return view
-
-
-
-
-
@@ -36,14 +36,11 @@ class DatasetRunnableChildPart(RunnableChildPart):
             context, completed_steps, steps_to_do, part_info, params)
         info_list = []
         if hasattr(child, "datasets"):
-            datasets_table = child.datasets.value
-            for i in range(len(datasets_table.name)):
+            t = child.datasets.value
+            for name, filename, type, rank, path, uniqueid in zip(
+                    t.name, t.filename, t.type, t.rank, t.path, t.uniqueid):
                 info = DatasetProducedInfo(
-                    name=datasets_table.name[i],
-                    filename=datasets_table.filename[i],
-                    type=datasets_table.type[i],
-                    rank=datasets_table.rank[i],
-                    path=datasets_table.path[i],
-                    uniqueid=datasets_table.uniqueid[i])
+                    name=name, filename=filename, type=type, rank=rank,
+                    path=path, uniqueid=uniqueid)
                 info_list.append(info)
         return info_list
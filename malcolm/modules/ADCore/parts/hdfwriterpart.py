@@ -3,7 +3,7 @@ import math
 from xml.etree import cElementTree as ET
 
 from malcolm.compat import et_to_string
-from malcolm.core import method_takes, REQUIRED
+from malcolm.core import method_takes, REQUIRED, GreaterOrEqual
 from malcolm.modules.ADCore.infos import CalculatedNDAttributeDatasetInfo, \
     DatasetProducedInfo, NDArrayDatasetInfo, NDAttributeDatasetInfo, \
     attribute_dataset_types, UniqueIdInfo
@@ -167,15 +167,12 @@ class HDFWriterPart(StatefulChildPart):
         self.start_future = child.start_async()
         # Start a future waiting for the first array
         self.array_future = child.when_value_matches_async(
-            "arrayCounterReadback", self._greater_than_zero)
+            "arrayCounterReadback", GreaterOrEqual(1))
         # Return the dataset information
         dataset_infos = list(self._create_dataset_infos(
             params.formatName, part_info, params.generator, filename))
         return dataset_infos
 
-    def _greater_than_zero(self, v):
-        return v > 0
-
     @RunnableController.PostRunArmed
     @RunnableController.Seek
     def seek(self, context, completed_steps, steps_to_do, part_info):
@@ -191,7 +188,7 @@ class HDFWriterPart(StatefulChildPart):
         child.arrayCounter.put_value(0)
         # Start a future waiting for the first array
         self.array_future = child.when_value_matches_async(
-            "arrayCounterReadback", self._greater_than_zero)
+            "arrayCounterReadback", GreaterOrEqual(1))
 
     def update_completed_steps(self, value, update_completed_steps):
         completed_steps = value + self.completed_offset
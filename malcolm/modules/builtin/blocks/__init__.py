@@ -1,3 +1,7 @@
+from malcolm.yamlutil import make_block_creator, check_yaml_names
+
 from .proxyblock import proxy_block
 
-__all__ = ["proxy_block"]
+diagnostics_block = make_block_creator(__file__, "diagnostics_block.yaml")
+
+__all__ = ["proxy_block"] + check_yaml_names(globals())
@@ -8,7 +8,13 @@ from malcolm.modules.builtin.vmetas import StringMeta, BooleanMeta
 @method_takes(
     "comms", StringMeta("MRI for the comms block"), REQUIRED,
     "mri", StringMeta("MRI for the client block"), REQUIRED,
-    "publish", BooleanMeta("Whether to publish this block"), False
+    "publish", BooleanMeta("Whether to publish this block"), False,
+    "resync", BooleanMeta(
+        "Resubscribe from the last revision seen on reconnect. The server "
+        "must support fromRevision"), False,
+    "tableDeltas", BooleanMeta(
+        "Ask for only the changed rows of tables. The server must support "
+        "tableDeltas"), False
 )
 def proxy_block(process, params):
     controller = ProxyController(process, (), params)
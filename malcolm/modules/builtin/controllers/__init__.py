@@ -4,6 +4,7 @@ from .managercontroller import ManagerController, ManagerStates
 from .clientcomms import ClientComms
 from .proxycontroller import ProxyController
 from .servercomms import ServerComms
+from .diagnosticscontroller import DiagnosticsController
 
 # Expose all the classes
 __all__ = sorted(k for k, v in globals().items() if type(v) == type)
@@ -0,0 +1,149 @@
+import time
+
+from malcolm.compat import OrderedDict
+from malcolm.core import Process, Queue, TimeoutError, Table, \
+    method_also_takes
+from malcolm.core.spawnlane import function_name
+from malcolm.modules.builtin.vmetas import NumberMeta, StringMeta, \
+    StringArrayMeta, NumberArrayMeta, TableMeta
+from malcolm.tags import widget
+from .basiccontroller import BasicController
+
+
+# Make a table for the counters of each spawn lane
+columns = OrderedDict()
+columns["lane"] = StringArrayMeta("Name of the lane")
+columns["threads"] = NumberArrayMeta("int32", "Size of the thread pool")
+columns["running"] = NumberArrayMeta("int32", "Functions running now")
+columns["queued"] = NumberArrayMeta(
+    "int32", "Functions waiting for a thread now")
+columns["maxQueued"] = NumberArrayMeta(
+    "int32", "Most functions that have been waiting for a thread")
+columns["total"] = NumberArrayMeta(
+    "int64", "Functions spawned since the process started")
+columns["rate"] = NumberArrayMeta(
+    "float64", "Functions spawned per second since the last update")
+lanes_table_meta = TableMeta(
+    "Thread pool of each spawn lane", elements=columns, tags=[widget("table")])
+
+# Make a table for the timings of each spawned function
+columns = OrderedDict()
+columns["lane"] = StringArrayMeta("Name of the lane")
+columns["function"] = StringArrayMeta("Name of the spawned function")
+columns["count"] = NumberArrayMeta("int64", "Number of times it has run")
+columns["waitP50"] = NumberArrayMeta(
+    "float64", "Median time waiting for a thread in seconds")
+columns["waitP99"] = NumberArrayMeta(
+    "float64", "99th percentile time waiting for a thread in seconds")
+columns["runP50"] = NumberArrayMeta(
+    "float64", "Median time running in seconds")
+columns["runP99"] = NumberArrayMeta(
+    "float64", "99th percentile time running in seconds")
+functions_table_meta = TableMeta(
+    "Recent timings of each spawned function", elements=columns,
+    tags=[widget("table")])
+
+
+@method_also_takes(
+    "period", NumberMeta("float64", "Time between updates in seconds"), 1.0)
+class DiagnosticsController(BasicController):
+    """Publishes how busy the Process's spawn lanes are"""
+    # Attributes
+    lanes = None
+    functions = None
+    spawn_rate = None
+    oldest_running = None
+    oldest_running_time = None
+
+    def __init__(self, process, parts, params):
+        super(DiagnosticsController, self).__init__(process, parts, params)
+        self._stop_queue = None
+        self._spawned = None
+        # (time.time(), {lane: total}) at the last update
+        self._last_totals = (None, {})
+        # Our own update loop is always running, so don't report it
+        self._update_loop_name = function_name(self._update_loop)
+
+    def create_attribute_models(self):
+        for y in super(DiagnosticsController, self).create_attribute_models():
+            yield y
+        self.lanes = lanes_table_meta.create_attribute_model()
+        yield "lanes", self.lanes, None
+        self.functions = functions_table_meta.create_attribute_model()
+        yield "functions", self.functions, None
+        meta = NumberMeta(
+            "float64", "Functions spawned per second in all lanes",
+            tags=[widget("textupdate")])
+        self.spawn_rate = meta.create_attribute_model()
+        yield "spawnRate", self.spawn_rate, None
+        meta = StringMeta(
+            "Lane and name of the spawned function running longest",
+            tags=[widget("textupdate")])
+        self.oldest_running = meta.create_attribute_model()
+        yield "oldestRunning", self.oldest_running, None
+        meta = NumberMeta(
+            "float64", "How long oldestRunning has been running in seconds",
+            tags=[widget("textupdate")])
+        self.oldest_running_time = meta.create_attribute_model()
+        yield "oldestRunningTime", self.oldest_running_time, None
+
+    @Process.Init
+    def init(self):
+        self._stop_queue = Queue()
+        self.update()
+        self._spawned = self.spawn(self._update_loop)
+
+    @Process.Halt
+    def halt(self):
+        if self._spawned:
+            self._stop_queue.put(None)
+            self._spawned.wait(timeout=10)
+            self._spawned = None
+
+    def _update_loop(self):
+        while True:
+            try:
+                self._stop_queue.get(timeout=self.params.period)
+            except TimeoutError:
+                self.update()
+            else:
+                return
+
+    def update(self):
+        """Publish the current stats of the Process"""
+        now = time.time()
+        lane_stats = self.process.lane_stats()
+        last_time, last_totals = self._last_totals
+        self._last_totals = (
+            now, dict((lane, s["total"]) for lane, s in lane_stats.items()))
+        rates = []
+        for lane, stats in lane_stats.items():
+            if last_time is None or now == last_time:
+                rates.append(0.0)
+            else:
+                rates.append((stats["total"] - last_totals.get(lane, 0)) /
+                             (now - last_time))
+        lanes = Table(lanes_table_meta)
+        lanes.lane = list(lane_stats)
+        for name in ("threads", "running", "queued", "maxQueued", "total"):
+            lanes[name] = [s[name] for s in lane_stats.values()]
+        lanes.rate = rates
+        timings = self.process.spawn_timings()
+        functions = Table(functions_table_meta)
+        for i, name in enumerate(functions_table_meta.elements):
+            functions[name] = [t[i] for t in timings]
+        running = [r for r in self.process.running_spawns()
+                   if r[1] != self._update_loop_name]
+        if running:
+            lane, name, start = running[0]
+            oldest_running = "%s: %s" % (lane, name)
+            oldest_running_time = time.time() - start
+        else:
+            oldest_running = ""
+            oldest_running_time = 0.0
+        with self.changes_squashed:
+            self.lanes.set_value(lanes)
+            self.functions.set_value(functions)
+            self.spawn_rate.set_value(sum(rates))
+            self.oldest_running.set_value(oldest_running)
+            self.oldest_running_time.set_value(oldest_running_time)
@@ -470,16 +470,16 @@ class ManagerController(StatefulController):
             text = f.read()
         structure = json_decode(text)
         # Set the layout table
-        layout_table = Table(self.layout.meta)
-        for part_name, part_structure in structure.get("layout", {}).items():
-            layout_table.append([
-                part_name, "", part_structure["x"], part_structure["y"],
-                part_structure["visible"]])
+        layout_table = Table.from_rows(self.layout.meta, [
+            [part_name, "", part_structure["x"], part_structure["y"],
+             part_structure["visible"]]
+            for part_name, part_structure in structure.get(
+                "layout", {}).items()])
         self.set_layout(layout_table)
         # Set the exports table
-        exports_table = Table(self.exports.meta)
-        for name, export_name in structure.get("exports", {}).items():
-            exports_table.append([name, export_name])
+        exports_table = Table.from_rows(self.exports.meta, [
+            [name, export_name]
+            for name, export_name in structure.get("exports", {}).items()])
         self.exports.set_value(exports_table)
         # Run the load hook to get parts to load their own structure
         self.run_hook(self.Load,
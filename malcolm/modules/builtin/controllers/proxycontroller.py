@@ -1,13 +1,24 @@
-from malcolm.core import Post, Subscribe, Put, Controller, method_takes, \
-    REQUIRED, Alarm, Process, Unsubscribe, Delta, Queue
-from malcolm.modules.builtin.vmetas import StringMeta
+from functools import partial
+
+from malcolm.core import Post, Subscribe, Put, PutMany, Controller, \
+    method_takes, REQUIRED, Alarm, Process, Unsubscribe, Delta, Queue
+from malcolm.modules.builtin.vmetas import StringMeta, BooleanMeta
 
 
 @method_takes(
     "comms", StringMeta("Malcolm resource id of client comms"), REQUIRED,
-    "mri", StringMeta("Malcolm resource id of created block"), REQUIRED)
+    "mri", StringMeta("Malcolm resource id of created block"), REQUIRED,
+    "resync", BooleanMeta(
+        "Resubscribe from the last revision seen on reconnect. The server "
+        "must support fromRevision"), False,
+    "tableDeltas", BooleanMeta(
+        "Ask for only the changed rows of tables. The server must support "
+        "tableDeltas"), False)
 class ProxyController(Controller):
     """Sync a local block with a given remote block"""
+    # The server may be too old to know PutMany, so put attributes one by one
+    put_many_supported = False
+
     def __init__(self, process, parts, params):
         self.params = params
         super(ProxyController, self).__init__(process, params.mri, parts)
@@ -19,8 +30,15 @@ class ProxyController(Controller):
 
     @Process.Init
     def init(self):
+        # Only ask for the newer features if configured to, as older servers
+        # reject Subscribes with fields they don't know
+        if self.params.resync:
+            from_revision = 0
+        else:
+            from_revision = None
         subscribe = Subscribe(
-            path=[self.params.mri], delta=True, callback=self.handle_response)
+            path=[self.params.mri], delta=True, callback=self.handle_response,
+            fromRevision=from_revision, tableDeltas=self.params.tableDeltas)
         self.client_comms.send_to_server(subscribe)
         # Wait until connected
         self._first_response_queue.get(timeout=5)
@@ -32,13 +50,22 @@ class ProxyController(Controller):
 
     def handle_request(self, request):
         # Forward Puts and Posts to the client_comms
-        if isinstance(request, (Put, Post)):
+        if isinstance(request, (Put, PutMany, Post)):
+            request.set_callback(
+                partial(self._forward_response, request.callback))
             return self.client_comms.send_to_server(request)
         else:
             return super(ProxyController, self).handle_request(request)
 
     def handle_response(self, response):
-        self._response_queue.put(response)
+        self._response_queue.put((None, response))
+        return self.spawn(self._handle_response)
+
+    def _forward_response(self, callback, response):
+        # The Return or Error of a request we forwarded. Queue it behind any
+        # Deltas that arrived before it, so the caller sees the changes the
+        # request caused once it returns
+        self._response_queue.put((callback, response))
         return self.spawn(self._handle_response)
 
     def _handle_response(self):
@@ -46,38 +73,53 @@ class ProxyController(Controller):
             if self._notify_response:
                 self._first_response_queue.put(True)
                 self._notify_response = False
-            response = self._response_queue.get(timeout=0)
-            if not isinstance(response, Delta):
-                # Return or Error is the end of our subscription, log and ignore
-                self.log.debug("Proxy got response %r", response)
-                return
-            for change in response.changes:
-                path = change[0]
-                if len(path) == 0:
-                    assert len(change) == 2, \
-                        "Can't delete root block with change %r" % (change,)
-                    self._regenerate_block(change[1])
-                elif len(path) == 1 and path[0] not in ("health", "meta"):
-                    if len(change) == 1:
-                        # Delete a field
-                        self._block.remove_endpoint(path[1])
-                    else:
-                        # Change a single field of the block
-                        self._block.set_endpoint_data(path[1], change[1])
-                elif len(path) == 2 and path[:1] == ["health", "alarm"]:
-                    # If we got an alarm update for health
-                    assert len(change) == 2, "Can't delete health alarm"
-                    self.update_health(self, change[1])
-                elif path[0] not in ("health", "meta"):
-                    # Update a child of the block
-                    assert len(change) == 2, \
-                        "Can't delete entries in Attributes or Methods"
-                    ob = self._block
-                    for p in path[:-1]:
-                        ob = ob[p]
-                    getattr(ob, "set_%s" % path[-1])(change[1])
+            # Responses are taken with the lock held, so are applied in the
+            # order they arrived
+            callback, response = self._response_queue.get(timeout=0)
+            if callback is None:
+                self._apply_response(response)
+        if callback is not None:
+            callback(response)
+
+    def _apply_response(self, response):
+        if not isinstance(response, Delta):
+            # Return or Error is the end of our subscription, log and ignore
+            self.log.debug("Proxy got response %r", response)
+            return
+        for change in response.changes:
+            path = change[0]
+            if len(path) == 0:
+                assert len(change) == 2, \
+                    "Can't delete root block with change %r" % (change,)
+                self._regenerate_block(change[1])
+            elif len(path) == 1 and path[0] not in ("health", "meta"):
+                if len(change) == 1:
+                    # Delete a field
+                    self._block.remove_endpoint(path[1])
+                else:
+                    # Change a single field of the block
+                    self._block.set_endpoint_data(path[1], change[1])
+            elif len(path) == 2 and path[:1] == ["health", "alarm"]:
+                # If we got an alarm update for health
+                assert len(change) == 2, "Can't delete health alarm"
+                self.update_health(self, change[1])
+            elif path[0] not in ("health", "meta"):
+                # Update a child of the block
+                assert len(change) > 1, \
+                    "Can't delete entries in Attributes or Methods"
+                ob = self._block
+                for p in path[:-1]:
+                    ob = ob[p]
+                if len(change) == 3:
+                    # Only some rows of a table changed
+                    start, stop = change[2]
+                    value = ob[path[-1]].splice_rows(
+                        start, stop, change[1])
                 else:
-                    raise ValueError("Bad response %s" % response)
+                    value = change[1]
+                getattr(ob, "set_%s" % path[-1])(value)
+            else:
+                raise ValueError("Bad response %s" % response)
 
     def _regenerate_block(self, d):
         for field in list(self._block):
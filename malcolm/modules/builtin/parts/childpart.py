@@ -4,8 +4,8 @@ import numpy as np
 
 from malcolm.compat import OrderedDict
 from malcolm.core import Part, REQUIRED, method_takes, serialize_object, \
-    Attribute, Subscribe, Unsubscribe, Put, Alarm, AlarmSeverity, AlarmStatus, \
-    Queue
+    Attribute, Subscribe, Unsubscribe, Put, PutMany, Alarm, AlarmSeverity, \
+    AlarmStatus, Queue
 from malcolm.modules.builtin.controllers import ManagerController
 from malcolm.modules.builtin.infos import PortInfo, LayoutInfo
 from malcolm.modules.builtin.vmetas import StringMeta
@@ -52,6 +52,8 @@ class ChildPart(Part):
         to dispatch a request"""
         if isinstance(request, Put):
             self.we_modified.add(request.path[-2])
+        elif isinstance(request, PutMany):
+            self.we_modified.update(request.values)
 
     @ManagerController.Init
     def init(self, context):
@@ -1,6 +1,6 @@
 from malcolm.compat import str_, OrderedDict
 from malcolm.core import NTTable, Serializable, deserialize_object, Table, \
-    VMeta, VArrayMeta
+    VMeta, VArrayMeta, check_camel_case
 
 
 @Serializable.register_subclass("malcolm:core/TableMeta:1.0")
@@ -22,6 +22,7 @@ class TableMeta(VMeta):
         for k, v in elements.items():
             if k != "typeid":
                 k = deserialize_object(k, str_)
+                check_camel_case(k)
                 deserialized[k] = deserialize_object(v, VArrayMeta)
         return self.set_endpoint_data("elements", deserialized)
 
@@ -49,6 +49,7 @@ class ScanTickerPart(ChildPart):
         point_time = time.time()
         if self.generator:
             child = context.block_view(self.params.mri)
+            counter = child.counter
             for i in range(self.completed_steps,
                            self.completed_steps + self.steps_to_do):
                 self.log.debug("Starting point %s", i)
@@ -56,7 +57,7 @@ class ScanTickerPart(ChildPart):
                 point = self.generator.get_point(i)
                 # Update the child counter_block to be the demand position
                 position = point.positions[self.name]
-                child.counter.put_value(position)
+                counter.put_value(position)
                 # Wait until the next point is due
                 point_time += point.duration
                 wait_time = point_time - time.time()
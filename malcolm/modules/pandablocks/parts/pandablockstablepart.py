@@ -72,19 +72,19 @@ class PandABlocksTablePart(PandABlocksFieldPart):
         return int_values
 
     def table_from_list(self, int_values):
-        table = Table(self.meta)
+        # Build up the columns then make the table from them in one go
+        columns = OrderedDict((name, []) for name in self.fields)
         if self.fields:
             nconsume = self._calc_nconsume()
+            masks = [(columns[name], 2 ** (bits_hi + 1) - 1, bits_lo)
+                     for name, (bits_hi, bits_lo) in self.fields.items()]
 
             for i in range(int(len(int_values) / nconsume)):
                 int_value = 0
                 for c in range(nconsume):
                     int_value += int(int_values[i*nconsume+c]) << (32 * c)
-                row = []
-                for name, (bits_hi, bits_lo) in self.fields.items():
-                    mask = 2 ** (bits_hi + 1) - 1
-                    field_value = (int_value & mask) >> bits_lo
-                    row.append(field_value)
-                table.append(row)
+                for column, mask, bits_lo in masks:
+                    column.append((int_value & mask) >> bits_lo)
+        table = Table(self.meta, columns)
         return table
 
@@ -1,13 +1,23 @@
 from tornado.httpserver import HTTPServer
 from tornado.ioloop import IOLoop
-from tornado.web import Application
+from tornado.web import Application, GZipContentEncoding
 
 from malcolm.modules.builtin.controllers.servercomms import ServerComms
-from malcolm.core import Hook, method_also_takes, Process
+from malcolm.core import Hook, method_also_takes, Process, get_event_loop, \
+    LOOP_LANE
 from malcolm.modules.builtin.vmetas import NumberMeta
 from malcolm.modules.web.infos import HandlerInfo
 
 
+class GZipExceptEventStreams(GZipContentEncoding):
+    """gzip responses for clients that accept it, except text/event-stream,
+    as the compressor would hold back each event until it had more"""
+    def _compressible_type(self, ctype):
+        if ctype == "text/event-stream":
+            return False
+        return super(GZipExceptEventStreams, self)._compressible_type(ctype)
+
+
 @method_also_takes(
     "port", NumberMeta("int32", "Port number to run up under"), 8080)
 class HTTPServerComms(ServerComms):
@@ -16,6 +26,8 @@ class HTTPServerComms(ServerComms):
     _server = None
     _spawned = None
     _application = None
+    # Whether _loop is the shared asyncio loop, which we mustn't stop
+    _shared_loop = False
     use_cothread = False
 
     ReportHandlers = Hook()
@@ -42,7 +54,13 @@ class HTTPServerComms(ServerComms):
 
     def do_init(self):
         super(HTTPServerComms, self).do_init()
-        self._loop = IOLoop()
+        event_loop = get_event_loop()
+        if event_loop:
+            # Share the one asyncio loop rather than running our own
+            self._loop = event_loop.io_loop()
+            self._shared_loop = True
+        else:
+            self._loop = IOLoop()
         part_info = self.run_hook(
             self.ReportHandlers, self.create_part_contexts(), self._loop)
         handler_infos = HandlerInfo.filter_values(part_info)
@@ -51,20 +69,34 @@ class HTTPServerComms(ServerComms):
             handlers.append((
                 handler_info.regexp, handler_info.request_class,
                 handler_info.kwargs))
-        self._application = Application(handlers)
+        self._application = Application(
+            handlers, transforms=[GZipExceptEventStreams])
         self.start_io_loop()
 
     def start_io_loop(self):
         if self._spawned is None:
             self._server = HTTPServer(self._application)
-            self._server.listen(int(self.params.port))
-            self._spawned = self.spawn(self._loop.start)
+            if self._shared_loop:
+                # The loop is already running, so listen from inside it
+                self.process.spawn(
+                    self._server.listen, (int(self.params.port),), {}, False,
+                    LOOP_LANE).get(timeout=10)
+                self._spawned = True
+            else:
+                self._server.listen(int(self.params.port))
+                self._spawned = self.spawn(self._loop.start)
 
     def stop_io_loop(self):
         if self._spawned:
-            self._loop.add_callback(self._server.stop)
-            self._loop.add_callback(self._loop.stop)
-            self._spawned.wait(timeout=10)
+            if self._shared_loop:
+                # Other comms may be using the loop, so only stop our server
+                self.process.spawn(
+                    self._server.stop, (), {}, False, LOOP_LANE).get(
+                    timeout=10)
+            else:
+                self._loop.add_callback(self._server.stop)
+                self._loop.add_callback(self._loop.stop)
+                self._spawned.wait(timeout=10)
             self._spawned = None
 
     def do_disable(self):
@@ -1,20 +1,103 @@
+from contextlib import contextmanager
+
+import tornado
 from tornado import gen
+from tornado.httpclient import HTTPRequest
 from tornado.ioloop import IOLoop
 from tornado.websocket import websocket_connect
 
 from malcolm.modules.builtin.controllers import ClientComms
 from malcolm.core import Subscribe, deserialize_object, method_also_takes, \
     json_decode, json_encode, Response, Error, Unsubscribe, Update, Return, \
-    Queue, TimeoutError
+    Delta, Queue, TimeoutError, binary_encode, binary_decode, get_event_loop
 from malcolm.modules.builtin.vmetas import StringMeta, NumberMeta, \
-    StringArrayMeta
+    StringArrayMeta, BooleanMeta
 from malcolm.tags import widget
 
 
+# Websocket subprotocol a client asks for to get binary_encode()d frames
+# rather than JSON text
+BINARY_SUBPROTOCOL = "malcolm-binary"
+
+# Query argument a client sets to 1 in the websocket URL to get responses
+# batched together into JSON arrays. The server only does this for JSON
+BATCH_ARGUMENT = "batch"
+
+# tornado has no public way to send a message uncompressed or to count bytes
+# before and after compression, so we use private attributes of its websocket
+# protocol. They are only touched in the [first, last) tornado versions they
+# have been checked against, and only if the protocol has them
+PRIVATE_PROTOCOL_VERSIONS = ((4, 0), (7, 0))
+
+
+def compression_options(level):
+    """Make the compression_options that tornado uses to negotiate
+    permessage-deflate
+
+    Args:
+        level (int): zlib compression level from 1 (fastest) to 9 (smallest),
+            or 0 to not compress
+
+    Returns:
+        dict: The options, or None if level is 0
+    """
+    if level > 0:
+        return dict(compression_level=int(level))
+
+
+def private_protocol_attr(protocol, name):
+    """Get a private attribute of a tornado websocket protocol, if this
+    version of tornado is one we know the meaning of it for
+
+    Args:
+        protocol (WebSocketProtocol): The protocol of a connection, or None
+        name (str): The attribute name, like "_compressor"
+
+    Returns:
+        The attribute, or None if it isn't there or we don't trust it
+    """
+    first, last = PRIVATE_PROTOCOL_VERSIONS
+    if first <= tornado.version_info[:2] < last and hasattr(protocol, name):
+        return getattr(protocol, name)
+
+
+@contextmanager
+def compression_threshold(protocol, message, threshold):
+    """Stop a websocket protocol compressing messages written inside the
+    with statement if message is shorter than threshold. RFC 7692 lets any
+    message be sent uncompressed, and the deflate context only carries on
+    between compressed ones, so the next compressed message is unaffected
+
+    Args:
+        protocol (WebSocketProtocol): The protocol that will write message
+        message (str): The message that will be written
+        threshold (int): Messages shorter than this aren't compressed
+    """
+    compressor = private_protocol_attr(protocol, "_compressor")
+    if compressor is None or len(message) >= threshold:
+        yield
+    else:
+        protocol._compressor = None
+        try:
+            yield
+        finally:
+            protocol._compressor = compressor
+
+
 @method_also_takes(
     "hostname", StringMeta("Hostname of malcolm websocket server"), "localhost",
     "port", NumberMeta("int32", "Port number to run up under"), 8080,
-    "connectTimeout", NumberMeta("float64", "Time to wait for connection"), 5.0)
+    "connectTimeout", NumberMeta("float64", "Time to wait for connection"), 5.0,
+    "binary", BooleanMeta(
+        "Ask the server to send numpy arrays as raw binary buffers"), True,
+    "batch", BooleanMeta(
+        "Ask the server to send JSON responses in batches"), True,
+    "compressionLevel", NumberMeta(
+        "int32", "zlib level 1-9 to compress messages with if the server "
+        "agrees, or 0 to not compress"), 6,
+    "compressionThreshold", NumberMeta(
+        "int32", "Messages shorter than this many bytes aren't compressed"),
+    1024)
 class WebsocketClientComms(ClientComms):
     """A class for a client to communicate with the server"""
     use_cothread = False
@@ -24,7 +107,11 @@ class WebsocketClientComms(ClientComms):
     loop = None
     _conn = None
     _spawned = None
+    # Whether loop is the shared asyncio loop, which we mustn't stop
+    _shared_loop = False
     _connected_queue = None
+    # Whether the server agreed to BINARY_SUBPROTOCOL
+    _binary = False
     # {new_id: (request, old_id}
     _request_lookup = None
     # {Subscribe.generator_key(): Subscribe}
@@ -42,7 +129,13 @@ class WebsocketClientComms(ClientComms):
 
     def do_init(self):
         super(WebsocketClientComms, self).do_init()
-        self.loop = IOLoop()
+        event_loop = get_event_loop()
+        if event_loop:
+            # Share the one asyncio loop rather than running our own
+            self.loop = event_loop.io_loop()
+            self._shared_loop = True
+        else:
+            self.loop = IOLoop()
         self._request_lookup = {}
         self._subscription_keys = {}
         self._connected_queue = Queue()
@@ -61,7 +154,11 @@ class WebsocketClientComms(ClientComms):
         if self._spawned is None:
             self._conn = None
             self.loop.add_callback(self.recv_loop)
-            self._spawned = self.spawn(self.loop.start)
+            if self._shared_loop:
+                # Already running, so nothing to wait for when we stop
+                self._spawned = True
+            else:
+                self._spawned = self.spawn(self.loop.start)
             try:
                 self._connected_queue.get(self.params.connectTimeout)
             except TimeoutError:
@@ -70,21 +167,44 @@ class WebsocketClientComms(ClientComms):
 
     def stop_io_loop(self):
         if self.loop:
-            self.loop.stop()
-            self._spawned.wait(timeout=10)
-            self._spawned = None
+            if self._shared_loop:
+                # Other comms may be using the loop, so just close our
+                # connection, after clearing _spawned so recv_loop knows we
+                # meant to
+                self._spawned = None
+                if self._conn:
+                    self.loop.add_callback(self._conn.close)
+            else:
+                self.loop.stop()
+                self._spawned.wait(timeout=10)
+                self._spawned = None
 
     @gen.coroutine
     def recv_loop(self):
         url = "ws://%(hostname)s:%(port)d/ws" % self.params
+        if self.params.batch:
+            url += "?%s=1" % BATCH_ARGUMENT
+        headers = {}
+        if self.params.binary:
+            headers["Sec-WebSocket-Protocol"] = BINARY_SUBPROTOCOL
+        request = HTTPRequest(
+            url, headers=headers,
+            connect_timeout=self.params.connectTimeout - 0.5)
         self._conn = yield websocket_connect(
-            url, self.loop, connect_timeout=self.params.connectTimeout - 0.5)
+            request, self.loop, compression_options=compression_options(
+                self.params.compressionLevel))
+        # An older server will ignore the subprotocol and talk JSON
+        self._binary = self._conn.headers.get(
+            "Sec-WebSocket-Protocol", None) == BINARY_SUBPROTOCOL
         self._connected_queue.put(True)
         for request in self._subscription_keys.values():
             self._send_request(request)
         while True:
             message = yield self._conn.read_message()
-            if message is None:
+            if message is None and self._spawned is None:
+                # We closed the connection in stop_io_loop()
+                return
+            elif message is None:
                 for request, old_id in self._request_lookup.values():
                     if not isinstance(request, Subscribe):
                         # Respond with an error
@@ -114,8 +234,29 @@ class WebsocketClientComms(ClientComms):
             message(str): Received message
         """
         try:
-            self.log.debug("Got message %s", message)
-            d = json_decode(message)
+            self.log.debug("Got message %r", message)
+            if isinstance(message, bytes):
+                d = binary_decode(message)
+            else:
+                d = json_decode(message)
+            if isinstance(d, list):
+                # A batch of responses
+                for response in d:
+                    self.handle_response(response)
+            else:
+                self.handle_response(d)
+        except Exception:
+            # If we don't catch the exception here, tornado will spew odd
+            # error messages about 'HTTPRequest' object has no attribute 'path'
+            self.log.exception("on_message(%r) failed", message)
+
+    def handle_response(self, d):
+        """Pass a response from the server to the callback of its request
+
+        Args:
+            d (dict): The decoded response
+        """
+        try:
             response = deserialize_object(d, Response)
             if isinstance(response, (Return, Error)):
                 request, old_id = self._request_lookup.pop(response.id)
@@ -123,13 +264,18 @@ class WebsocketClientComms(ClientComms):
                     self._subscription_keys.pop(request.generate_key())
             else:
                 request, old_id = self._request_lookup[response.id]
+                if isinstance(response, Delta) and \
+                        response.revision is not None and \
+                        request.fromRevision is not None:
+                    # So a resubscribe on reconnect only gets what we missed,
+                    # if the subscriber asked for it with fromRevision
+                    request.set_fromRevision(response.revision)
             response.set_id(old_id)
             # TODO: should we spawn here?
             request.callback(response)
         except Exception:
-            # If we don't catch the exception here, tornado will spew odd
-            # error messages about 'HTTPRequest' object has no attribute 'path'
-            self.log.exception("on_message(%r) failed", message)
+            # Carry on with the rest of a batch
+            self.log.exception("handle_response(%r) failed", d)
 
     def send_to_server(self, request):
         """Dispatch a request to the server
@@ -156,6 +302,11 @@ class WebsocketClientComms(ClientComms):
         self._send_request(request)
 
     def _send_request(self, request):
-        message = json_encode(request)
-        self.log.debug("Sending message %s", message)
-        self._conn.write_message(message)
+        if self._binary:
+            message = binary_encode(request)
+        else:
+            message = json_encode(request)
+        self.log.debug("Sending message %r", message)
+        with compression_threshold(self._conn.protocol, message,
+                                   self.params.compressionThreshold):
+            self._conn.write_message(message, binary=self._binary)
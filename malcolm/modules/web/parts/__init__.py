@@ -1,3 +1,4 @@
+from .eventstreamserverpart import EventStreamServerPart
 from .restfulserverpart import RestfulServerPart
 from .websocketserverpart import WebsocketServerPart
 
@@ -0,0 +1,174 @@
+from tornado import gen
+from tornado.iostream import StreamClosedError
+from tornado.web import RequestHandler, asynchronous
+
+from malcolm.core import method_takes, Part, Subscribe, Unsubscribe, \
+    OutboundQueue, Error, is_pattern
+from malcolm.modules.builtin.vmetas import StringMeta, NumberMeta, ChoiceMeta
+from malcolm.modules.web.controllers import HTTPServerComms
+from malcolm.modules.web.infos import HandlerInfo
+
+
+class EventStreamHandler(RequestHandler):
+    _server_part = None
+    _loop = None
+    _queue = None
+    # [Subscribe] for each path, with id the index of the path
+    _subscribes = None
+    # Handle of the next keepalive, from IOLoop.call_later()
+    _keepalive = None
+
+    def initialize(self, server_part=None, loop=None):
+        self._server_part = server_part
+        self._loop = loop
+
+    # curl 'http://localhost:8080/events?path=hello/state/value&delta=1'
+    @asynchronous
+    def get(self):
+        # called from tornado thread
+        params = self._server_part.params
+        delta = self.get_argument("delta", "") in ("1", "true")
+        min_interval = float(self.get_argument("minInterval", 0))
+        self.set_header("Content-Type", "text/event-stream")
+        self.set_header("Cache-Control", "no-cache")
+        # Tell proxies like nginx not to buffer the stream
+        self.set_header("X-Accel-Buffering", "no")
+        self.flush()
+        self._queue = OutboundQueue(
+            self.start_drain, params.queueSize, params.queuePolicy,
+            self.disconnect)
+        self._subscribes = []
+        for i, endpoint_str in enumerate(self.get_arguments("path")):
+            request = Subscribe(
+                id=i, path=endpoint_str.split("/"), delta=delta,
+                callback=self.on_response)
+            if min_interval:
+                request.set_minInterval(min_interval)
+            try:
+                self._server_part.on_request(request)
+            except Exception as e:
+                self.on_response(Error(i, "%s: %s" % (
+                    e.__class__.__name__, e)))
+            else:
+                self._subscribes.append(request)
+        self._schedule_keepalive()
+
+    def on_response(self, response):
+        # called from any thread
+        self._queue.put(response)
+
+    def start_drain(self):
+        # called from any thread
+        self._loop.add_callback(self.drain)
+
+    @gen.coroutine
+    def drain(self):
+        # called in tornado's thread
+        response = self._queue.get()
+        # _subscribes is None once the stream has ended
+        while response is not None and self._subscribes is not None:
+            # The event names the type of the response, and the data is the
+            # same JSON that a websocket client would get, with the id giving
+            # the index of the path
+            self.write("event: %s\ndata: %s\n\n" % (
+                type(response).__name__, response.to_json()))
+            try:
+                # wait for each event to be written so a slow client backs up
+                # in our queue rather than in tornado's write buffer
+                yield self.flush()
+            except StreamClosedError:
+                # on_connection_close() will tidy up
+                return
+            response = self._queue.get()
+
+    def _schedule_keepalive(self):
+        # called in tornado's thread
+        interval = self._server_part.params.keepaliveInterval
+        if interval > 0:
+            self._keepalive = self._loop.call_later(
+                interval, self._send_keepalive)
+
+    @gen.coroutine
+    def _send_keepalive(self):
+        # called in tornado's thread. A comment line stops proxies timing out
+        # a stream that hasn't had an event for a while
+        self._keepalive = None
+        if self._subscribes is None:
+            # The stream has ended
+            return
+        self.write(":\n\n")
+        try:
+            yield self.flush()
+        except StreamClosedError:
+            # The client went away without us noticing, so unsubscribe
+            self.on_finish()
+        else:
+            if self._subscribes is not None:
+                self._schedule_keepalive()
+
+    def disconnect(self):
+        # called from any thread
+        self._loop.add_callback(self.finish)
+
+    def on_connection_close(self):
+        # called in tornado's thread when the client goes away
+        self.on_finish()
+
+    def on_finish(self):
+        # called in tornado's thread when we or the client end the stream
+        if self._keepalive is not None:
+            self._loop.remove_timeout(self._keepalive)
+            self._keepalive = None
+        subscribes, self._subscribes = self._subscribes or [], None
+        for request in subscribes:
+            self._server_part.on_unsubscribe(request)
+
+
+@method_takes(
+    "name", StringMeta(
+        "Name of the subdomain to stream Server-Sent Events on"), "events",
+    "queueSize", NumberMeta(
+        "int32", "Maximum number of responses queued for each client"), 1000,
+    "queuePolicy", ChoiceMeta(
+        "What to do when a client's queue is full",
+        OutboundQueue.policies), OutboundQueue.CONFLATE,
+    "keepaliveInterval", NumberMeta(
+        "float64", "Time between keepalive comments on quiet streams in "
+        "seconds, or 0 to not send them"), 15.0)
+class EventStreamServerPart(Part):
+    """Serves read-only subscriptions as Server-Sent Events. A GET with a
+    ?path= for each subscription gets a text/event-stream of their Update
+    (or with delta=1, Delta) responses"""
+
+    def __init__(self, params):
+        self.params = params
+        super(EventStreamServerPart, self).__init__(params.name)
+
+    @HTTPServerComms.ReportHandlers
+    def report_handlers(self, context, loop):
+        regexp = r"/%s" % self.params.name
+        info = HandlerInfo(
+            regexp, EventStreamHandler, server_part=self, loop=loop)
+        return [info]
+
+    def on_request(self, request):
+        # called from tornado thread
+        self._handle_request(request, request.path[0])
+
+    def on_unsubscribe(self, subscribe):
+        """Send the Unsubscribe for a Subscribe made with on_request()
+
+        Args:
+            subscribe (Subscribe): The Subscribe to end
+        """
+        # called from tornado thread
+        unsubscribe = Unsubscribe(subscribe.id, subscribe.callback)
+        self._handle_request(unsubscribe, subscribe.path[0])
+
+    def _handle_request(self, request, mri):
+        if is_pattern(mri):
+            # The Process subscribes to every matching Block for us
+            self.process.handle_request(request)
+        else:
+            controller = self.process.get_controller(mri)
+            controller.handle_request(request)
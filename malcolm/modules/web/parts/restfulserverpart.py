@@ -1,5 +1,8 @@
+from functools import partial
+
 from tornado.web import RequestHandler, asynchronous
 
+from malcolm.compat import OrderedDict
 from malcolm.core import method_takes, Part, json_decode, json_encode, Get, \
     Post, Return, Error
 from malcolm.modules.builtin.vmetas import StringMeta
@@ -10,17 +13,72 @@ from malcolm.modules.web.infos import HandlerInfo
 class RestfulHandler(RequestHandler):
     _server_part = None
     _loop = None
+    # [Response] for each path of a get, None until it arrives
+    _responses = None
+    # Whether the get was for many paths
+    _bulk = False
 
     def initialize(self, server_part=None, loop=None):
         self._server_part = server_part
         self._loop = loop
 
+    # curl http://localhost:8080/rest/hello/greet
+    # curl 'http://localhost:8080/rest/?path=hello/state&path=hello/health'
     @asynchronous
     def get(self, endpoint_str):
         # called from tornado thread
-        path = endpoint_str.split("/")
-        request = Get(path=path, callback=self.on_response)
-        self._server_part.on_request(request)
+        if endpoint_str:
+            paths = [endpoint_str]
+        else:
+            # Bulk get of every ?path= given
+            self._bulk = True
+            paths = self.get_arguments("path")
+        etag = self._server_part.make_etag(paths)
+        if etag:
+            self.set_header("Etag", etag)
+            if self.check_etag_header():
+                # Nothing has changed since the client last got it, so no
+                # need to ask for it, let alone serialize it
+                self.set_status(304)
+                self.finish()
+                return
+        self._responses = [None] * len(paths)
+        if not paths:
+            self._finish_get()
+        for i, endpoint_str in enumerate(paths):
+            request = Get(path=endpoint_str.split("/"),
+                          callback=partial(self.on_get_response, i))
+            try:
+                self._server_part.on_request(request)
+            except Exception as e:
+                self._on_get_response(i, Error(message="%s: %s" % (
+                    e.__class__.__name__, e)))
+
+    def on_get_response(self, i, response):
+        # called from any thread
+        self._loop.add_callback(self._on_get_response, i, response)
+
+    def _on_get_response(self, i, response):
+        # called from tornado thread
+        self._responses[i] = response
+        if None not in self._responses:
+            self._finish_get()
+
+    def _finish_get(self):
+        # called from tornado thread
+        if self._bulk:
+            # One document of {path: value}, with the Error for any that failed
+            d = OrderedDict()
+            for endpoint_str, response in zip(
+                    self.get_arguments("path"), self._responses):
+                if isinstance(response, Return):
+                    d[endpoint_str] = response.value
+                else:
+                    d[endpoint_str] = response
+            self.set_header("Content-Type", "application/json")
+            self.finish(json_encode(d) + "\n")
+        else:
+            self._on_response(self._responses[0])
 
     def on_response(self, response):
         # called from any thread
@@ -30,12 +88,15 @@ class RestfulHandler(RequestHandler):
         # called from tornado thread
         if isinstance(response, Return):
             message = json_encode(response.value)
+            self.set_header("Content-Type", "application/json")
             self.finish(message + "\n")
         else:
             if isinstance(response, Error):
                 message = response.message
             else:
                 message = "Unknown response %s" % type(response)
+            # Don't let the client cache an error
+            self.clear_header("Etag")
             self.set_status(500, message)
             self.write_error(500)
 
@@ -65,7 +126,28 @@ class RestfulServerPart(Part):
             regexp, RestfulHandler, server_part=self, loop=loop)
         return [info]
 
+    def make_etag(self, paths):
+        """Make an ETag that will change if anything in the Blocks that paths
+        are in does, without serializing anything
+
+        Args:
+            paths (list): ["mri/endpoint/..."] paths that will be got
+
+        Returns:
+            str: The ETag, or None if any of the Blocks don't exist
+        """
+        # called from tornado thread
+        revisions = []
+        for endpoint_str in paths:
+            mri = endpoint_str.split("/")[0]
+            try:
+                controller = self.process.get_controller(mri)
+            except ValueError:
+                return None
+            revisions.append(str(controller.revision))
+        return '"%s"' % "-".join(revisions)
+
     def on_request(self, request):
         # called from tornado thread
-        controller = self.get_controller(request.path[0])
+        controller = self.process.get_controller(request.path[0])
         controller.handle_request(request)
@@ -1,31 +1,276 @@
+import itertools
+import threading
+import time
+
+from tornado import gen
 from tornado.websocket import WebSocketHandler, WebSocketError
 
+from malcolm.compat import OrderedDict
+from malcolm.core.response import splice_table_rows
 from malcolm.modules.web.controllers import HTTPServerComms
+from malcolm.modules.web.controllers.websocketclientcomms import \
+    BINARY_SUBPROTOCOL, BATCH_ARGUMENT, compression_options, \
+    compression_threshold, private_protocol_attr
 from malcolm.core import method_takes, Part, json_decode, deserialize_object, \
-    Request, json_encode, Subscribe, Unsubscribe, Delta, Update
+    Request, Subscribe, Unsubscribe, Delta, Update, Error, EncodedPayload, \
+    OutboundQueue, Table, is_pattern, binary_decode
 from malcolm.modules.web.infos import HandlerInfo
-from malcolm.modules.builtin.vmetas import StringMeta
+from malcolm.modules.builtin.vmetas import StringMeta, NumberMeta, \
+    ChoiceMeta, StringArrayMeta, NumberArrayMeta, TableMeta
+from malcolm.tags import widget
+
+
+# Make a table for the outbound queue of each client
+columns = OrderedDict()
+columns["client"] = StringArrayMeta("Address of the client")
+columns["depth"] = NumberArrayMeta(
+    "int32", "Number of responses waiting to be sent")
+columns["maxDepth"] = NumberArrayMeta(
+    "int32", "Maximum number of responses that have been waiting")
+columns["dropped"] = NumberArrayMeta(
+    "int32", "Number of responses dropped or conflated away")
+outbound_queues_table_meta = TableMeta(
+    "Outbound queues of connected clients", elements=columns,
+    tags=[widget("table")])
+
+# Make a table for the compression of each client
+columns = OrderedDict()
+columns["client"] = StringArrayMeta("Address of the client")
+columns["messageBytes"] = NumberArrayMeta(
+    "int64", "Bytes of messages sent before compression")
+columns["wireBytes"] = NumberArrayMeta(
+    "int64", "Bytes sent on the wire after compression")
+columns["ratio"] = NumberArrayMeta(
+    "float64", "messageBytes / wireBytes")
+columns["cpuTime"] = NumberArrayMeta(
+    "float64", "Time spent compressing and writing compressed messages in "
+    "seconds")
+compression_table_meta = TableMeta(
+    "Websocket compression of connected clients", elements=columns,
+    tags=[widget("table")])
+
+# Minimum time between updates of the compression table in seconds
+COMPRESSION_UPDATE_PERIOD = 1.0
+
+
+# The share key of subscriptions to the published blocks
+PUBLISHED_KEY = ((".", "blocks"), False, 0, False)
+
+
+def _apply_change(o, path, change):
+    # Return o with change applied at path, copying rather than modifying
+    # everything on the way as it may be shared with the Notifier
+    if path:
+        o = OrderedDict() if o is None else o.copy()
+        if len(path) == 1 and len(change) == 1:
+            # Delete
+            o.pop(path[0], None)
+        else:
+            o[path[0]] = _apply_change(o.get(path[0], None), path[1:], change)
+        return o
+    elif len(change) == 3:
+        # Replace some rows of a serialized table
+        o = o.copy()
+        splice_table_rows(o, change[2][0], change[2][1], change[1])
+        return o
+    else:
+        # Update
+        return change[1]
+
+
+class SharedSubscription(object):
+    """An upstream Subscribe whose responses are sent on to every client
+    Subscribe with the same path and options, so that however many clients
+    there are, the Controller only has one subscriber to notify"""
+
+    def __init__(self, lock, delta, ended):
+        """
+        Args:
+            lock (RLock): The lock that protects the clients
+            delta (bool): Whether the responses are Deltas
+            ended (callable): Called with us, with the lock taken, when the
+                upstream Subscribe gets a Return or Error
+        """
+        self._lock = lock
+        self._delta = delta
+        self._ended = ended
+        # {Subscribe.generate_key(): Subscribe} of the clients
+        self.clients = OrderedDict()
+        # The upstream Subscribe, or None if it is made locally
+        self.request = None
+        # The serialized value so far, to send to new clients
+        self._value = None
+        self._has_value = False
+
+    def add_client(self, request):
+        """Add a client, sending it the value so far if there is one. Called
+        with the lock taken
+
+        Args:
+            request (Subscribe): The client Subscribe
+        """
+        self.clients[request.generate_key()] = request
+        if self._has_value:
+            if self._delta:
+                cb, response = request.delta_response([[[], self._value]])
+            else:
+                cb, response = request.update_response(self._value)
+            cb(response)
+
+    def remove_client(self, request):
+        """Remove a client, sending it a Return. Called with the lock taken
+
+        Args:
+            request (Subscribe): The client Subscribe
+
+        Returns:
+            bool: True if there are no clients left
+        """
+        self.clients.pop(request.generate_key(), None)
+        cb, response = request.return_response()
+        cb(response)
+        return not self.clients
+
+    def on_response(self, response):
+        """Send a response of the upstream Subscribe to every client, with
+        the same shared encoding. Called from any thread
+
+        Args:
+            response (Response): The Update, Delta, Return or Error
+        """
+        with self._lock:
+            if isinstance(response, Update):
+                self._value = response.value
+                self._has_value = True
+                encoded = response.encoded_payload or \
+                    EncodedPayload(response.value)
+                for request in self.clients.values():
+                    cb, r = request.update_response(response.value, encoded)
+                    cb(r)
+            elif isinstance(response, Delta):
+                for change in response.changes:
+                    self._value = _apply_change(self._value, change[0], change)
+                self._has_value = True
+                encoded = response.encoded_payload or \
+                    EncodedPayload(response.changes)
+                for request in self.clients.values():
+                    cb, r = request.delta_response(response.changes, encoded)
+                    cb(r)
+            else:
+                # The upstream Subscribe has ended, so end the clients' too
+                for request in self.clients.values():
+                    if isinstance(response, Error):
+                        r = Error(id=request.id, message=response.message)
+                        request.callback(r)
+                    else:
+                        cb, r = request.return_response()
+                        cb(r)
+                self._ended(self)
+                self.clients.clear()
 
 
 class MalcWebSocketHandler(WebSocketHandler):  # pylint:disable=abstract-method
     _server_part = None
     _loop = None
+    _queue = None
+    # Whether the client negotiated BINARY_SUBPROTOCOL
+    binary = False
+    # Whether the client asked for responses to be batched into JSON arrays
+    batch = False
+    # Time spent writing messages that were compressed
+    compress_time = 0.0
 
     def initialize(self, server_part=None, loop=None):
         self._server_part = server_part
         self._loop = loop
 
+    def select_subprotocol(self, subprotocols):
+        # called in tornado's thread. Browsers don't ask, so get JSON
+        if BINARY_SUBPROTOCOL in subprotocols:
+            self.binary = True
+            return BINARY_SUBPROTOCOL
+
+    def get_compression_options(self):
+        # called in tornado's thread. Clients that don't ask for
+        # permessage-deflate won't get it
+        return compression_options(self._server_part.params.compressionLevel)
+
+    def open(self):
+        # called in tornado's thread. Clients opt in to batching with a
+        # batch=1 query argument. Binary frames each number their own
+        # buffers so can't be joined
+        self.batch = not self.binary and \
+            self.get_argument(BATCH_ARGUMENT, "") in ("1", "true")
+        self._queue = self._server_part.on_open(self)
+
     def on_message(self, message):
         # called in tornado's thread
-        d = json_decode(message)
+        if isinstance(message, bytes):
+            d = binary_decode(message)
+        else:
+            d = json_decode(message)
         request = deserialize_object(d, Request)
         request.set_callback(self.on_response)
         self._server_part.on_request(request)
 
+    def write_message(self, message, binary=False):
+        # called in tornado's thread
+        protocol = self.ws_connection
+        threshold = self._server_part.params.compressionThreshold
+        with compression_threshold(protocol, message, threshold):
+            if private_protocol_attr(protocol, "_compressor") is None:
+                return super(MalcWebSocketHandler, self).write_message(
+                    message, binary)
+            start = time.time()
+            try:
+                return super(MalcWebSocketHandler, self).write_message(
+                    message, binary)
+            finally:
+                self.compress_time += time.time() - start
+
+    def compression_stats(self):
+        """Get the bytes sent by the client connection before and after
+        compression, and the time spent compressing
+
+        Returns:
+            tuple: (message_bytes, wire_bytes, compress_time)
+        """
+        # called in tornado's thread
+        protocol = self.ws_connection
+        return (private_protocol_attr(protocol, "_message_bytes_out") or 0,
+                private_protocol_attr(protocol, "_wire_bytes_out") or 0,
+                self.compress_time)
+
     def on_response(self, response):
         # called from any thread
-        self._loop.add_callback(
-            self._server_part.on_response, response, self.write_message)
+        self._queue.put(response)
+
+    def start_drain(self):
+        # called from any thread
+        self._loop.add_callback(self.drain)
+
+    @gen.coroutine
+    def drain(self):
+        # called in tornado's thread
+        response = self._queue.get()
+        while response is not None:
+            # wait for each message to be written so a slow client backs up
+            # in our queue rather than in tornado's write buffer
+            if self.batch:
+                response = yield self._server_part.on_batch(response, self)
+            else:
+                yield self._server_part.on_response(response, self)
+                response = self._queue.get()
+        self._server_part.update_outbound_queues()
+        self._server_part.update_compression()
+
+    def disconnect(self):
+        # called from any thread
+        self._loop.add_callback(self.close)
+
+    def on_close(self):
+        # called in tornado's thread
+        self._server_part.on_close(self)
 
     # http://stackoverflow.com/q/24851207
     # TODO: remove this when the web gui is hosted from the box
@@ -35,16 +280,56 @@ class MalcWebSocketHandler(WebSocketHandler):  # pylint:disable=abstract-method
 
 @method_takes(
     "name", StringMeta(
-        "Name of the subdomain to host the websocket on"), "ws")
+        "Name of the subdomain to host the websocket on"), "ws",
+    "queueSize", NumberMeta(
+        "int32", "Maximum number of responses queued for each client"), 1000,
+    "queuePolicy", ChoiceMeta(
+        "What to do when a client's queue is full",
+        OutboundQueue.policies), OutboundQueue.CONFLATE,
+    "batchWindow", NumberMeta(
+        "float64", "Time to gather responses for clients that asked for "
+        "batches in seconds"), 0.01,
+    "batchSize", NumberMeta(
+        "int32", "Maximum size of a batch of responses in bytes"), 65536,
+    "compressionLevel", NumberMeta(
+        "int32", "zlib level 1-9 to compress messages with for clients that "
+        "ask for permessage-deflate, or 0 to not compress"), 0,
+    "compressionThreshold", NumberMeta(
+        "int32", "Messages shorter than this many bytes aren't compressed"),
+    1024)
 class WebsocketServerPart(Part):
     def __init__(self, params):
         self.params = params
-        # {id: Subscribe}
+        # Protects _subscription_keys and _shared, and the clients of each
+        self._lock = threading.RLock()
+        # {Subscribe.generate_key(): Subscribe} for every client Subscribe
         self._subscription_keys = {}
+        # {share key: SharedSubscription}
+        self._shared = {}
+        # ids of the upstream Subscribes of SharedSubscriptions
+        self._upstream_ids = itertools.count()
         # [mri]
         self._published = []
+        # {MalcWebSocketHandler: OutboundQueue}
+        self._handlers = OrderedDict()
+        # {MalcWebSocketHandler: (max_depth, dropped)} at the last update
+        self._queue_stats = {}
+        # time.time() of the last update of the compression table
+        self._compression_updated = 0
+        # Created attributes
+        self.outbound_queues = None
+        self.compression = None
         super(WebsocketServerPart, self).__init__(params.name)
 
+    def create_attribute_models(self):
+        # Create read-only attribute showing how far behind each client is
+        self.outbound_queues = \
+            outbound_queues_table_meta.create_attribute_model()
+        yield "outboundQueues", self.outbound_queues, None
+        # And one showing how well their messages compress
+        self.compression = compression_table_meta.create_attribute_model()
+        yield "compression", self.compression, None
+
     @HTTPServerComms.ReportHandlers
     def report_handlers(self, context, loop):
         regexp = r"/%s" % self.params.name
@@ -52,56 +337,245 @@ class WebsocketServerPart(Part):
             regexp, MalcWebSocketHandler, server_part=self, loop=loop)
         return [info]
 
+    def on_open(self, handler):
+        # called from tornado thread
+        queue = OutboundQueue(
+            handler.start_drain, self.params.queueSize,
+            self.params.queuePolicy, handler.disconnect)
+        self._handlers[handler] = queue
+        self.update_outbound_queues(force=True)
+        self.update_compression(force=True)
+        return queue
+
+    def on_close(self, handler):
+        # called from tornado thread
+        self._handlers.pop(handler, None)
+        self._queue_stats.pop(handler, None)
+        self.update_outbound_queues(force=True)
+        self.update_compression(force=True)
+        # Unsubscribe anything the client left subscribed
+        with self._lock:
+            subscription_keys = list(self._subscription_keys.items())
+        for key, request in subscription_keys:
+            if key[0] == handler.on_response:
+                self.on_request(Unsubscribe(request.id, handler.on_response))
+
+    def update_outbound_queues(self, force=False):
+        # called from tornado thread
+        # Only update if a queue has got deeper or dropped things since the
+        # last update, otherwise we would update for every drain
+        for handler, queue in self._handlers.items():
+            stats = (queue.max_depth, queue.dropped)
+            if self._queue_stats.get(handler, None) != stats:
+                self._queue_stats[handler] = stats
+                force = True
+        if force:
+            queues = self._handlers.values()
+            table = Table(outbound_queues_table_meta)
+            table.client = [h.request.remote_ip for h in self._handlers]
+            table.depth = [q.depth for q in queues]
+            table.maxDepth = [q.max_depth for q in queues]
+            table.dropped = [q.dropped for q in queues]
+            self.outbound_queues.set_value(table)
+
+    def update_compression(self, force=False):
+        # called from tornado thread
+        # Every drain sends more, so only update every so often
+        now = time.time()
+        if force or \
+                now - self._compression_updated > COMPRESSION_UPDATE_PERIOD:
+            self._compression_updated = now
+            stats = [h.compression_stats() for h in self._handlers]
+            table = Table(compression_table_meta)
+            table.client = [h.request.remote_ip for h in self._handlers]
+            table.messageBytes = [s[0] for s in stats]
+            table.wireBytes = [s[1] for s in stats]
+            table.ratio = [float(s[0]) / s[1] if s[1] else 1.0
+                           for s in stats]
+            table.cpuTime = [s[2] for s in stats]
+            self.compression.set_value(table)
+
     def on_request(self, request):
         # called from tornado thread
         if isinstance(request, Subscribe):
-            if request.path[0] == ".":
-                # special entries
-                assert request.path[1] == "blocks", \
-                    "Don't know how to subscribe to %s" % (request.path,)
-                self._notify_published(request)
-            self._subscription_keys[request.id] = request
-            if request.path[0] == ".":
-                return
-
+            share_key = self._share_key(request)
+            with self._lock:
+                self._subscription_keys[request.generate_key()] = request
+                if share_key is not None:
+                    upstream = self._add_shared_client(share_key, request)
+                    if upstream is None:
+                        return
+                    request = upstream
         if isinstance(request, Unsubscribe):
-            subscribe = self._subscription_keys.pop(request.id)
+            with self._lock:
+                subscribe = self._subscription_keys.pop(
+                    request.generate_key(), None)
+                if subscribe is None:
+                    # Its upstream Subscribe has already ended
+                    return
+                share_key = self._share_key(subscribe)
+                if share_key is not None:
+                    upstream = self._remove_shared_client(share_key, subscribe)
+                    if upstream is None:
+                        return
+                    request = Unsubscribe(upstream.id, upstream.callback)
             mri = subscribe.path[0]
-            if mri == ".":
-                # service requests on ourself
-                response, cb = subscribe.return_response()
-                cb(response)
-                return
         else:
             mri = request.path[0]
-        controller = self.process.get_controller(mri)
-        controller.handle_request(request)
+        try:
+            if is_pattern(mri):
+                # The Process subscribes to every matching Block for us
+                self.process.handle_request(request)
+            else:
+                controller = self.process.get_controller(mri)
+                controller.handle_request(request)
+        except Exception as e:
+            if not isinstance(request, Subscribe):
+                raise
+            self._subscribe_failed(request, e)
+
+    def _subscribe_failed(self, request, exception):
+        """Answer a Subscribe that couldn't be sent on with an Error. If it
+        is the upstream of a SharedSubscription then this forgets it and
+        sends every client the Error too"""
+        with self._lock:
+            self._subscription_keys.pop(request.generate_key(), None)
+            cb, response = request.error_response(exception)
+            cb(response)
+
+    @staticmethod
+    def _share_key(request):
+        """Get the key that Subscribes with the same responses share, or None
+        if they need their own upstream Subscribe"""
+        if request.path[0] == ".":
+            # special entries, only ever sent as Updates
+            assert list(request.path) == [".", "blocks"], \
+                "Don't know how to subscribe to %s" % (request.path,)
+            return PUBLISHED_KEY
+        elif request.fromRevision is None and request.predicate is None:
+            return (tuple(request.path), request.delta, request.minInterval,
+                    request.tableDeltas)
+
+    def _add_shared_client(self, share_key, request):
+        """Add a client to the SharedSubscription for share_key, making it if
+        needed. Called with lock taken
+
+        Returns:
+            Subscribe: The upstream Subscribe to send if it was made, or None
+        """
+        shared = self._shared.get(share_key, None)
+        upstream = None
+        if shared is None:
+            shared = SharedSubscription(
+                self._lock, share_key[1], self._end_shared)
+            self._shared[share_key] = shared
+            if share_key == PUBLISHED_KEY:
+                # We are the upstream
+                shared.on_response(Update(value=self._published))
+            else:
+                upstream = Subscribe(
+                    id=next(self._upstream_ids), path=list(share_key[0]),
+                    delta=share_key[1], callback=shared.on_response)
+                upstream.set_minInterval(share_key[2])
+                upstream.set_tableDeltas(share_key[3])
+                shared.request = upstream
+        shared.add_client(request)
+        return upstream
+
+    def _remove_shared_client(self, share_key, request):
+        """Remove a client from the SharedSubscription for share_key, ending
+        it if it was the last. Called with lock taken
 
-    def on_response(self, response, write_message):
+        Returns:
+            Subscribe: The upstream Subscribe to unsubscribe if it was the
+                last client, or None
+        """
+        shared = self._shared.get(share_key, None)
+        if shared is None:
+            # upstream has already ended
+            return
+        if shared.remove_client(request):
+            self._shared.pop(share_key)
+            return shared.request
+
+    def _end_shared(self, shared):
+        """Forget a SharedSubscription whose upstream has ended, and its
+        clients. Called with lock taken"""
+        for share_key, s in list(self._shared.items()):
+            if s is shared:
+                self._shared.pop(share_key)
+        for request in shared.clients.values():
+            self._subscription_keys.pop(request.generate_key(), None)
+
+    @gen.coroutine
+    def on_response(self, response, handler):
         # called from tornado thread
-        message = json_encode(response)
+        # Subscription responses splice their id into a payload that is
+        # encoded once and shared between all clients
+        if handler.binary:
+            message = response.to_binary()
+        else:
+            message = response.to_json()
         try:
-            write_message(message)
+            yield handler.write_message(message, binary=handler.binary)
         except WebSocketError:
-            if isinstance(response, (Delta, Update)):
-                request = self._subscription_keys[response.id]
-                unsubscribe = Unsubscribe(request.id)
-                controller = self.process.get_controller(request.path[0])
-                controller.handle_request(unsubscribe)
+            self._unsubscribe_failed([response], handler)
 
-    @HTTPServerComms.Publish
-    def publish(self, context, publish):
-        # called from any thread
-        self._published = publish
-        for request in self._subscription_keys.values():
-            if request.path[0] == ".":
-                self._notify_published(request)
-
-    def _notify_published(self, request):
-        # called from any thread
-        cb, response = request.update_response(self._published)
-        cb(response)
+    @gen.coroutine
+    def on_batch(self, response, handler):
+        """Send response, and any more that are queued for the handler after
+        batchWindow if some already were, as one JSON array frame of at most
+        about batchSize bytes
 
+        Args:
+            response (Response): The first response of the batch
+            handler (MalcWebSocketHandler): The handler of the client
 
+        Returns:
+            Response: The next response to send if the batch was full, or
+                None if the queue was emptied
+        """
+        # called from tornado thread
+        queue = self._handlers.get(handler, None)
+        if self.params.batchWindow > 0 and queue is not None and \
+                queue.depth:
+            # More are already coming, so let the producer queue some more.
+            # A lone response on an idle connection is sent at once
+            yield gen.sleep(self.params.batchWindow)
+        responses = []
+        messages = []
+        size = 0
+        while response is not None:
+            message = response.to_json()
+            responses.append(response)
+            messages.append(message)
+            size += len(message)
+            if size >= self.params.batchSize or queue is None:
+                break
+            response = queue.get()
+        try:
+            yield handler.write_message("[%s]" % ",".join(messages))
+        except WebSocketError:
+            self._unsubscribe_failed(responses, handler)
+        if response is not None and queue is not None:
+            # The batch was full, so carry on with the next one
+            raise gen.Return(queue.get())
 
+    def _unsubscribe_failed(self, responses, handler):
+        # called from tornado thread
+        for response in responses:
+            if isinstance(response, (Delta, Update)):
+                key = (handler.on_response, response.id)
+                request = self._subscription_keys.get(key, None)
+                if request and request.path[0] != ".":
+                    unsubscribe = Unsubscribe(request.id, request.callback)
+                    self.on_request(unsubscribe)
 
+    @HTTPServerComms.Publish
+    def publish(self, context, publish):
+        # called from any thread
+        with self._lock:
+            self._published = publish
+            shared = self._shared.get(PUBLISHED_KEY, None)
+            if shared:
+                shared.on_response(Update(value=publish))
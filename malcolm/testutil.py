@@ -31,11 +31,17 @@ class ChildTestCase(unittest.TestCase):
             child.handled_requests.put(attr_name, request.value)
             return [request.return_response()]
 
+        def handle_put_many(request):
+            for attr_name, value in request.values.items():
+                child.handled_requests.put(attr_name, value)
+            return [request.return_response()]
+
         def handle_post(request):
             method_name = request.path[1]
             child.handled_requests.post(method_name, **request.parameters)
             return [request.return_response()]
 
         child._handle_put = handle_put
+        child._handle_put_many = handle_put_many
         child._handle_post = handle_post
         return child
@@ -33,7 +33,20 @@ class TestAttribute(unittest.TestCase):
         assert f == self.context.put_async.return_value
 
     def test_repr(self):
-        self.controller.make_view.return_value = "foo"
+        self.data.value = "foo"
         assert repr(self.o) == "<Attribute value='foo'>"
+        # Plain values are read without making a View
+        self.controller.make_view.assert_not_called()
+
+    def test_value_needing_view(self):
+        self.data.value = {"a": 1}
+        assert self.o.value == self.controller.make_view.return_value
         self.controller.make_view.assert_called_once_with(
-            self.context, self.o, "value")
+            self.context, self.data, "value")
+
+    def test_subscribe(self):
+        cb = Mock()
+        f = self.o.subscribe_value(cb, 3)
+        self.context.subscribe.assert_called_once_with(
+            ["block", "attr", "value"], cb, 3)
+        assert f == self.context.subscribe.return_value
@@ -1,5 +1,5 @@
 import unittest
-from mock import Mock
+from mock import Mock, call
 
 from malcolm.core.block import make_block_view
 from malcolm.core.blockmodel import BlockModel
@@ -24,10 +24,42 @@ class TestBlock(unittest.TestCase):
 
     def test_put_attribute_values(self):
         self.o.put_attribute_values(dict(attr=43))
-        self.context.put_async.assert_called_once_with(
-            ["block", "attr", "value"], 43)
+        self.context.put_many_async.assert_called_once_with(
+            ["block"], dict(attr=43))
         self.context.wait_all_futures.assert_called_once_with(
-            [self.context.put_async.return_value], timeout=None)
+            [self.context.put_many_async.return_value], timeout=None)
+
+    def test_put_attribute_values_without_put_many(self):
+        self.controller.put_many_supported = False
+        data = BlockModel()
+        data.set_endpoint_data("attr", StringMeta().create_attribute_model())
+        data.set_endpoint_data("attr2", StringMeta().create_attribute_model())
+        data.set_notifier_path(Mock(), ["block"])
+        self.o = make_block_view(self.controller, self.context, data)
+        futures = self.o.put_attribute_values_async(dict(attr=43, attr2=44))
+        assert self.context.put_async.call_args_list == [
+            call(["block", "attr", "value"], 43),
+            call(["block", "attr2", "value"], 44)]
+        assert futures == [self.context.put_async.return_value] * 2
+        self.context.put_many_async.assert_not_called()
+
+    def test_put_attribute_values_empty(self):
+        assert self.o.put_attribute_values_async({}) == []
+        self.context.put_many_async.assert_not_called()
+
+    def test_class_cached(self):
+        o2 = make_block_view(self.controller, Mock(), self.data)
+        assert type(o2) is type(self.o)
+        assert o2._context is not self.o._context
+        # Different endpoints make a new class
+        data = BlockModel()
+        data.set_endpoint_data("attr", StringMeta().create_attribute_model())
+        data.set_endpoint_data("attr2", StringMeta().create_attribute_model())
+        data.set_notifier_path(Mock(), ["block"])
+        o3 = make_block_view(self.controller, self.context, data)
+        assert type(o3) is not type(self.o)
+        assert hasattr(o3, "attr2")
+        assert not hasattr(self.o, "attr2")
 
     def test_async_call(self):
         self.o.method_async(a=3)
@@ -1,14 +1,16 @@
+import threading
 import unittest
 from mock import MagicMock, ANY, call
 import time
 
 from malcolm.core.context import Context
 from malcolm.core.errors import ResponseError, TimeoutError, BadValueError, \
-    AbortedError
-from malcolm.core.request import Put, Post, Subscribe, Unsubscribe
+    AbortedError, WrongThreadError
+from malcolm.core.request import Put, PutMany, Post, Subscribe, Unsubscribe
 from malcolm.core.response import Error, Return, Update
 from malcolm.core.process import Process
 from malcolm.core.future import Future
+from malcolm.core.predicate import GreaterOrEqual
 from malcolm.compat import maybe_import_cothread
 
 
@@ -49,6 +51,20 @@ class TestContext(unittest.TestCase):
             self.o.put(["block", "attr", "value"], 32)
         assert str(cm.exception) == "Test Exception"
 
+    def test_put_many(self):
+        self.o._q.put(Return(1, dict(attr=dict(value=None),
+                                     attr2=dict(value=None))))
+        self.o.put_many(["block"], dict(attr=32, attr2="x"))
+        self.controller.handle_request.assert_called_once_with(
+            PutMany(1, ["block"], dict(attr=32, attr2="x")))
+
+    def test_put_many_failure(self):
+        self.o._q.put(Return(1, dict(attr=dict(value=None),
+                                     attr2=dict(error="Bad"))))
+        with self.assertRaises(ResponseError) as cm:
+            self.o.put_many(["block"], dict(attr=32, attr2="x"))
+        assert str(cm.exception) == "attr2: Bad"
+
     def test_post(self):
         self.controller.validate_result.return_value = 22
         self.o._q.put(Return(1, dict(a=2)))
@@ -119,6 +135,102 @@ class TestContext(unittest.TestCase):
         self.o.wait_all_futures(fs, 0.01)
         assert [f.done() for f in fs] == [True, True]
 
+    def test_put_resolved_by_callback(self):
+        f = self.o.put_async(["block", "attr", "value"], 32)
+        request = self.controller.handle_request.call_args[0][0]
+        # No-one is servicing the queue, but it resolves anyway
+        request.callback(Return(1, None))
+        assert f.done()
+        assert f.result(0) is None
+        assert not self.o._futures
+
+    def test_puts_resolved_by_other_threads(self):
+        fs = [self.o.put_async(["block", "attr", "value"], i)
+              for i in range(200)]
+        requests = [
+            c[0][0] for c in self.controller.handle_request.call_args_list]
+
+        def resolve(requests):
+            for request in requests:
+                request.callback(Return(request.id, None))
+
+        threads = [threading.Thread(target=resolve, args=(requests[i::4],))
+                   for i in range(4)]
+        for t in threads:
+            t.start()
+        # Iterating our requests while they are resolved mustn't fail
+        while [t for t in threads if t.is_alive()]:
+            self.o.unsubscribe_all()
+        for t in threads:
+            t.join()
+        assert [f.done() for f in fs] == [True] * 200
+        assert not self.o._futures
+        assert not self.o._requests
+
+    def test_post_resolved_by_callback(self):
+        self.controller.validate_result.return_value = 22
+        f = self.o.post_async(["block", "method"], dict(b=32))
+        request = self.controller.handle_request.call_args[0][0]
+        request.callback(Return(1, dict(a=2)))
+        assert f.result(0) == 22
+
+    def test_post_result_validated_in_wrong_thread(self):
+        self.controller.validate_result.side_effect = [
+            WrongThreadError(), 22]
+        f = self.o.post_async(["block", "method"], dict(b=32))
+        request = self.controller.handle_request.call_args[0][0]
+        request.callback(Return(1, dict(a=2)))
+        # Left for the servicing thread
+        assert not f.done()
+        assert f.result(0) == 22
+
+    def test_put_resolved_in_another_thread(self):
+        f = self.o.put_async(["block", "attr", "value"], 32)
+        request = self.controller.handle_request.call_args[0][0]
+        t = threading.Timer(0.01, request.callback, (Error(1, "Bad"),))
+        t.start()
+        with self.assertRaises(ResponseError):
+            self.o.wait_all_futures(f, timeout=1)
+        t.join()
+
+    def test_gather(self):
+        fs = [self.o.put_async(["block", "attr", "value"], 32),
+              self.o.put_async(["block", "attr2", "value"], 32)]
+        self.o._q.put(Return(2, "b"))
+        self.o._q.put(Return(1, "a"))
+        assert self.o.gather(fs, timeout=0.01) == ["a", "b"]
+
+    def test_gather_error(self):
+        fs = [self.o.put_async(["block", "attr", "value"], 32),
+              self.o.put_async(["block", "attr2", "value"], 32)]
+        gathered = self.o.gather_async(fs)
+        self.o._q.put(Error(2, "Bad"))
+        with self.assertRaises(ResponseError):
+            self.o.wait_all_futures(gathered, 0.01)
+        # The other one finishing doesn't change it
+        self.o._q.put(Return(1, "a"))
+        self.o.wait_all_futures(fs[0], 0.01)
+        assert str(gathered.exception()) == "Bad"
+
+    def test_gather_empty(self):
+        assert self.o.gather([]) == []
+
+    def test_as_completed(self):
+        fs = [self.o.put_async(["block", "attr", "value"], 32),
+              self.o.put_async(["block", "attr2", "value"], 32),
+              self.o.put_async(["block", "attr3", "value"], 32)]
+        self.o._q.put(Return(3, None))
+        self.o._q.put(Error(1, "Bad"))
+        self.o._q.put(Return(2, None))
+        done = list(self.o.as_completed(fs, timeout=0.01))
+        assert done == [fs[2], fs[0], fs[1]]
+        assert isinstance(fs[0].exception(), ResponseError)
+
+    def test_as_completed_timeout(self):
+        fs = [self.o.put_async(["block", "attr", "value"], 32)]
+        with self.assertRaises(TimeoutError):
+            list(self.o.as_completed(fs, timeout=0.01))
+
     def test_sleep(self):
         start = time.time()
         self.o.sleep(0.05)
@@ -129,9 +241,21 @@ class TestContext(unittest.TestCase):
         self.o._q.put(Update(1, "value1"))
         self.o._q.put(Return(1))
         self.o.when_matches(["block", "attr", "value"], "value1", timeout=0.01)
+        # The controller ends the subscription itself
         assert self.controller.handle_request.call_args_list == [
-            call(Subscribe(1, ["block", "attr", "value"])),
-            call(Unsubscribe(1))]
+            call(Subscribe(1, ["block", "attr", "value"],
+                           predicate=dict(equals="value1")))]
+        assert not self.o._requests
+        assert not self.o._pending_unsubscribes
+
+    def test_when_matches_greater_or_equal(self):
+        self.o._q.put(Update(1, 5))
+        self.o._q.put(Return(1))
+        self.o.when_matches(
+            ["block", "attr", "value"], GreaterOrEqual(3), timeout=0.01)
+        assert self.controller.handle_request.call_args_list == [
+            call(Subscribe(1, ["block", "attr", "value"],
+                           predicate=dict(greaterOrEqual=3)))]
 
     def test_when_matches_func(self):
         self.o._q.put(Update(1, "value1"))
@@ -151,8 +275,11 @@ class TestContext(unittest.TestCase):
             self.o.when_matches(
                 ["block", "attr", "value"], "value1", ["value2"], timeout=0.01)
         assert self.controller.handle_request.call_args_list == [
-            call(Subscribe(1, ["block", "attr", "value"])),
-            call(Unsubscribe(1))]
+            call(Subscribe(1, ["block", "attr", "value"], predicate=dict(
+                equals="value1", badValues=["value2"])))]
+        # Don't unsubscribe from what the controller is ending
+        self.o.unsubscribe_all()
+        assert len(self.controller.handle_request.call_args_list) == 1
 
     def test_ignore_stops_before_now(self):
         fs = [self.o.put_async(["block", "attr", "value"], 32)]
@@ -11,9 +11,11 @@ from malcolm.core.context import Context
 from malcolm.core.model import Model
 from malcolm.core.blockmodel import BlockModel
 from malcolm.core.queue import Queue
-from malcolm.core.request import Post, Subscribe, Put, Get, Unsubscribe
+from malcolm.compat import OrderedDict
+from malcolm.core.request import Post, Subscribe, Put, PutMany, Get, \
+    Unsubscribe
 from malcolm.core.response import Return, Update, Error
-from malcolm.core.errors import AbortedError
+from malcolm.core.errors import AbortedError, ResponseError
 from malcolm.core.mapmeta import MapMeta
 from malcolm.core.methodmodel import MethodModel, OPTIONAL
 from malcolm.core import method_takes, method_returns
@@ -203,3 +205,85 @@ class TestController(unittest.TestCase):
         response = q.get(timeout=.1)
         self.assertIsInstance(response, Return)
         assert response.id == 44
+
+
+class PutManyPart(Part):
+    def create_attribute_models(self):
+        for name in ("first", "second", "third"):
+            meta = StringMeta(description=name, writeable=True)
+            attr = meta.create_attribute_model()
+            setattr(self, name, attr)
+            yield name, attr, self.make_writer(attr)
+
+    def make_writer(self, attr):
+        def writer(value):
+            if value == "bad":
+                raise ValueError("Bad value for %s" % attr.meta.description)
+            attr.set_value(value)
+        return writer
+
+
+class TestPutMany(unittest.TestCase):
+
+    def setUp(self):
+        self.process = Process("proc")
+        self.part = PutManyPart("part")
+        self.o = Controller(self.process, "mri", [self.part])
+        self.process.add_controller("mri", self.o)
+        self.process.start()
+
+    def tearDown(self):
+        self.process.stop(timeout=1)
+
+    def test_put_many(self):
+        q = Queue()
+        request = PutMany(id=45, path=["mri"], values=OrderedDict([
+            ("third", "c"), ("first", "a")]), callback=q.put)
+        self.o.handle_request(request)
+        response = q.get(timeout=1)
+        self.assertIsInstance(response, Return)
+        assert list(response.value) == ["third", "first"]
+        assert response.value["first"] == dict(value=None)
+        assert self.part.first.value == "a"
+        assert self.part.second.value == ""
+        assert self.part.third.value == "c"
+
+    def test_put_many_errors_per_field(self):
+        q = Queue()
+        request = PutMany(id=46, path=["mri"], values=OrderedDict([
+            ("first", "bad"), ("second", "b"), ("third", "bad")]),
+            callback=q.put)
+        self.o.handle_request(request)
+        response = q.get(timeout=1)
+        self.assertIsInstance(response, Return)
+        assert response.id == 46
+        assert response.value == dict(
+            first=dict(error="ValueError: Bad value for first"),
+            second=dict(value=None),
+            third=dict(error="ValueError: Bad value for third"))
+        assert list(response.value) == ["first", "second", "third"]
+        # The good one still gets put
+        assert self.part.second.value == "b"
+
+    def test_put_many_checks_all_first(self):
+        q = Queue()
+        self.part.third.meta.set_writeable(False)
+        request = PutMany(id=47, path=["mri"], values=OrderedDict([
+            ("first", "a"), ("third", "c")]), callback=q.put)
+        self.o.handle_request(request)
+        response = q.get(timeout=1)
+        self.assertIsInstance(response, Error)
+        assert "third is not writeable" in response.message
+        assert self.part.first.value == ""
+
+    def test_block_put_attribute_values(self):
+        context = Context(self.process)
+        block = context.block_view("mri")
+        block.put_attribute_values(dict(first="a", second="b"))
+        assert self.part.first.value == "a"
+        assert self.part.second.value == "b"
+        with self.assertRaises(ResponseError) as cm:
+            block.put_attribute_values(dict(first="bad", second="c"))
+        assert str(cm.exception) == \
+            "first: ValueError: Bad value for first"
+        assert self.part.second.value == "c"
@@ -0,0 +1,121 @@
+import os
+import unittest
+
+from mock import patch
+
+from malcolm.compat import get_pool_num_threads
+from malcolm.core.errors import WrongThreadError
+from malcolm.core.eventloop import EventLoop, in_event_loop_thread
+from malcolm.core.process import Process
+from malcolm.core.queue import Queue
+from malcolm.core.spawnlane import LOOP_LANE, BACKGROUND_LANE, HOOK_LANE, \
+    CONTROL_LANE
+from malcolm.core import eventloop
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+
+@unittest.skipIf(asyncio is None, "asyncio not available")
+class TestEventLoop(unittest.TestCase):
+
+    def setUp(self):
+        self.o = EventLoop(asyncio)
+        # Make it the shared one so Queue knows about it
+        self.old_event_loop = eventloop._event_loop
+        eventloop._event_loop = self.o
+
+    def tearDown(self):
+        eventloop._event_loop = self.old_event_loop
+        self.o._loop.call_soon_threadsafe(self.o._loop.stop)
+
+    def test_apply_async_runs_in_loop_thread(self):
+        q = Queue()
+        assert not in_event_loop_thread()
+        self.o.apply_async(lambda: q.put(in_event_loop_thread()))
+        assert q.get(timeout=1) is True
+        stats = self.o.stats()
+        assert stats["total"] == 1
+        assert stats["queued"] == 0
+
+    def test_queue_get_cant_block_loop(self):
+        q = Queue()
+        results = Queue()
+
+        def get():
+            try:
+                results.put(q.get(timeout=1))
+            except WrongThreadError as e:
+                results.put(e)
+
+        self.o.apply_async(get)
+        assert isinstance(results.get(timeout=1), WrongThreadError)
+        # But it can take things that are already there
+        q.put("there")
+        self.o.apply_async(get)
+        assert results.get(timeout=1) == "there"
+
+    def test_io_loop(self):
+        io_loop = self.o.io_loop()
+        assert io_loop is self.o.io_loop()
+        q = Queue()
+        io_loop.add_callback(lambda: q.put(in_event_loop_thread()))
+        assert q.get(timeout=1) is True
+
+    def test_process_loop_lane(self):
+        process = Process("proc")
+        process._event_loop = self.o
+        process.start()
+        try:
+            spawned = process.spawn(in_event_loop_thread, (), {}, True,
+                                    LOOP_LANE)
+            assert spawned.get(timeout=1) is True
+            assert process.lane_stats()[LOOP_LANE]["total"] == 1
+        finally:
+            process.stop(timeout=1)
+
+    @patch.dict(os.environ, {"PYMALCOLM_USE_ASYNCIO": "YES"})
+    def test_nested_hook_spawns_dont_deadlock(self):
+        process = Process("proc")
+        # setUp made the shared one, so it will be stopped in tearDown
+        assert process._event_loop is self.o
+        sizes = process.lane_stats()
+        # No more threads than without asyncio, including the loop's
+        assert sum(sizes[lane]["threads"] for lane in (
+            CONTROL_LANE, HOOK_LANE, BACKGROUND_LANE)) + 1 == \
+            get_pool_num_threads()
+        assert sizes[BACKGROUND_LANE]["threads"] == \
+            sizes[CONTROL_LANE]["threads"]
+        process.start()
+
+        def nest(depth):
+            if depth:
+                # Blocks this thread until the child is done
+                return process.spawn(
+                    nest, (depth - 1,), {}, False, HOOK_LANE).get(timeout=5)
+            else:
+                return "bottom"
+
+        try:
+            spawned = process.spawn(nest, (20,), {}, False, HOOK_LANE)
+            assert spawned.get(timeout=5) == "bottom"
+        finally:
+            process.stop(timeout=1)
+
+
+class TestNoEventLoop(unittest.TestCase):
+
+    def test_loop_lane_is_background(self):
+        process = Process("proc")
+        process._event_loop = None
+        process.start()
+        try:
+            spawned = process.spawn(lambda: 3, (), {}, False, LOOP_LANE)
+            assert spawned.get(timeout=1) == 3
+            stats = process.lane_stats()
+            assert LOOP_LANE not in stats
+            assert stats[BACKGROUND_LANE]["total"] == 1
+        finally:
+            process.stop(timeout=1)
@@ -57,3 +57,25 @@ class TestFuture(unittest.TestCase):
         self.context.wait_all_futures.reset_mock()
         self.assertIsInstance(f.exception(), MyError)
         self.context.wait_all_futures.assert_not_called()
+
+    def test_add_done_callback(self):
+        f = Future(self.context)
+        cb = MagicMock()
+        f.add_done_callback(cb)
+        cb.assert_not_called()
+        f.set_result(32)
+        cb.assert_called_once_with(f)
+        # Already done, so called straight away
+        cb2 = MagicMock()
+        f.add_done_callback(cb2)
+        cb2.assert_called_once_with(f)
+
+    def test_callback_exception_doesnt_stop_others(self):
+        f = Future(self.context)
+        bad = MagicMock(side_effect=MyError())
+        good = MagicMock()
+        f.add_done_callback(bad)
+        f.add_done_callback(good)
+        f.set_exception(ValueError("test Error"))
+        bad.assert_called_once_with(f)
+        good.assert_called_once_with(f)
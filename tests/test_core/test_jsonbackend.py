@@ -0,0 +1,75 @@
+import os
+import sys
+import unittest
+from mock import patch
+
+import numpy as np
+
+from malcolm.compat import OrderedDict
+from malcolm.core.jsonbackend import StdlibJSONBackend, OrjsonBackend, \
+    choose_json_backend
+from malcolm.core.serializable import serialize_hook, json_splice, \
+    json_encode
+from malcolm.modules.builtin.vmetas import NumberArrayMeta
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class TestStdlibJSONBackend(unittest.TestCase):
+    backend = StdlibJSONBackend()
+
+    def test_round_trip_keeps_order(self):
+        d = OrderedDict()
+        d["z"] = 1
+        d["a"] = [np.float64(1.5), np.int32(2)]
+        d["m"] = np.array([3, 4])
+        text = self.backend.encode(d, serialize_hook)
+        decoded = self.backend.decode(text)
+        assert list(decoded) == ["z", "a", "m"]
+        assert decoded == dict(z=1, a=[1.5, 2], m=[3, 4])
+
+    def test_2d_array_rejected(self):
+        with self.assertRaises(AssertionError):
+            self.backend.encode(np.zeros((2, 2)), serialize_hook)
+
+    def test_nested_2d_array_rejected(self):
+        attr = NumberArrayMeta("float64").create_attribute_model(
+            np.zeros((2, 2)))
+        with self.assertRaises(AssertionError):
+            self.backend.encode(dict(attr=attr), serialize_hook)
+
+    def test_compact(self):
+        text = self.backend.encode(
+            dict(a=[1, np.array([2.5, 3])]), serialize_hook)
+        assert text == '{"a":[1,[2.5,3.0]]}'
+
+
+@unittest.skipIf(orjson is None, "orjson not installed")
+class TestOrjsonBackend(TestStdlibJSONBackend):
+    backend = OrjsonBackend(orjson) if orjson else None
+
+    def test_big_int(self):
+        assert self.backend.encode([2 ** 70], serialize_hook) == \
+            "[%d]" % 2 ** 70
+
+
+class TestChooseJSONBackend(unittest.TestCase):
+
+    @patch.dict("os.environ", {"PYMALCOLM_JSON_BACKEND": "json"})
+    def test_override(self):
+        assert choose_json_backend().name == "json"
+
+    @patch.dict("os.environ")
+    def test_default(self):
+        os.environ.pop("PYMALCOLM_JSON_BACKEND", None)
+        if orjson is None or sys.version_info < (3, 7):
+            assert choose_json_backend().name == "json"
+        else:
+            assert choose_json_backend().name == "orjson"
+
+    def test_splice(self):
+        assert json_splice([("a", "1"), ("b", "[2]")]) == \
+            json_encode(OrderedDict([("a", 1), ("b", [2])]))
@@ -1,13 +1,19 @@
+import threading
+import time
 import unittest
-from mock import Mock
+from copy import deepcopy
+from mock import Mock, patch
 from threading import RLock
 
 # module imports
 from malcolm.compat import OrderedDict
-from malcolm.core.notifier import Notifier
+from malcolm.core.notifier import Notifier, squash_changes
+from malcolm.core.queue import Queue
 from malcolm.core.request import Return, Subscribe, Unsubscribe
 from malcolm.core.response import Update, Delta
 from malcolm.core.serializable import serialize_object
+from malcolm.core.table import Table, find_changed_rows
+from malcolm.modules.builtin.vmetas import StringArrayMeta, NumberArrayMeta
 
 
 class Dummy(object):
@@ -140,3 +146,445 @@ class TestNotifier(unittest.TestCase):
             assert self.block.attr2.value == "tr"
         r1.callback.assert_called_once_with(Delta(
             changes=[[["attr", "value"], 33], [["attr2", "value"], "tr"]]))
+
+    def test_intermediate_changes_squashed(self):
+        # set some data
+        self.block["attr"] = Dummy()
+        self.block.attr["value"] = 32
+        self.block.attr["alarm"] = "OK"
+        self.block["attr2"] = Dummy()
+        self.block.attr2["value"] = "st"
+        r1 = Subscribe(path=["b"], delta=True, callback=Mock())
+        self.handle_subscribe(r1)
+        r2 = Subscribe(
+            path=["b", "attr", "value"], delta=False, callback=Mock())
+        self.handle_subscribe(r2)
+        r1.callback.reset_mock()
+        r2.callback.reset_mock()
+        # set the same endpoint several times, then replace its parent
+        with self.o.changes_squashed:
+            for i in range(33, 36):
+                self.block.attr["value"] = i
+                self.o.add_squashed_change(["b", "attr", "value"], i)
+            self.block.attr2["value"] = "tr"
+            self.o.add_squashed_change(["b", "attr2", "value"], "tr")
+            self.block["attr"] = Dummy()
+            self.block.attr["value"] = 36
+            self.o.add_squashed_change(["b", "attr"], self.block.attr)
+        r1.callback.assert_called_once_with(Delta(changes=[
+            [["attr2", "value"], "tr"], [["attr"], dict(value=36)]]))
+        r2.callback.assert_called_once_with(Update(value=36))
+
+
+class TestSquashChanges(unittest.TestCase):
+
+    def assert_equivalent(self, changes):
+        squashed = squash_changes(changes)
+        expected = dict(a=dict(b=1, c=2), d=3)
+        actual = dict(a=dict(b=1, c=2), d=3)
+        Delta(changes=deepcopy(changes)).apply_changes_to(expected)
+        Delta(changes=deepcopy(squashed)).apply_changes_to(actual)
+        assert actual == expected
+        return squashed
+
+    def test_repeated_writes_collapse(self):
+        squashed = self.assert_equivalent([
+            [["a", "b"], 2], [["d"], 4], [["a", "b"], 3]])
+        assert squashed == [[["d"], 4], [["a", "b"], 3]]
+
+    def test_parent_replacement_drops_children(self):
+        squashed = self.assert_equivalent([
+            [["a", "b"], 2], [["a", "c"], 3], [["a"], dict(e=5)]])
+        assert squashed == [[["a"], dict(e=5)]]
+
+    def test_child_after_parent_kept(self):
+        squashed = self.assert_equivalent([
+            [["a"], dict(e=5)], [["a", "e"], 6]])
+        assert squashed == [[["a"], dict(e=5)], [["a", "e"], 6]]
+
+    def test_deletion_drops_children(self):
+        squashed = self.assert_equivalent([
+            [["a", "b"], 2], [["a"]], [["d"], 4]])
+        assert squashed == [[["a"]], [["d"], 4]]
+
+    def test_root_replacement_drops_everything(self):
+        squashed = self.assert_equivalent([
+            [["a", "b"], 2], [["d"], 4], [[], dict(f=6)]])
+        assert squashed == [[[], dict(f=6)]]
+
+
+class CountingDummy(Dummy):
+    def __init__(self):
+        super(CountingDummy, self).__init__()
+        self.serialize_count = 0
+
+    def to_dict(self):
+        self.serialize_count += 1
+        return super(CountingDummy, self).to_dict()
+
+
+class TestSerializeOnce(unittest.TestCase):
+
+    def setUp(self):
+        self.lock = RLock()
+        self.block = Dummy()
+        self.o = Notifier("Notifier", self.lock, self.block)
+        self.block["attr"] = CountingDummy()
+        self.block.attr["value"] = 32
+        self.requests = [
+            Subscribe(path=["b"], delta=True, callback=Mock()),
+            Subscribe(path=["b"], delta=True, callback=Mock()),
+            Subscribe(path=["b"], delta=False, callback=Mock()),
+            Subscribe(path=["b", "attr"], delta=True, callback=Mock()),
+            Subscribe(path=["b", "attr"], delta=False, callback=Mock()),
+            Subscribe(path=["b", "attr", "value"], delta=False,
+                      callback=Mock())]
+        for request in self.requests:
+            self.o.handle_subscribe(request)
+
+    def test_replaced_child_serialized_once(self):
+        attr = CountingDummy()
+        attr["value"] = 33
+        with self.o.changes_squashed:
+            self.block["attr"] = attr
+            self.o.add_squashed_change(["b", "attr"], attr)
+        assert attr.serialize_count == 1
+        expected = dict(value=33)
+        for request in self.requests[:2]:
+            request.callback.assert_called_once_with(Delta(
+                changes=[[["attr"], expected]]))
+        self.requests[2].callback.assert_called_once_with(Update(
+            value=dict(attr=expected)))
+        self.requests[3].callback.assert_called_once_with(Delta(
+            changes=[[[], expected]]))
+        self.requests[4].callback.assert_called_once_with(Update(
+            value=expected))
+        self.requests[5].callback.assert_called_once_with(Update(value=33))
+        # Check the serialized form is shared between responses
+        update = self.requests[4].callback.call_args[0][0]
+        delta = self.requests[0].callback.call_args[0][0]
+        assert update.value is delta.changes[0][1]
+        # And that the JSON encoding is shared between delta subscribers
+        delta2 = self.requests[1].callback.call_args[0][0]
+        assert delta.encoded_payload is delta2.encoded_payload
+
+    def test_changes_not_serialized_in_place(self):
+        changes = [[["attr"], self.block.attr]]
+        self.o._tree.notify_changes(changes)
+        assert changes[0][1] is self.block.attr
+
+
+class TestRateLimit(unittest.TestCase):
+
+    def setUp(self):
+        self.lock = RLock()
+        self.block = Dummy()
+        self.block["attr"] = Dummy()
+        self.block.attr["value"] = 32
+        self.spawn = Mock()
+        self.o = Notifier("Notifier", self.lock, self.block, self.spawn)
+        self.now = 100.0
+
+    def time(self):
+        return self.now
+
+    def set_value(self, value):
+        with self.o.changes_squashed:
+            self.block.attr["value"] = value
+            self.o.add_squashed_change(["b", "attr", "value"], value)
+
+    def flush(self):
+        self.o._flush_queue = Mock()
+        self.o._flush_queue.get.side_effect = self.advance_time
+        self.o._flush_rate_limits()
+
+    def advance_time(self, timeout):
+        self.now += timeout
+
+    @patch("malcolm.core.notifier.time")
+    def test_update_conflated(self, mock_time):
+        mock_time.time.side_effect = self.time
+        request = Subscribe(path=["b", "attr", "value"], callback=Mock(),
+                            minInterval=0.1)
+        for cb, response in self.o.handle_subscribe(request):
+            cb(response)
+        request.callback.assert_called_once_with(Update(value=32))
+        request.callback.reset_mock()
+        # Changes within the interval are held back
+        for value in (33, 34, 35):
+            self.set_value(value)
+        request.callback.assert_not_called()
+        self.spawn.assert_called_once_with(self.o._flush_rate_limits)
+        # And the latest is flushed when due
+        self.flush()
+        request.callback.assert_called_once_with(Update(value=35))
+        assert self.now == 100.1
+        assert not self.o._flushing
+        request.callback.reset_mock()
+        # Changes after the interval go straight through
+        self.now = 101.0
+        self.set_value(36)
+        request.callback.assert_called_once_with(Update(value=36))
+
+    @patch("malcolm.core.notifier.time")
+    def test_delta_conflated(self, mock_time):
+        mock_time.time.side_effect = self.time
+        request = Subscribe(path=["b"], delta=True, callback=Mock(),
+                            minInterval=0.5)
+        self.o.handle_subscribe(request)
+        self.set_value(33)
+        self.block["attr2"] = Dummy()
+        with self.o.changes_squashed:
+            self.block.attr2["value"] = "st"
+            self.o.add_squashed_change(["b", "attr2"], self.block.attr2)
+        self.set_value(34)
+        request.callback.assert_not_called()
+        self.flush()
+        request.callback.assert_called_once_with(Delta(changes=[
+            [["attr2"], dict(value="st")], [["attr", "value"], 34]]))
+
+    @patch("malcolm.core.notifier.time")
+    def test_pending_flushed_on_unsubscribe(self, mock_time):
+        mock_time.time.side_effect = self.time
+        request = Subscribe(path=["b", "attr", "value"], callback=Mock(),
+                            minInterval=1)
+        self.o.handle_subscribe(request)
+        self.set_value(33)
+        request.callback.assert_not_called()
+        responses = self.o.handle_unsubscribe(
+            Unsubscribe(callback=request.callback))
+        assert [r for _, r in responses] == [
+            Update(value=33), Return(value=None)]
+
+    def test_shorter_interval_wakes_flusher(self):
+        def spawn(function):
+            t = threading.Thread(target=function)
+            t.daemon = True
+            t.start()
+
+        self.o = Notifier("Notifier", self.lock, self.block, spawn)
+        slow = Subscribe(id=1, path=["b", "attr", "value"], callback=Mock(),
+                         minInterval=2)
+        self.o.handle_subscribe(slow)
+        # The flusher now sleeps until the slow one is due
+        self.set_value(33)
+        fast_responses = Queue()
+        fast = Subscribe(id=2, path=["b", "attr", "value"],
+                         callback=fast_responses.put, minInterval=0.1)
+        self.o.handle_subscribe(fast)
+        self.set_value(34)
+        start = time.time()
+        # But the fast one should be sent well before then
+        assert fast_responses.get(timeout=1) == Update(id=2, value=34)
+        assert time.time() - start < 1
+        slow.callback.assert_not_called()
+
+    def test_unlimited_not_held_back(self):
+        request = Subscribe(path=["b", "attr", "value"], callback=Mock())
+        self.o.handle_subscribe(request)
+        self.set_value(33)
+        self.set_value(34)
+        assert request.callback.call_count == 2
+        self.spawn.assert_not_called()
+
+
+class TestRevision(unittest.TestCase):
+
+    def setUp(self):
+        self.lock = RLock()
+        self.block = Dummy()
+        self.block["attr"] = Dummy()
+        self.block.attr["value"] = 32
+        self.o = Notifier("Notifier", self.lock, self.block)
+
+    def set_value(self, value):
+        with self.o.changes_squashed:
+            self.block.attr["value"] = value
+            self.o.add_squashed_change(["b", "attr", "value"], value)
+
+    def subscribe(self, from_revision):
+        request = Subscribe(path=["b"], delta=True, callback=Mock(),
+                            fromRevision=from_revision)
+        for cb, response in self.o.handle_subscribe(request):
+            cb(response)
+        response = request.callback.call_args[0][0]
+        request.callback.reset_mock()
+        return request, response
+
+    def test_revision_increments(self):
+        request, response = self.subscribe(0)
+        assert response.changes == [[[], dict(attr=dict(value=32))]]
+        revision = response.revision
+        self.set_value(33)
+        response = request.callback.call_args[0][0]
+        assert response.changes == [[["attr", "value"], 33]]
+        assert response.revision == revision + 1
+        # An empty notify cycle doesn't make a revision
+        with self.o.changes_squashed:
+            pass
+        request.callback.assert_called_once()
+        self.set_value(34)
+        assert request.callback.call_args[0][0].revision == revision + 2
+
+    def test_no_revision_unless_asked(self):
+        request = Subscribe(path=["b"], delta=True, callback=Mock())
+        for cb, response in self.o.handle_subscribe(request):
+            cb(response)
+        self.set_value(33)
+        assert request.callback.call_args[0][0].revision is None
+        assert self.o._journal is None
+
+    def test_resume_from_revision(self):
+        request, response = self.subscribe(0)
+        revision = response.revision
+        self.set_value(33)
+        self.set_value(34)
+        for cb, response in self.o.handle_unsubscribe(
+                Unsubscribe(request.id, request.callback)):
+            cb(response)
+        # Resubscribing from where we got to sends only what we missed
+        request, response = self.subscribe(revision + 1)
+        assert response.changes == [[["attr", "value"], 34]]
+        assert response.revision == revision + 2
+        self.o.handle_unsubscribe(Unsubscribe(request.id, request.callback))
+        # And nothing if we're up to date
+        request, response = self.subscribe(revision + 2)
+        assert response.changes == []
+        assert response.revision == revision + 2
+
+    def test_resume_too_old(self):
+        self.o.journal_length = 2
+        request, response = self.subscribe(0)
+        revision = response.revision
+        for value in (33, 34, 35):
+            self.set_value(value)
+        self.o.handle_unsubscribe(Unsubscribe(request.id, request.callback))
+        # Journal no longer has revision + 1, so get everything
+        request, response = self.subscribe(revision)
+        assert response.changes == [[[], dict(attr=dict(value=35))]]
+        assert response.revision == revision + 3
+
+
+class TestPredicate(unittest.TestCase):
+
+    def setUp(self):
+        self.lock = RLock()
+        self.block = Dummy()
+        self.block["attr"] = Dummy()
+        self.block.attr["value"] = 32
+        self.o = Notifier("Notifier", self.lock, self.block)
+
+    def set_value(self, value):
+        with self.o.changes_squashed:
+            self.block.attr["value"] = value
+            self.o.add_squashed_change(["b", "attr", "value"], value)
+
+    def subscribe(self, predicate):
+        request = Subscribe(path=["b", "attr", "value"], callback=Mock(),
+                            predicate=predicate)
+        for cb, response in self.o.handle_subscribe(request):
+            cb(response)
+        return request
+
+    def test_only_matching_value_sent(self):
+        request = self.subscribe(dict(greaterOrEqual=35))
+        request.callback.assert_not_called()
+        self.set_value(33)
+        self.set_value(34)
+        request.callback.assert_not_called()
+        self.set_value(36)
+        assert [c[0][0] for c in request.callback.call_args_list] == [
+            Update(value=36), Return(value=None)]
+        # And it has ended
+        assert not self.o._subscription_keys
+        assert not self.o._predicates
+        request.callback.reset_mock()
+        self.set_value(37)
+        request.callback.assert_not_called()
+
+    def test_initial_value_matches(self):
+        request = self.subscribe(dict(equals=32))
+        assert [c[0][0] for c in request.callback.call_args_list] == [
+            Update(value=32), Return(value=None)]
+        assert not self.o._tree.children
+
+    def test_bad_value_sent(self):
+        request = self.subscribe(dict(equals=40, badValues=[33]))
+        self.set_value(34)
+        request.callback.assert_not_called()
+        self.set_value(33)
+        assert [c[0][0] for c in request.callback.call_args_list] == [
+            Update(value=33), Return(value=None)]
+
+    def test_others_still_get_every_value(self):
+        waiter = self.subscribe(dict(**{"in": [40, 41]}))
+        request = Subscribe(path=["b", "attr", "value"], callback=Mock())
+        self.o.handle_subscribe(request)
+        for value in (33, 34, 41):
+            self.set_value(value)
+        assert request.callback.call_count == 3
+        assert waiter.callback.call_count == 2
+
+
+class TestTableDeltas(unittest.TestCase):
+
+    def setUp(self):
+        self.lock = RLock()
+        self.block = Dummy()
+        self.block["attr"] = Dummy()
+        self.meta = Mock()
+        self.meta.elements = OrderedDict()
+        self.meta.elements["name"] = StringArrayMeta()
+        self.meta.elements["x"] = NumberArrayMeta("int32")
+        self.table = Table.from_rows(
+            self.meta, [["r%d" % i, i] for i in range(10)])
+        self.block.attr["value"] = self.table
+        self.o = Notifier("Notifier", self.lock, self.block)
+
+    def set_row(self, table, i, row):
+        new = table[:]
+        new[i] = row
+        with self.o.changes_squashed:
+            self.block.attr["value"] = new
+            self.o.add_squashed_change(
+                ["b", "attr", "value"], new, find_changed_rows(table, new))
+        return new
+
+    def subscribe(self, **kwargs):
+        request = Subscribe(path=["b"], delta=True, callback=Mock(), **kwargs)
+        self.o.handle_subscribe(request)
+        return request
+
+    def test_only_changed_rows_sent(self):
+        rows = self.subscribe(tableDeltas=True)
+        whole = self.subscribe()
+        self.set_row(self.table, 3, ["r3", 33])
+        assert rows.callback.call_args[0][0].changes == [
+            [["attr", "value"], {"x": [33]}, [3, 4]]]
+        changes = whole.callback.call_args[0][0].changes
+        assert len(changes) == 1 and len(changes[0]) == 2
+        assert list(changes[0][1]["x"]) == [0, 1, 2, 33, 4, 5, 6, 7, 8, 9]
+
+    def test_squashed_row_changes_all_kept(self):
+        rows = self.subscribe(tableDeltas=True)
+        whole = self.subscribe()
+        with self.o.changes_squashed:
+            new = self.set_row(self.table, 3, ["r3", 33])
+            self.set_row(new, 5, ["r5", 55])
+        changes = rows.callback.call_args[0][0].changes
+        assert [c[2] for c in changes] == [[3, 4], [5, 6]]
+        # Applying them gives the same as the whole table
+        d = serialize_object(self.table)
+        Delta(changes=[[[], c[1], c[2]] for c in changes]).apply_changes_to(d)
+        changes = whole.callback.call_args[0][0].changes
+        assert len(changes) == 1
+        assert list(d["x"]) == list(changes[0][1]["x"])
+
+    def test_table_deltas_wanted(self):
+        assert not self.o.table_deltas_wanted
+        self.subscribe()
+        assert not self.o.table_deltas_wanted
+        rows = self.subscribe(tableDeltas=True)
+        assert self.o.table_deltas_wanted
+        self.o.handle_unsubscribe(Unsubscribe(rows.id, rows.callback))
+        assert not self.o.table_deltas_wanted
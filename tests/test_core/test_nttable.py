@@ -1,5 +1,6 @@
 from collections import OrderedDict
 import unittest
+from mock import MagicMock, patch
 
 from malcolm.modules.builtin.vmetas import TableMeta, StringArrayMeta
 from malcolm.core import Table, NTTable, Alarm, TimeStamp
@@ -54,3 +55,20 @@ class TestSerialization(unittest.TestCase):
         assert o.meta.label == "my label"
         assert o.value.foo == ("foo1", "foo2")
         assert o.value.bar == ("bar1", "bar2")
+
+    def test_rows_only_found_when_wanted(self):
+        elements = OrderedDict()
+        elements["foo"] = StringArrayMeta()
+        meta = TableMeta(elements=elements)
+        o = meta.create_attribute_model(Table(meta, dict(foo=["a", "b"])))
+        notifier = MagicMock()
+        notifier.table_deltas_wanted = False
+        o.set_notifier_path(notifier, ["b", "attr"])
+        with patch("malcolm.core.nttable.find_changed_rows") as find:
+            o.set_value(Table(meta, dict(foo=["a", "c"])))
+            find.assert_not_called()
+            assert notifier.add_squashed_change.call_args_list[0][0][2] \
+                is None
+            notifier.table_deltas_wanted = True
+            o.set_value(Table(meta, dict(foo=["a", "d"])))
+            assert find.call_count == 1
@@ -0,0 +1,116 @@
+import unittest
+from mock import Mock
+
+from malcolm.core.outboundqueue import OutboundQueue
+from malcolm.core.response import Update, Delta, Return
+
+
+class TestOutboundQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.start_drain = Mock()
+        self.disconnect = Mock()
+
+    def make_queue(self, policy, size=3):
+        return OutboundQueue(self.start_drain, size, policy, self.disconnect)
+
+    def drain(self, o):
+        responses = []
+        response = o.get()
+        while response is not None:
+            responses.append(response)
+            response = o.get()
+        return responses
+
+    def test_bad_policy(self):
+        with self.assertRaises(AssertionError):
+            self.make_queue("dropNewest")
+
+    def test_start_drain_when_idle(self):
+        o = self.make_queue(OutboundQueue.DROP_OLDEST)
+        o.put(Update(1, 1))
+        o.put(Update(1, 2))
+        self.start_drain.assert_called_once_with()
+        assert o.depth == 2
+        assert self.drain(o) == [Update(1, 1), Update(1, 2)]
+        assert o.depth == 0
+        o.put(Update(1, 3))
+        assert self.start_drain.call_count == 2
+
+    def test_drop_oldest(self):
+        o = self.make_queue(OutboundQueue.DROP_OLDEST)
+        o.put(Return(2))
+        for i in range(4):
+            o.put(Update(1, i))
+        assert o.dropped == 2
+        assert o.max_depth == 3
+        assert self.drain(o) == [Return(2), Update(1, 2), Update(1, 3)]
+
+    def test_drop_oldest_keeps_latest_update(self):
+        o = self.make_queue(OutboundQueue.DROP_OLDEST)
+        o.put(Update(1, 0))
+        o.put(Update(2, 0))
+        o.put(Update(3, 0))
+        # Each is the latest value of its subscription, so the queue grows
+        o.put(Update(4, 0))
+        assert o.dropped == 0
+        assert o.depth == 4
+        # But one the new response replaces can go
+        o.put(Update(2, 1))
+        assert o.dropped == 1
+        assert self.drain(o) == [
+            Update(1, 0), Update(3, 0), Update(4, 0), Update(2, 1)]
+
+    def test_drop_oldest_squashes_into_new_delta(self):
+        o = self.make_queue(OutboundQueue.DROP_OLDEST)
+        o.put(Delta(1, [[[], dict(a=0)]]))
+        o.put(Delta(2, [[["a"], 0]]))
+        o.put(Delta(3, [[["a"], 0]]))
+        o.put(Delta(1, [[["a"], 1]]))
+        assert o.dropped == 1
+        assert self.drain(o) == [
+            Delta(2, [[["a"], 0]]), Delta(3, [[["a"], 0]]),
+            Delta(1, [[[], dict(a=0)], [["a"], 1]])]
+
+    def test_drop_oldest_squashes_deltas(self):
+        o = self.make_queue(OutboundQueue.DROP_OLDEST)
+        o.put(Delta(1, [[[], dict(a=0, b=0)]]))
+        o.put(Delta(2, [[["a"], 0]]))
+        o.put(Delta(1, [[["a"], 1]]))
+        # The initial Delta isn't lost, it's squashed into the next one
+        o.put(Delta(1, [[["b"], 2]]))
+        assert o.dropped == 1
+        # Nothing to squash 2 into, so the 1s are squashed again
+        o.put(Return(3))
+        assert o.dropped == 2
+        assert self.drain(o) == [
+            Delta(2, [[["a"], 0]]),
+            Delta(1, [[[], dict(a=0, b=0)], [["a"], 1], [["b"], 2]]),
+            Return(3)]
+
+    def test_default_policy_conflates(self):
+        assert OutboundQueue(self.start_drain).policy == OutboundQueue.CONFLATE
+
+    def test_conflate(self):
+        o = self.make_queue(OutboundQueue.CONFLATE)
+        o.put(Update(1, 0))
+        o.put(Delta(2, [[["a"], 0]]))
+        o.put(Update(1, 1))
+        o.put(Delta(2, [[["a"], 1], [["b"], 1]]))
+        assert o.dropped == 1
+        o.put(Update(1, 2))
+        assert o.dropped == 2
+        assert self.drain(o) == [
+            Update(1, 1), Delta(2, [[["a"], 1], [["b"], 1]]), Update(1, 2)]
+        self.disconnect.assert_not_called()
+
+    def test_disconnect(self):
+        o = self.make_queue(OutboundQueue.DISCONNECT)
+        for i in range(4):
+            o.put(Update(1, i))
+        self.disconnect.assert_called_once_with()
+        assert o.disconnected
+        assert o.dropped == 4
+        o.put(Update(1, 5))
+        assert o.dropped == 5
+        assert self.drain(o) == []
@@ -0,0 +1,111 @@
+import unittest
+from mock import MagicMock
+
+from malcolm.core import Process, Controller, Subscribe, Unsubscribe, Queue, \
+    Delta, Return, Alarm, TimeoutError, Get, Error
+from malcolm.core.patternsubscription import is_pattern
+
+
+class TestIsPattern(unittest.TestCase):
+    def test_is_pattern(self):
+        assert is_pattern("*")
+        assert is_pattern("PANDA:?")
+        assert is_pattern("[AB]-DET")
+        assert not is_pattern("BL45P-ML-SCAN-01")
+
+
+class TestPatternSubscription(unittest.TestCase):
+
+    def setUp(self):
+        self.process = Process("proc")
+        for mri in ("PANDA1", "PANDA2", "DET"):
+            self.process.add_controller(mri, Controller(self.process, mri, []))
+        self.process.start()
+        self.q = Queue()
+
+    def tearDown(self):
+        self.process.stop(timeout=1)
+
+    def subscribe(self, pattern):
+        request = Subscribe(
+            1, [pattern, "health", "value"], delta=True, callback=self.q.put)
+        self.process.handle_request(request).wait(1)
+        return request
+
+    def test_initial_batched(self):
+        self.subscribe("*")
+        response = self.q.get(timeout=1)
+        assert isinstance(response, Delta)
+        assert response.id == 1
+        assert response.changes == [
+            [[], {}],
+            [["PANDA1"], "OK"],
+            [["PANDA2"], "OK"],
+            [["DET"], "OK"]]
+
+    def test_changes_name_the_block(self):
+        self.subscribe("PANDA*")
+        self.q.get(timeout=1)
+        controller = self.process.get_controller("PANDA2")
+        controller.update_health(self, Alarm.major("Bad"))
+        response = self.q.get(timeout=1)
+        assert response.changes == [[["PANDA2"], "Bad"]]
+        # Not subscribed to DET
+        self.process.get_controller("DET").update_health(
+            self, Alarm.major("Bad"))
+        controller.update_health(self)
+        response = self.q.get(timeout=1)
+        assert response.changes == [[["PANDA2"], "OK"]]
+
+    def test_added_and_removed(self):
+        self.subscribe("PANDA*")
+        self.q.get(timeout=1)
+        self.process.add_controller(
+            "PANDA3", Controller(self.process, "PANDA3", []))
+        response = self.q.get(timeout=1)
+        assert response.changes == [[["PANDA3"], "OK"]]
+        # Hidden blocks are not subscribed to
+        self.process.add_controller("PANDA4", MagicMock(), publish=False)
+        self.process.remove_controller("PANDA1")
+        response = self.q.get(timeout=1)
+        assert response.changes == [[["PANDA1"]]]
+
+    def test_unsubscribe(self):
+        request = self.subscribe("*")
+        self.q.get(timeout=1)
+        self.process.handle_request(
+            Unsubscribe(request.id, request.callback)).wait(1)
+        assert self.q.get(timeout=1) == Return(id=1)
+        self.process.get_controller("DET").update_health(
+            self, Alarm.major("Bad"))
+        self.process.add_controller(
+            "PANDA3", Controller(self.process, "PANDA3", []))
+        with self.assertRaises(TimeoutError):
+            self.q.get(timeout=0.1)
+
+    def test_get_is_error(self):
+        request = Get(2, ["*", "health", "value"], callback=self.q.put)
+        self.process.handle_request(request).wait(1)
+        response = self.q.get(timeout=1)
+        assert isinstance(response, Error)
+        assert response.id == 2
+        assert "Can only Subscribe" in response.message
+
+    def test_single_block_options_are_error(self):
+        for i, kwargs in enumerate((dict(delta=True, tableDeltas=True),
+                                    dict(predicate=dict(equals=1)),
+                                    dict(delta=True, fromRevision=3))):
+            request = Subscribe(i, ["*", "health", "value"],
+                                callback=self.q.put, **kwargs)
+            self.process.handle_request(request).wait(1)
+            response = self.q.get(timeout=1)
+            assert isinstance(response, Error)
+            assert response.id == i
+            assert "Pattern Subscribes can't use" in response.message
+        assert not self.process._pattern_subscriptions
+
+    def test_unknown_unsubscribe_is_error(self):
+        self.process.handle_request(Unsubscribe(3, self.q.put)).wait(1)
+        response = self.q.get(timeout=1)
+        assert isinstance(response, Error)
+        assert response.id == 3
@@ -1,8 +1,15 @@
+import time
 import unittest
 from mock import MagicMock
 
+from malcolm.compat import get_pool_num_threads
 from malcolm.core.process import Process
 from malcolm.core.controller import Controller
+from malcolm.core.methodmodel import method_takes
+from malcolm.core.queue import Queue
+from malcolm.core.request import Post
+from malcolm.core.spawnlane import SpawnLane, CONTROL_LANE, HOOK_LANE, \
+    BACKGROUND_LANE, function_name
 
 
 class TestProcess(unittest.TestCase):
@@ -17,6 +24,11 @@ class TestProcess(unittest.TestCase):
     def test_init(self):
         assert self.o.name == "proc"
 
+    def test_lanes_share_pool_threads(self):
+        sizes = [lane.num_threads for lane in self.o._lanes.values()]
+        assert sum(sizes) == get_pool_num_threads()
+        assert min(sizes) >= 2
+
     def test_add_controller(self):
         controller = MagicMock()
         self.o.add_controller("mri", controller)
@@ -49,3 +61,65 @@ class TestProcess(unittest.TestCase):
         assert c.published == ["mri", "mri2"]
         self.o.remove_controller("mri2")
         assert c.published == ["mri"]
+
+    def test_spawn_lanes(self):
+        # Make the background lane a single thread and block it
+        self.o._lanes[BACKGROUND_LANE] = SpawnLane(BACKGROUND_LANE, 1)
+        q = Queue()
+        started = Queue()
+
+        def block():
+            started.put(None)
+            return q.get()
+
+        blocker = self.o.spawn(block, (), {}, False)
+        started.get(timeout=1)
+        queued = self.o.spawn(lambda: "queued", (), {}, False)
+        # The control lane still runs straight away
+        assert self.o.spawn(
+            lambda: "control", (), {}, False, CONTROL_LANE).get(1) == "control"
+        stats = self.o.lane_stats()
+        assert list(stats) == [CONTROL_LANE, HOOK_LANE, BACKGROUND_LANE]
+        assert stats[BACKGROUND_LANE]["running"] == 1
+        assert stats[BACKGROUND_LANE]["queued"] == 1
+        assert stats[CONTROL_LANE]["total"] == 1
+        q.put("done")
+        assert blocker.get(1) == "done"
+        assert queued.get(1) == "queued"
+        stats = self.o.lane_stats()[BACKGROUND_LANE]
+        assert stats["queued"] == 0
+        assert stats["maxQueued"] == 1
+        assert stats["total"] == 2
+
+    def test_control_post_not_queued(self):
+        class AbortController(Controller):
+            @method_takes()
+            def abort(self):
+                return
+
+        c = AbortController(self.o, "mri", [])
+        self.o.add_controller("mri", c)
+        self.o._lanes[BACKGROUND_LANE] = SpawnLane(BACKGROUND_LANE, 1)
+        q = Queue()
+        self.o.spawn(q.get, (), {}, False)
+        response_q = Queue()
+        c.handle_request(Post(path=["mri", "abort"], callback=response_q.put))
+        assert response_q.get(timeout=1).typeid == "malcolm:core/Return:1.0"
+        q.put(None)
+
+    def test_spawn_timings(self):
+        self.o.spawn(self.o.mri_list.__len__, (), {}, False).wait(1)
+        self.o.spawn(function_name, (len,), {}, False, HOOK_LANE).wait(1)
+        # They are only counted as finished after the waiter is woken
+        for _ in range(100):
+            timings = self.o.spawn_timings()
+            if len(timings) == 2:
+                break
+            time.sleep(0.01)
+        assert [t[:3] for t in timings] == [
+            (HOOK_LANE, "function_name", 1), (BACKGROUND_LANE, "list.__len__", 1)]
+        assert not self.o.running_spawns()
+
+    def test_function_name(self):
+        assert function_name(self.o.stop) == "Process.stop"
+        assert function_name(len) == "len"
@@ -2,10 +2,14 @@ import unittest
 import os
 from mock import MagicMock
 
+import numpy as np
+
 from malcolm.compat import OrderedDict
-from malcolm.core import json_decode
-from malcolm.core.request import Request, Get, Post, Subscribe, Unsubscribe, Put
-from malcolm.core.response import Return, Error, Update, Delta, Response
+from malcolm.core import json_decode, json_encode, binary_decode
+from malcolm.core.request import Request, Get, Post, Subscribe, Unsubscribe, Put, \
+    PutMany
+from malcolm.core.response import Return, Error, Update, Delta, Response, \
+    EncodedPayload
 
 
 def get_doc_json(fname):
@@ -91,6 +95,31 @@ class TestPut(unittest.TestCase):
         assert get_doc_json("put_hdf_file_path") == self.o.to_dict()
 
 
+class TestPutMany(unittest.TestCase):
+
+    def setUp(self):
+        self.callback = MagicMock()
+        self.path = ["BL18I:XSPRESS3:HDF"]
+        self.values = OrderedDict()
+        self.values["filePath"] = "/path/to/file.h5"
+        self.values["numCapture"] = 1000
+        self.o = PutMany(36, self.path, self.values, self.callback)
+
+    def test_init(self):
+        assert self.o.typeid == "malcolm:core/PutMany:1.0"
+        assert self.o.id == 36
+        assert self.o.callback == self.callback
+        assert self.path == self.o.path
+        assert list(self.o.values.items()) == list(self.values.items())
+
+    def test_setters(self):
+        self.o.set_values(dict(numCapture=np.int32(3)))
+        assert self.o.values == dict(numCapture=3)
+
+    def test_doc(self):
+        assert get_doc_json("put_many_hdf") == self.o.to_dict()
+
+
 class TestPost(unittest.TestCase):
 
     def setUp(self):
@@ -154,6 +183,52 @@ class TestSubscribe(unittest.TestCase):
     def test_doc(self):
         assert get_doc_json("subscribe_xspress3") == self.o.to_dict()
 
+    def test_min_interval(self):
+        assert self.o.minInterval is None
+        assert "minInterval" not in self.o.to_dict()
+        self.o.set_minInterval(1)
+        assert self.o.minInterval == 1.0
+        d = self.o.to_dict()
+        assert d["minInterval"] == 1.0
+        assert Subscribe.from_dict(d).minInterval == 1.0
+        self.o.set_minInterval(0)
+        assert self.o.minInterval == 0.0
+
+    def test_negative_min_interval(self):
+        with self.assertRaises(AssertionError):
+            self.o.set_minInterval(-0.5)
+        assert self.o.minInterval is None
+
+    def test_from_revision(self):
+        assert self.o.fromRevision is None
+        assert "fromRevision" not in self.o.to_dict()
+        self.o.set_fromRevision(0)
+        d = self.o.to_dict()
+        assert d["fromRevision"] == 0
+        assert Subscribe.from_dict(d).fromRevision == 0
+
+    def test_predicate(self):
+        assert self.o.predicate is None
+        assert "predicate" not in self.o.to_dict()
+        # Can't have one with deltas
+        with self.assertRaises(AssertionError):
+            self.o.set_predicate(dict(equals=1))
+        self.o.set_delta(False)
+        with self.assertRaises(AssertionError):
+            self.o.set_predicate(dict(equals=1, greaterOrEqual=2))
+        self.o.set_predicate(dict(equals="Ready", badValues=["Fault"]))
+        d = self.o.to_dict()
+        assert Subscribe.from_dict(d).predicate == dict(
+            equals="Ready", badValues=["Fault"])
+
+    def test_table_deltas(self):
+        assert self.o.tableDeltas is False
+        assert "tableDeltas" not in self.o.to_dict()
+        self.o.set_tableDeltas(True)
+        d = self.o.to_dict()
+        assert d["tableDeltas"] is True
+        assert Subscribe.from_dict(d).tableDeltas is True
+
 
 class TestUnsubscribe(unittest.TestCase):
 
@@ -214,6 +289,63 @@ class TestResponse(unittest.TestCase):
         assert r.id == 123
         assert r.changes == changes
 
+    def test_to_json(self):
+        r = Return(35, "Running")
+        assert r.to_json() == json_encode(r)
+
+    def test_Update_encoded_payload(self):
+        value = OrderedDict()
+        value["typeid"] = "epics:nt/NTScalar:1.0"
+        value["value"] = "Running"
+        encoded = EncodedPayload(value)
+        cb, r1 = Subscribe(19, ["b"], callback=self.fail).update_response(
+            value, encoded)
+        cb, r2 = Subscribe(20, ["b"], callback=self.fail).update_response(
+            value, encoded)
+        assert r1.to_json() == json_encode(r1)
+        # Should not be encoded again
+        value["value"] = "Armed"
+        assert r2.to_json() == json_encode(r2).replace("Armed", "Running")
+
+    def test_Delta_encoded_payload(self):
+        changes = [[["state", "value"], "Running"]]
+        encoded = EncodedPayload(changes)
+        responses = [
+            Subscribe(i, ["b"], True).delta_response(changes, encoded)[1]
+            for i in range(3)]
+        for r in responses:
+            assert r.to_json() == json_encode(r)
+        assert json_decode(responses[2].to_json()) == responses[2].to_dict()
+
+    def test_to_binary(self):
+        value = OrderedDict()
+        value["typeid"] = "malcolm:core/NTScalarArray:1.0"
+        value["value"] = np.array([1.5, 2.5])
+        encoded = EncodedPayload(value)
+        responses = [
+            Subscribe(i, ["b"]).update_response(value, encoded)[1]
+            for i in range(2)]
+        changes = [[[], value]]
+        responses.append(Subscribe(3, ["b"], True).delta_response(
+            changes, EncodedPayload(changes))[1])
+        for r in responses:
+            d = binary_decode(r.to_binary())
+            assert d["id"] == r.id
+            assert json_encode(d) == r.to_json()
+        assert binary_decode(Return(4, value).to_binary())["value"][
+            "value"].tolist() == [1.5, 2.5]
+
+    def test_Delta_revision(self):
+        changes = [[["state", "value"], "Running"]]
+        r = Delta(3, changes)
+        assert "revision" not in r.to_dict()
+        r.set_revision(1500000000000001)
+        d = r.to_dict()
+        assert d["revision"] == 1500000000000001
+        r.encoded_payload = EncodedPayload(changes)
+        assert json_decode(r.to_json()) == d
+        assert Delta.from_dict(d).revision == 1500000000000001
+
 
 class TestDeltaChanges(unittest.TestCase):
     def test_update_root(self):
@@ -252,3 +384,16 @@ class TestDeltaChanges(unittest.TestCase):
         r.apply_changes_to(d)
         assert d == dict(d=dict(a=32, b=dict(x=3)))
 
+    def test_splice_table_rows(self):
+        d = dict(t=dict(a=[1, 2, 3, 4], b=["w", "x", "y", "z"]))
+        r = Delta(changes=[[["t"], dict(a=[5, 6, 7], b=["p", "q", "r"]),
+                            [1, 2]]])
+        r.apply_changes_to(d)
+        assert d == dict(t=dict(a=[1, 5, 6, 7, 3, 4],
+                                b=["w", "p", "q", "r", "y", "z"]))
+
+    def test_splice_table_rows_some_columns(self):
+        d = dict(t=dict(a=[1, 2, 3, 4], b=["w", "x", "y", "z"]))
+        r = Delta(changes=[[["t"], dict(a=[5]), [2, 3]]])
+        r.apply_changes_to(d)
+        assert d == dict(t=dict(a=[1, 2, 5, 4], b=["w", "x", "y", "z"]))
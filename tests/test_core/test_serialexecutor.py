@@ -0,0 +1,161 @@
+import threading
+import unittest
+from mock import Mock
+
+from malcolm.core.serialexecutor import SerialExecutor, Completion, MAX_BATCH
+from malcolm.core import Process, Controller, Get, Put, Queue, TimeoutError
+
+
+class TestCompletion(unittest.TestCase):
+
+    def test_done_before_wait(self):
+        o = Completion(threading.Lock())
+        assert not o.ready()
+        o.set_done()
+        assert o.ready()
+        o.wait(0)
+        assert o._queue is None
+
+    def test_wait_times_out(self):
+        o = Completion(threading.Lock())
+        with self.assertRaises(TimeoutError):
+            o.wait(0.01)
+
+
+class TestSerialExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.spawned = []
+        self.batches = []
+        self.cb = Mock()
+        self.o = SerialExecutor(
+            self.spawned.append, self.handle_batch, self.handle_error)
+
+    def handle_batch(self, items):
+        self.batches.append(items)
+        if "bad" in items:
+            raise ValueError("bad item")
+        return [(self.cb, item) for item in items]
+
+    def handle_error(self, item, e):
+        return [(self.cb, "error: %s" % e)]
+
+    def test_batches_in_order(self):
+        completions = [self.o.submit(i) for i in range(3)]
+        # Only one spawn for the burst
+        assert len(self.spawned) == 1
+        self.spawned.pop()()
+        assert self.batches == [[0, 1, 2]]
+        assert [c[0][0] for c in self.cb.call_args_list] == [0, 1, 2]
+        assert all(c.ready() for c in completions)
+        assert not self.spawned
+        # Idle again, so next submit spawns
+        self.o.submit(3)
+        assert len(self.spawned) == 1
+
+    def test_max_batch(self):
+        for i in range(MAX_BATCH + 1):
+            self.o.submit(i)
+        self.spawned.pop()()
+        assert len(self.batches[0]) == MAX_BATCH
+        # The rest get a new worker
+        self.spawned.pop()()
+        assert self.batches[1] == [MAX_BATCH]
+
+    def test_callback_exception_doesnt_stop_batch(self):
+        self.cb.side_effect = [ValueError("bad"), None]
+        completions = [self.o.submit(i) for i in range(2)]
+        self.spawned.pop()()
+        assert self.cb.call_count == 2
+        assert all(c.ready() for c in completions)
+
+
+    def test_batch_exception_gives_errors_per_item(self):
+        completions = [self.o.submit(i) for i in (0, "bad", 2)]
+        self.spawned.pop()()
+        assert [c[0][0] for c in self.cb.call_args_list] == [
+            0, "error: bad item", 2]
+        assert all(c.ready() for c in completions)
+
+    def test_next_batch_waits_for_callbacks(self):
+        self.spawned = None
+        delivered = []
+        first_callback = threading.Event()
+        carry_on = threading.Event()
+
+        def cb(item):
+            if item == 0:
+                first_callback.set()
+                carry_on.wait(timeout=5)
+            delivered.append(item)
+
+        def handle_batch(items):
+            return [(cb, item) for item in items]
+
+        def spawn(function):
+            threading.Thread(target=function).start()
+
+        o = SerialExecutor(spawn, handle_batch, self.handle_error)
+        completions = [o.submit(0), o.submit(1)]
+        # Interleave a second batch while the first one's callbacks run
+        first_callback.wait(timeout=5)
+        completions += [o.submit(i) for i in range(2, 5)]
+        carry_on.set()
+        for c in completions:
+            c.wait(timeout=5)
+        assert delivered == [0, 1, 2, 3, 4]
+
+    def test_callback_can_wait_for_new_item(self):
+        delivered = []
+
+        def cb(item):
+            delivered.append(item)
+            if item == 0:
+                # Hands over to a new worker so this doesn't deadlock
+                o.submit(10).wait(timeout=5)
+
+        def spawn(function):
+            threading.Thread(target=function).start()
+
+        o = SerialExecutor(
+            spawn, lambda items: [(cb, i) for i in items], self.handle_error)
+        completions = [o.submit(0), o.submit(1)]
+        for c in completions:
+            c.wait(timeout=5)
+        assert delivered == [0, 10, 1]
+        # And only one worker carries on afterwards
+        o.submit(2).wait(timeout=5)
+        assert delivered == [0, 10, 1, 2]
+        assert not o._working
+
+
+class TestControllerSerialRequests(unittest.TestCase):
+
+    def setUp(self):
+        self.process = Process("proc")
+        self.o = Controller(self.process, "mri", [])
+        self.process.add_controller("mri", self.o)
+        self.process.start()
+
+    def tearDown(self):
+        self.process.stop(timeout=1)
+
+    def test_gets_dont_spawn_each(self):
+        q = Queue()
+        before = self.process._spawn_count
+        completions = [self.o.handle_request(
+            Get(id=i, path=["mri", "health", "value"], callback=q.put))
+            for i in range(10)]
+        for c in completions:
+            c.wait(1)
+        assert [q.get(0).id for _ in range(10)] == list(range(10))
+        assert self.process._spawn_count - before < 10
+
+    def test_puts_still_spawned(self):
+        q = Queue()
+        spawned = self.o.handle_request(
+            Put(path=["mri", "health", "value"], value="x", callback=q.put))
+        assert not isinstance(spawned, Completion)
+        spawned.wait(1)
+        # health isn't writeable
+        assert "Error" in q.get(0).typeid
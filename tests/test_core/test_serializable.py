@@ -1,10 +1,12 @@
 from collections import OrderedDict
+import struct
 import unittest
+from mock import patch
 
 import numpy as np
 
 from malcolm.core.serializable import Serializable, deserialize_object, \
-    repr_object, json_encode
+    repr_object, json_encode, serialize_object, binary_encode, binary_decode
 from malcolm.modules.builtin.vmetas.stringmeta import StringMeta
 
 
@@ -116,4 +118,108 @@ class TestSerialization(unittest.TestCase):
     def test_json_numpy_array(self):
         s1 = DummySerializable(3, "foo", np.array([3, 4]))
         assert json_encode(s1) == \
-            '{"typeid": "foo:1.0", "boo": 3, "bar": "foo", "NOT_CAMEL": [3, 4]}'
+            '{"typeid":"foo:1.0","boo":3,"bar":"foo","NOT_CAMEL":[3,4]}'
+
+    def test_compiled_to_dict(self):
+        assert DummySerializable._compiled_to_dict is not None
+        s = DummySerializable(3, "foo", 4)
+        assert DummySerializable._compiled_to_dict(s) == s.to_dict()
+        # Endpoints set on the instance fall back to the generic version
+        s.boo2 = "Anything"
+        s.endpoints = s.endpoints + ["boo2"]
+        assert list(s.to_dict()) == ["typeid", "boo", "bar", "NOT_CAMEL", "boo2"]
+
+    def test_camel_case_checked_at_registration(self):
+        with patch("malcolm.core.serializable.log") as mock_log:
+            @Serializable.register_subclass("bad:1.0")
+            class BadSerializable(Serializable):
+                endpoints = ["goodName", "BAD_NAME"]
+                goodName = 1
+                BAD_NAME = 2
+
+            mock_log.warning.assert_called_once_with(
+                "String %r is not camelCase", "BAD_NAME")
+            mock_log.reset_mock()
+            assert BadSerializable().to_dict() == dict(
+                typeid="bad:1.0", goodName=1, BAD_NAME=2)
+            mock_log.warning.assert_not_called()
+
+    def test_compiled_from_dict(self):
+        compiled = DummySerializable.__dict__["_compiled_from_dict"]
+        d = DummySerializable(3, "foo", 4).to_dict()
+        s = compiled(d)
+        assert isinstance(s, DummySerializable)
+        assert s.to_dict() == d
+        # Other keys take the generic path
+        d["other"] = 5
+        assert compiled(d) is None
+        with self.assertRaises(TypeError):
+            DummySerializable.from_dict(d)
+        assert DummySerializable.from_dict(d, ignore=["other"]) == s
+        d.pop("typeid")
+        d.pop("other")
+        assert compiled(d) is None
+        assert DummySerializable.from_dict(d) == s
+        assert EmptySerializable.from_dict(dict(typeid="empty:1.0")) == \
+            EmptySerializable()
+
+    def test_compiled_from_dict_needs_constructor_args(self):
+        @Serializable.register_subclass("setter:1.0")
+        class SetterSerializable(Serializable):
+            endpoints = ["value"]
+
+            def __init__(self):
+                self.value = None
+
+        assert SetterSerializable.__dict__["_compiled_from_dict"] is None
+
+    def test_serialize_plain(self):
+        for o in (1, 1.5, "s", u"u", True, None):
+            assert serialize_object(o) is o
+
+
+class TestBinaryCodec(unittest.TestCase):
+
+    def test_round_trip(self):
+        arr = np.arange(5, dtype=np.float64) * 1.5
+        s = DummySerializable(arr, "foo", dict(x=np.array([1, 2], np.int8)))
+        data = binary_encode(s)
+        assert isinstance(data, bytes)
+        d = binary_decode(data)
+        assert list(d) == ["typeid", "boo", "bar", "NOT_CAMEL"]
+        assert d["boo"].dtype == np.float64
+        assert d["boo"].tolist() == arr.tolist()
+        assert d["NOT_CAMEL"]["x"].dtype == np.int8
+        assert d["NOT_CAMEL"]["x"].tolist() == [1, 2]
+        # The array is a view on the frame, not a copy
+        assert not d["boo"].flags.owndata
+        assert json_encode(d) == json_encode(s)
+
+    def test_empty_and_2d(self):
+        o = dict(a=np.array([], np.uint16), b=np.ones((2, 3), np.int32))
+        d = binary_decode(binary_encode(o))
+        assert d["a"].dtype == np.uint16
+        assert d["a"].shape == (0,)
+        assert d["b"].tolist() == [[1, 1, 1], [1, 1, 1]]
+
+    def test_buffers_aligned(self):
+        o = [np.array([1], np.int8), np.array([2.5]), u"\u00e9"]
+        data = binary_encode(o)
+        n_parts = struct.unpack_from("<I", data)[0]
+        assert n_parts == 3
+        table = struct.unpack_from("<6I", data, 4)
+        assert [x % 8 for x in table[::2]] == [0, 0, 0]
+        assert table[3::2] == (1, 8)
+        d = binary_decode(data)
+        assert d[0].tolist() == [1]
+        assert d[1].tolist() == [2.5]
+        assert d[2] == u"\u00e9"
+
+    def test_big_endian(self):
+        d = binary_decode(binary_encode([np.array([1, 2], ">i4")]))
+        assert d[0].dtype == np.int32
+        assert d[0].tolist() == [1, 2]
+
+    def test_non_numeric_arrays_are_lists(self):
+        o = [np.array(["a", "b"])]
+        assert binary_decode(binary_encode(o)) == [["a", "b"]]
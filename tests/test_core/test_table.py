@@ -1,8 +1,12 @@
+import copy
+import threading
 import unittest
 from collections import OrderedDict
-from mock import Mock
+from mock import Mock, patch
+import numpy as np
 
 from malcolm.core import Table
+from malcolm.core.table import find_changed_rows, _join_columns
 from malcolm.modules.builtin.vmetas import NumberArrayMeta, StringArrayMeta
 
 
@@ -153,3 +157,173 @@ class TestTableMetaSerialization(unittest.TestCase):
         d2.pop("typeid")
         t2 = Table(self.meta, d2)
         assert d == t2.to_dict()
+
+
+class TestTableBulkOperations(unittest.TestCase):
+    def setUp(self):
+        self.meta = Mock()
+        self.meta.elements = OrderedDict()
+        self.meta.elements["e1"] = StringArrayMeta()
+        self.meta.elements["e2"] = NumberArrayMeta("int32")
+
+    def test_extend(self):
+        t = Table(self.meta)
+        t.extend([["a", 1], ["b", 2]])
+        t.extend([["c", 3]])
+        assert t.e1 == ("a", "b", "c")
+        assert list(t.e2) == [1, 2, 3]
+        assert t.e2.dtype == np.int32
+        assert not t.e2.flags.writeable
+
+    def test_extend_bad_value_changes_nothing(self):
+        t = Table.from_rows(self.meta, [["a", 1]])
+        with self.assertRaises(ValueError):
+            t.extend([["b", 2], ["c", "not a number"]])
+        assert t.e1 == ("a",)
+        assert list(t.e2) == [1]
+
+    def test_extend_bad_row_raises(self):
+        t = Table(self.meta)
+        with self.assertRaises(ValueError):
+            t.extend([["a", 1], ["b"]])
+        assert t.e1 == ()
+
+    def test_validates_each_column_once(self):
+        self.meta.elements["e2"] = Mock(wraps=NumberArrayMeta("int32"))
+        t = Table(self.meta)
+        self.meta.elements["e2"].validate.reset_mock()
+        t.extend([["a", i] for i in range(100)])
+        assert self.meta.elements["e2"].validate.call_count == 1
+        assert list(t.e2) == list(range(100))
+
+    def test_append_joins_columns_once(self):
+        t = Table(self.meta)
+        with patch("malcolm.core.table._join_columns",
+                   wraps=_join_columns) as join:
+            for i in range(100):
+                t.append(["a%d" % i, i])
+            assert join.call_count == 0
+            assert t.e1[-1] == "a99"
+            assert list(t.e2) == list(range(100))
+            # One join per column
+            assert join.call_count == 2
+        assert t.e2.dtype == np.int32
+        assert t.to_dict()["e1"][:2] == ("a0", "a1")
+
+    def test_append_to_copy_leaves_original(self):
+        t = Table.from_rows(self.meta, [["a", 1]])
+        t.append(["b", 2])
+        for c in (copy.copy(t), copy.deepcopy(t)):
+            c.append(["c", 3])
+            assert list(c.e2) == [1, 2, 3]
+            assert t.e1 == ("a", "b")
+            assert list(t.e2) == [1, 2]
+            t.append(["d", 4])
+            assert c.e1 == ("a", "b", "c")
+            t.e1, t.e2 = ["a", "b"], [1, 2]
+
+    def test_append_read_from_threads(self):
+        t = Table(self.meta)
+        for i in range(1000):
+            t.append(["a%d" % i, i])
+        columns = []
+        threads = [threading.Thread(target=lambda: columns.append(t.e2))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert [len(column) for column in columns] == [1000] * 4
+        assert len(t.e1) == 1000
+
+    def test_append_bad_value_changes_nothing(self):
+        t = Table.from_rows(self.meta, [["a", 1]])
+        t.append(["b", 2])
+        with self.assertRaises(ValueError):
+            t.append(["c", "not a number"])
+        assert list(t.rows()) == [["a", 1], ["b", 2]]
+
+    def test_append_then_set_column(self):
+        t = Table.from_rows(self.meta, [["a", 1]])
+        t.append(["b", 2])
+        t.e1 = ["x", "y"]
+        assert t.e1 == ("x", "y")
+        assert list(t.e2) == [1, 2]
+
+    def test_slice(self):
+        t = Table.from_rows(self.meta, [["a", 1], ["b", 2], ["c", 3]])
+        s = t[1:]
+        assert s.e1 == ("b", "c")
+        assert list(s.e2) == [2, 3]
+        # Numeric columns are views of the original
+        assert s.e2.base is t.e2
+        assert s.meta is self.meta
+
+    def test_rows(self):
+        t = Table.from_rows(self.meta, [["a", 1], ["b", 2]])
+        assert list(t.rows()) == [["a", 1], ["b", 2]]
+
+    def test_setitem_doesnt_change_slices(self):
+        t = Table.from_rows(self.meta, [["a", 1], ["b", 2]])
+        s = t[:]
+        t[0] = ["x", 5]
+        assert list(t.e2) == [5, 2]
+        assert list(s.e2) == [1, 2]
+        assert t.e1 == ("x", "b")
+
+
+class TestTableRowChanges(unittest.TestCase):
+    def setUp(self):
+        self.meta = Mock()
+        self.meta.elements = OrderedDict()
+        self.meta.elements["e1"] = StringArrayMeta()
+        self.meta.elements["e2"] = NumberArrayMeta("int32")
+        self.old = Table.from_rows(
+            self.meta, [[str(i), i] for i in range(10)])
+
+    def rows(self, *rows):
+        return [[str(i), i] for i in rows]
+
+    def test_replace_one_column(self):
+        new = self.old[:]
+        new.e2 = [0, 1, 2, 33, 4, 5, 6, 7, 8, 9]
+        assert find_changed_rows(self.old, new) == (3, 4, 1, ["e2"])
+
+    def test_insert(self):
+        new = Table.from_rows(
+            self.meta, self.rows(0, 1, 2) + [["x", 99]] + self.rows(*range(3, 10)))
+        assert find_changed_rows(self.old, new) == (3, 3, 1, ["e1", "e2"])
+
+    def test_delete(self):
+        new = Table.from_rows(self.meta, self.rows(0, 1, 4, 5, 6, 7, 8, 9))
+        assert find_changed_rows(self.old, new) == (2, 4, 0, ["e1", "e2"])
+
+    def test_unchanged(self):
+        assert find_changed_rows(self.old, self.old[:]) == (10, 10, 0, [])
+
+    def test_mostly_changed_is_whole(self):
+        new = Table.from_rows(self.meta, self.rows(*range(20, 30)))
+        assert find_changed_rows(self.old, new) is None
+        assert find_changed_rows(None, new) is None
+
+    def test_splice_rows(self):
+        new = self.old.splice_rows(3, 5, dict(e1=["x"], e2=[99]))
+        assert new.e1 == ("0", "1", "2", "x", "5", "6", "7", "8", "9")
+        assert list(new.e2) == [0, 1, 2, 99, 5, 6, 7, 8, 9]
+        # Only some columns if the number of rows stays the same
+        new = self.old.splice_rows(3, 4, dict(e2=[99]))
+        assert new.e1 == self.old.e1
+        assert new.e2[3] == 99
+        with self.assertRaises(AssertionError):
+            self.old.splice_rows(3, 5, dict(e2=[99]))
+        # The original is left alone
+        assert list(self.old.e2) == list(range(10))
+
+    def test_roundtrip(self):
+        new = Table.from_rows(
+            self.meta, self.rows(0, 1) + [["x", 99]] + self.rows(*range(5, 10)))
+        start, stop, n, names = find_changed_rows(self.old, new)
+        columns = dict((name, new[name][start:start + n]) for name in names)
+        spliced = self.old.splice_rows(start, stop, columns)
+        assert spliced.e1 == new.e1
+        assert list(spliced.e2) == list(new.e2)
@@ -0,0 +1,64 @@
+import time
+import unittest
+
+from malcolm.core import Process, Queue, call_with_params
+from malcolm.core.spawnlane import BACKGROUND_LANE
+from malcolm.modules.builtin.blocks import diagnostics_block
+
+
+def busy(started, q):
+    started.put(None)
+    return q.get(timeout=1)
+
+
+class TestDiagnosticsController(unittest.TestCase):
+
+    def setUp(self):
+        self.p = Process("proc")
+        # Long period so only our calls to update() change the attributes
+        self.o = call_with_params(
+            diagnostics_block, self.p, mri="DIAG", period=100.0)
+        self.p.start()
+        self.b = self.p.block_view("DIAG")
+
+    def tearDown(self):
+        self.p.stop(timeout=1)
+
+    def update_until(self, predicate):
+        # Spawned functions are only counted as finished just after whoever
+        # is waiting for them is woken, so poll
+        for _ in range(100):
+            self.o.update()
+            if predicate():
+                return
+            time.sleep(0.01)
+        raise AssertionError("Timed out")
+
+    def test_lanes(self):
+        lanes = self.b.lanes.value
+        assert BACKGROUND_LANE in lanes.lane
+        i = list(lanes.lane).index(BACKGROUND_LANE)
+        assert lanes.threads[i] > 0
+        # Our own update loop is running but not reported as oldest
+        self.update_until(
+            lambda: self.b.lanes.value.running[i] == 1 and
+            self.b.oldestRunning.value == "")
+
+    def test_functions_and_oldest_running(self):
+        q = Queue()
+        started = Queue()
+        self.o.update()
+        self.p.spawn(busy, (started, q), {}, False)
+        started.get(timeout=1)
+        self.o.update()
+        assert self.b.spawnRate.value > 0
+        self.update_until(
+            lambda: self.b.oldestRunning.value == "background: busy")
+        assert self.b.oldestRunningTime.value >= 0
+        q.put(None)
+        self.update_until(lambda: "busy" in self.b.functions.value.function)
+        functions = self.b.functions.value
+        i = list(functions.function).index("busy")
+        assert functions.lane[i] == BACKGROUND_LANE
+        assert functions.count[i] == 1
+        assert functions.runP50[i] == functions.runP99[i]
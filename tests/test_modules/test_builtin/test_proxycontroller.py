@@ -1,8 +1,10 @@
+import time
 import unittest
 from mock import MagicMock
 
 from malcolm.modules.builtin.controllers import ProxyController
-from malcolm.core import Process, call_with_params
+from malcolm.core import Process, call_with_params, Post, Delta, Return, \
+    Queue
 
 
 class TestProxyController(unittest.TestCase):
@@ -18,3 +20,43 @@ class TestProxyController(unittest.TestCase):
         assert self.o.mri == "mri"
         assert self.o.params.comms == "comms"
         assert self.o.client_comms == self.comms
+
+    def subscribe_dict(self):
+        # Pretend we're already connected so init doesn't wait
+        self.o._first_response_queue.put(True)
+        self.o.init()
+        subscribe = self.comms.send_to_server.call_args[0][0]
+        return subscribe.to_dict()
+
+    def test_subscribe_plain_by_default(self):
+        d = self.subscribe_dict()
+        assert "fromRevision" not in d
+        assert "tableDeltas" not in d
+
+    def test_subscribe_opt_in(self):
+        self.o = call_with_params(ProxyController, self.process, (),
+                                  mri="mri", comms="comms", resync=True,
+                                  tableDeltas=True)
+        d = self.subscribe_dict()
+        assert d["fromRevision"] == 0
+        assert d["tableDeltas"] is True
+
+    def test_return_delivered_after_earlier_deltas(self):
+        self.process.start()
+        self.addCleanup(self.process.stop, timeout=1)
+        self.o._notify_response = False
+        order = Queue()
+
+        def slow_apply(response):
+            time.sleep(0.1)
+            order.put(response)
+
+        self.o._apply_response = slow_apply
+        self.o.handle_request(Post(1, ["mri", "zero"], callback=order.put))
+        forwarded = self.comms.send_to_server.call_args[0][0]
+        delta = Delta(5, [])
+        # A batch delivers the Delta a Post caused just before its Return
+        self.o.handle_response(delta)
+        forwarded.callback(Return(1))
+        assert order.get(timeout=1) is delta
+        assert order.get(timeout=1) == Return(1)
@@ -0,0 +1,119 @@
+import unittest
+import json
+import socket
+import time
+
+from mock import Mock
+from tornado.concurrent import Future
+from tornado.iostream import IOStream, StreamClosedError
+from tornado import gen
+
+from malcolm.core import Process, call_with_params, Queue
+from malcolm.modules.demo.blocks import hello_block, counter_block
+from malcolm.modules.web.blocks import web_server_block
+from malcolm.modules.web.parts.eventstreamserverpart import \
+    EventStreamHandler
+
+
+class TestSystemEventStream(unittest.TestCase):
+    socket = 8889
+
+    def setUp(self):
+        self.process = Process("proc")
+        self.hello = call_with_params(hello_block, self.process, mri="hello")
+        self.counter = call_with_params(
+            counter_block, self.process, mri="counter")
+        self.server = call_with_params(
+            web_server_block, self.process, mri="server", port=self.socket)
+        self.result = Queue()
+        self.process.start()
+
+    def tearDown(self):
+        self.process.stop(timeout=1)
+
+    @gen.coroutine
+    def stream(self, query, n_events, then=None, headers=""):
+        stream = IOStream(socket.socket())
+        yield stream.connect(("localhost", self.socket))
+        yield stream.write(
+            ("GET /events?%s HTTP/1.1\r\nHost: localhost\r\n%s\r\n" %
+             (query, headers)).encode())
+        header = yield stream.read_until(b"\r\n\r\n")
+        self.result.put(header.decode())
+        for i in range(n_events):
+            if i == 2 and then:
+                then()
+            # Chunked encoding, so skip the chunk lengths
+            event = b""
+            while not event.endswith(b"\n\n"):
+                yield stream.read_until(b"\r\n")
+                event += yield stream.read_until(b"\r\n")
+                event = event[:-2]
+            lines = event.decode().splitlines()
+            assert lines[0].startswith("event: "), lines
+            assert lines[1].startswith("data: "), lines
+            self.result.put((lines[0][7:], json.loads(lines[1][6:])))
+        stream.close()
+
+    def get_events(self, query, n_events, then=None, headers=""):
+        self.server._loop.add_callback(
+            self.stream, query, n_events, then, headers)
+        header = self.result.get(timeout=2)
+        assert "Content-Type: text/event-stream" in header
+        # Compressing would hold back events until the compressor had more
+        assert "Content-Encoding" not in header
+        return [self.result.get(timeout=2) for _ in range(n_events)]
+
+    def test_updates(self):
+        events = self.get_events(
+            "path=counter/counter/value&path=hello/health/value", 3,
+            then=lambda: self.process.spawn(
+                self.process.block_view("counter").increment, (), {}, False))
+        assert sorted(e[1]["id"] for e in events[:2]) == [0, 1]
+        by_id = dict((e[1]["id"], e) for e in events[:2])
+        assert by_id[0] == ("Update", dict(
+            typeid="malcolm:core/Update:1.0", id=0, value=0))
+        assert by_id[1][1]["value"] == "OK"
+        assert events[2] == ("Update", dict(
+            typeid="malcolm:core/Update:1.0", id=0, value=1))
+
+    def test_deltas_and_errors(self):
+        events = self.get_events("path=counter/counter&path=bad&delta=1", 2)
+        by_id = dict((e[1]["id"], e) for e in events)
+        assert by_id[0][0] == "Delta"
+        assert by_id[0][1]["changes"][0][1]["value"] == 0
+        assert by_id[1][0] == "Error"
+
+    def test_not_gzipped(self):
+        events = self.get_events(
+            "path=counter/counter/value", 1,
+            headers="Accept-Encoding: gzip\r\n")
+        assert events[0][1]["value"] == 0
+
+    def test_unsubscribed_when_client_goes(self):
+        self.get_events("path=counter/counter/value", 1)
+        notifier = self.counter._notifier
+        for _ in range(20):
+            if not notifier._subscription_keys:
+                break
+            time.sleep(0.1)
+        assert not notifier._subscription_keys
+
+
+class TestEventStreamHandler(unittest.TestCase):
+
+    def test_keepalive_to_closed_stream_unsubscribes(self):
+        o = EventStreamHandler.__new__(EventStreamHandler)
+        o._server_part = Mock()
+        o._loop = Mock()
+        request = Mock()
+        o._subscribes = [request]
+        o.write = Mock()
+        closed = Future()
+        closed.set_exception(StreamClosedError())
+        o.flush = Mock(return_value=closed)
+        o._send_keepalive()
+        o._server_part.on_unsubscribe.assert_called_once_with(request)
+        assert o._subscribes is None
+        # And no more keepalives are scheduled
+        o._loop.call_later.assert_not_called()
@@ -0,0 +1,80 @@
+import unittest
+import json
+
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest, HTTPError
+from tornado import gen
+
+from malcolm.compat import OrderedDict
+from malcolm.core import Process, call_with_params, Queue
+from malcolm.modules.demo.blocks import hello_block, counter_block
+from malcolm.modules.web.blocks import web_server_block
+
+
+class TestSystemRest(unittest.TestCase):
+    socket = 8887
+
+    def setUp(self):
+        self.process = Process("proc")
+        self.hello = call_with_params(hello_block, self.process, mri="hello")
+        self.counter = call_with_params(
+            counter_block, self.process, mri="counter")
+        self.server = call_with_params(
+            web_server_block, self.process, mri="server", port=self.socket)
+        self.result = Queue()
+        self.process.start()
+
+    def tearDown(self):
+        self.process.stop(timeout=1)
+
+    @gen.coroutine
+    def get(self, endpoint, **kwargs):
+        client = AsyncHTTPClient(self.server._loop)
+        request = HTTPRequest(
+            "http://localhost:%s/rest/%s" % (self.socket, endpoint), **kwargs)
+        try:
+            response = yield client.fetch(request)
+        except HTTPError as e:
+            response = e.response
+        self.result.put(response)
+
+    def do_get(self, endpoint, **kwargs):
+        self.server._loop.add_callback(self.get, endpoint, **kwargs)
+        return self.result.get(timeout=2)
+
+    def test_get(self):
+        response = self.do_get("counter/counter/value")
+        assert response.code == 200
+        assert json.loads(response.body.decode()) == 0
+
+    def test_bulk_get(self):
+        response = self.do_get(
+            "?path=counter/counter/value&path=hello/health/value"
+            "&path=counter/nothing")
+        assert response.code == 200
+        d = json.loads(response.body.decode(), object_pairs_hook=OrderedDict)
+        assert list(d) == [
+            "counter/counter/value", "hello/health/value", "counter/nothing"]
+        assert d["counter/counter/value"] == 0
+        assert d["hello/health/value"] == "OK"
+        assert d["counter/nothing"]["typeid"] == "malcolm:core/Error:1.0"
+
+    def test_not_modified(self):
+        response = self.do_get("counter/counter/value")
+        etag = response.headers["Etag"]
+        # Nothing changed, so not sent again
+        response = self.do_get("counter/counter/value",
+                               headers={"If-None-Match": etag})
+        assert response.code == 304
+        # Something changed, so sent again
+        self.process.block_view("counter").increment()
+        response = self.do_get("counter/counter/value",
+                               headers={"If-None-Match": etag})
+        assert response.code == 200
+        assert json.loads(response.body.decode()) == 1
+        assert response.headers["Etag"] != etag
+
+    def test_gzip(self):
+        response = self.do_get("counter", decompress_response=False,
+                               headers={"Accept-Encoding": "gzip"})
+        assert response.code == 200
+        assert response.headers["Content-Encoding"] == "gzip"
@@ -54,6 +54,35 @@ class TestSystemWSCommsServerOnly(unittest.TestCase):
             )
         )
 
+    @gen.coroutine
+    def send_batched_messages(self):
+        conn = yield websocket_connect(
+            "ws://localhost:%s/ws?batch=1" % self.socket)
+        for i in range(3):
+            req = dict(
+                typeid="malcolm:core/Post:1.0",
+                id=i,
+                path=["hello", "greet"],
+                parameters=dict(name="me%d" % i)
+            )
+            conn.write_message(json.dumps(req))
+        responses = []
+        while len(responses) < 3:
+            resp = yield conn.read_message()
+            resp = json.loads(resp)
+            # Every frame is a batch, however many are in it
+            assert isinstance(resp, list), resp
+            responses += resp
+        self.result.put(responses)
+        conn.close()
+
+    def test_server_batches(self):
+        self.server._loop.add_callback(self.send_batched_messages)
+        responses = self.result.get(timeout=2)
+        assert sorted(r["id"] for r in responses) == [0, 1, 2]
+        assert sorted(r["value"]["greeting"] for r in responses) == [
+            "Hello me0", "Hello me1", "Hello me2"]
+
 
 class TestSystemWSCommsServerAndClient(unittest.TestCase):
     socket = 8883
@@ -64,7 +93,8 @@ class TestSystemWSCommsServerAndClient(unittest.TestCase):
         self.counter = call_with_params(
             counter_block, self.process, mri="counter")
         self.server = call_with_params(
-            web_server_block, self.process, mri="server", port=self.socket)
+            web_server_block, self.process, mri="server", port=self.socket,
+            compressionLevel=6)
         self.process.start()
         self.process2 = Process("proc2")
         self.client = call_with_params(
@@ -97,3 +127,48 @@ class TestSystemWSCommsServerAndClient(unittest.TestCase):
         assert block2.counter.value == 0
         assert self.client.remote_blocks.value == (
             "hello", "counter", "server")
+
+    def test_compression(self):
+        call_with_params(
+            proxy_block, self.process2, mri="hello", comms="client")
+        part = self.server.parts["ws"]
+        part.update_compression(force=True)
+        table = part.compression.value
+        # The Block structure is repetitive enough to compress well
+        assert table.messageBytes[-1] > table.wireBytes[-1] > 0
+        assert table.ratio[-1] > 1.5
+        assert table.cpuTime[-1] > 0
+
+    def greet_round_trip(self):
+        # After this the server has definitely opened our handler, and any
+        # from earlier clients were registered before it
+        call_with_params(
+            proxy_block, self.process2, mri="hello", comms="client")
+        block2 = self.process2.block_view("hello")
+        assert block2.greet("me2") == dict(greeting="Hello me2")
+        return list(self.server.parts["ws"]._handlers)[-1]
+
+    def test_binary_negotiated(self):
+        assert self.client._binary
+        handler = self.greet_round_trip()
+        # Binary frames can't be batched
+        assert not handler.batch
+
+
+class TestSystemWSCommsJSONClient(TestSystemWSCommsServerAndClient):
+    socket = 8885
+
+    def setUp(self):
+        super(TestSystemWSCommsJSONClient, self).setUp()
+        self.process2.stop(timeout=1)
+        self.process2 = Process("proc2")
+        self.client = call_with_params(
+            websocket_client_block, self.process2, mri="client",
+            port=self.socket, binary=False)
+        self.process2.start()
+
+    def test_binary_negotiated(self):
+        assert not self.client._binary
+        handler = self.greet_round_trip()
+        # So the server batches our responses
+        assert handler.batch
@@ -1,6 +1,9 @@
 import unittest
+from mock import Mock, patch
 
 from malcolm.modules.web.controllers import WebsocketClientComms
+from malcolm.modules.web.controllers.websocketclientcomms import \
+    compression_options, compression_threshold, private_protocol_attr
 from malcolm.core import Process, call_with_params
 
 
@@ -15,4 +18,39 @@ class TestWebsocketClientComms(unittest.TestCase):
         assert self.o.params.hostname == "localhost"
         assert self.o.params.port == 8080
         assert self.o.params.connectTimeout == 5.0
+        assert self.o.params.batch is True
         assert self.o.mri == "mri"
+
+
+class TestCompression(unittest.TestCase):
+
+    def test_compression_options(self):
+        assert compression_options(0) is None
+        assert compression_options(9) == dict(compression_level=9)
+
+    def test_short_message_not_compressed(self):
+        protocol = Mock()
+        compressor = protocol._compressor
+        with compression_threshold(protocol, "x" * 10, 20):
+            assert protocol._compressor is None
+        assert protocol._compressor is compressor
+
+    def test_long_message_compressed(self):
+        protocol = Mock()
+        compressor = protocol._compressor
+        with compression_threshold(protocol, "x" * 20, 20):
+            assert protocol._compressor is compressor
+
+    def test_protocol_without_compressor(self):
+        protocol = object()
+        assert private_protocol_attr(protocol, "_compressor") is None
+        with compression_threshold(protocol, "x" * 10, 20):
+            pass
+
+    @patch("tornado.version_info", (7, 0, 0, 0))
+    def test_unknown_tornado_version_not_touched(self):
+        protocol = Mock()
+        compressor = protocol._compressor
+        assert private_protocol_attr(protocol, "_compressor") is None
+        with compression_threshold(protocol, "x" * 10, 20):
+            assert protocol._compressor is compressor
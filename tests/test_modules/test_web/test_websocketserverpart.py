@@ -0,0 +1,187 @@
+import unittest
+from mock import Mock, patch, call
+
+from tornado.concurrent import Future
+
+from malcolm.core import call_with_params, Subscribe, Unsubscribe, Update, \
+    Delta, Return, Error, Queue, TimeoutError, OutboundQueue
+from malcolm.modules.web.parts import WebsocketServerPart
+
+
+class TestWebsocketServerPart(unittest.TestCase):
+
+    def setUp(self):
+        self.o = call_with_params(WebsocketServerPart)
+        self.o.process = Mock()
+        self.controller = self.o.process.get_controller.return_value
+        self.client1 = Queue()
+        self.client2 = Queue()
+
+    def subscribe(self, client, id, path, **kwargs):
+        request = Subscribe(id=id, path=path, callback=client.put, **kwargs)
+        self.o.on_request(request)
+        return request
+
+    def unsubscribe(self, client, id):
+        self.o.on_request(Unsubscribe(id=id, callback=client.put))
+
+    def upstream(self):
+        assert self.controller.handle_request.call_count == 1
+        return self.controller.handle_request.call_args[0][0]
+
+    def test_compression_off_by_default(self):
+        assert self.o.params.compressionLevel == 0
+
+    def test_one_upstream_for_same_path(self):
+        self.subscribe(self.client1, 3, ["b", "attr", "value"])
+        self.subscribe(self.client2, 5, ["b", "attr", "value"])
+        upstream = self.upstream()
+        assert upstream.path == ["b", "attr", "value"]
+        upstream.callback(Update(upstream.id, 42))
+        r1 = self.client1.get(timeout=0)
+        r2 = self.client2.get(timeout=0)
+        assert (r1.id, r1.value) == (3, 42)
+        assert (r2.id, r2.value) == (5, 42)
+        # So the value is only encoded once
+        assert r1.encoded_payload is r2.encoded_payload
+        # A late client gets the latest value straight away
+        self.subscribe(self.client1, 4, ["b", "attr", "value"])
+        r = self.client1.get(timeout=0)
+        assert (r.id, r.value) == (4, 42)
+        assert self.controller.handle_request.call_count == 1
+
+    def test_different_options_not_shared(self):
+        self.subscribe(self.client1, 3, ["b", "attr", "value"])
+        self.subscribe(self.client2, 5, ["b", "attr", "value"], delta=True)
+        self.subscribe(self.client2, 6, ["b", "attr", "value"],
+                       predicate=dict(equals=2))
+        assert self.controller.handle_request.call_count == 3
+        last = self.controller.handle_request.call_args[0][0]
+        # Predicate Subscribes go upstream as they are
+        assert last.id == 6 and last.callback == self.client2.put
+
+    def test_late_delta_client_gets_whole_value(self):
+        self.subscribe(self.client1, 3, ["b"], delta=True)
+        upstream = self.upstream()
+        value = dict(attr=dict(value=1), other=dict(value=2))
+        upstream.callback(Delta(upstream.id, [[[], value]]))
+        upstream.callback(Delta(upstream.id, [[["attr", "value"], 3]]))
+        upstream.callback(Delta(upstream.id, [[["other"]]]))
+        self.subscribe(self.client2, 5, ["b"], delta=True)
+        r = self.client2.get(timeout=0)
+        assert r.id == 5
+        assert r.changes == [[[], dict(attr=dict(value=3))]]
+        # The value the Notifier sent wasn't changed
+        assert value == dict(attr=dict(value=1), other=dict(value=2))
+
+    def test_late_delta_client_gets_spliced_table(self):
+        self.subscribe(self.client1, 3, ["b", "t", "value"], delta=True,
+                       tableDeltas=True)
+        upstream = self.upstream()
+        assert upstream.tableDeltas
+        value = dict(a=[1, 2, 3])
+        upstream.callback(Delta(upstream.id, [[[], value]]))
+        upstream.callback(Delta(upstream.id, [[[], dict(a=[5]), [1, 2]]]))
+        self.subscribe(self.client2, 5, ["b", "t", "value"], delta=True,
+                       tableDeltas=True)
+        assert self.client2.get(timeout=0).changes == [[[], dict(a=[1, 5, 3])]]
+        assert value == dict(a=[1, 2, 3])
+
+    def test_upstream_unsubscribed_by_last_client(self):
+        self.subscribe(self.client1, 3, ["b", "attr", "value"])
+        self.subscribe(self.client2, 5, ["b", "attr", "value"])
+        upstream = self.upstream()
+        self.unsubscribe(self.client1, 3)
+        r = self.client1.get(timeout=0)
+        assert isinstance(r, Return) and r.id == 3
+        assert self.controller.handle_request.call_count == 1
+        self.unsubscribe(self.client2, 5)
+        r = self.client2.get(timeout=0)
+        assert isinstance(r, Return) and r.id == 5
+        unsubscribe = self.controller.handle_request.call_args[0][0]
+        assert isinstance(unsubscribe, Unsubscribe)
+        assert unsubscribe.generate_key() == upstream.generate_key()
+        # Upstream's Return goes nowhere
+        upstream.callback(Return(upstream.id))
+        with self.assertRaises(TimeoutError):
+            self.client2.get(timeout=0)
+
+    def test_upstream_error_ends_clients(self):
+        self.subscribe(self.client1, 3, ["b", "bad"])
+        self.subscribe(self.client2, 5, ["b", "bad"])
+        upstream = self.upstream()
+        upstream.callback(Error(upstream.id, "Bad path"))
+        r1 = self.client1.get(timeout=0)
+        r2 = self.client2.get(timeout=0)
+        assert (type(r1), r1.id, r1.message) == (Error, 3, "Bad path")
+        assert (type(r2), r2.id, r2.message) == (Error, 5, "Bad path")
+        # Unsubscribing now does nothing
+        self.unsubscribe(self.client1, 3)
+        assert self.controller.handle_request.call_count == 1
+        # And a new Subscribe makes a new upstream
+        self.subscribe(self.client1, 4, ["b", "bad"])
+        assert self.controller.handle_request.call_count == 2
+
+    def test_missing_block_errors_every_client(self):
+        self.o.process.get_controller.side_effect = ValueError(
+            "No controller registered for mri 'missing'")
+        self.subscribe(self.client1, 3, ["missing", "attr"])
+        self.subscribe(self.client2, 5, ["missing", "attr"])
+        for client, id in ((self.client1, 3), (self.client2, 5)):
+            r = client.get(timeout=0)
+            assert (type(r), r.id) == (Error, id)
+            assert r.message == \
+                "ValueError: No controller registered for mri 'missing'"
+        assert self.o._shared == {}
+        assert self.o._subscription_keys == {}
+        # Once the Block exists, subscribing works
+        self.o.process.get_controller.side_effect = None
+        self.subscribe(self.client1, 4, ["missing", "attr"])
+        upstream = self.upstream()
+        upstream.callback(Update(upstream.id, 42))
+        r = self.client1.get(timeout=0)
+        assert (r.id, r.value) == (4, 42)
+
+    def test_published_shared(self):
+        self.o.publish(None, ["a"])
+        self.subscribe(self.client1, 3, [".", "blocks"])
+        self.subscribe(self.client2, 5, [".", "blocks"])
+        assert self.client1.get(timeout=0).value == ["a"]
+        assert self.client2.get(timeout=0).value == ["a"]
+        self.o.publish(None, ["a", "b"])
+        r1 = self.client1.get(timeout=0)
+        r2 = self.client2.get(timeout=0)
+        assert (r1.id, r1.value) == (3, ["a", "b"])
+        assert (r2.id, r2.value) == (5, ["a", "b"])
+        assert r1.encoded_payload is r2.encoded_payload
+        self.unsubscribe(self.client1, 3)
+        assert isinstance(self.client1.get(timeout=0), Return)
+        self.controller.handle_request.assert_not_called()
+
+    def batch(self, *responses):
+        handler = Mock()
+        written = Future()
+        written.set_result(None)
+        handler.write_message.return_value = written
+        queue = OutboundQueue(Mock())
+        self.o._handlers[handler] = queue
+        for response in responses[1:]:
+            queue.put(response)
+        slept = Future()
+        slept.set_result(None)
+        with patch("tornado.gen.sleep", return_value=slept) as sleep:
+            assert self.o.on_batch(responses[0], handler).result() is None
+        return handler.write_message.call_args_list, sleep.call_count
+
+    def test_lone_batch_not_delayed(self):
+        response = Return(1, 2)
+        calls, sleeps = self.batch(response)
+        assert sleeps == 0
+        assert calls == [call("[%s]" % response.to_json())]
+
+    def test_busy_batch_waits_for_more(self):
+        responses = [Return(1, 2), Return(2, 3)]
+        calls, sleeps = self.batch(*responses)
+        assert sleeps == 1
+        assert calls == [call("[%s]" % ",".join(
+            r.to_json() for r in responses))]